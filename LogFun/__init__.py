@@ -1,2 +1,9 @@
-from .core.logFun import traced, basicConfig, gzip_file
-from .manager import LogManager
+from .core.logFun import traced, basicConfig, stats, gzip_file
+
+
+def __getattr__(name):
+    # Loaded on first use, see LogFun/manager/__init__.py
+    if name == "LogManager":
+        from .manager.core import LogManager
+        return LogManager
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
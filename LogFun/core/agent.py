@@ -6,6 +6,8 @@ import time
 import json  # [FIX] Added for JSON parsing
 from .config import get_config, LogMode
 from .net import get_network_client
+from .stats import get_agent_stats
+from .registry import get_registry
 
 
 class AgentCore:
@@ -28,6 +30,7 @@ class AgentCore:
         self._running = False
         self._worker_thread = None
         self.net_client = get_network_client()
+        self.stats = get_agent_stats()
 
         self.start()
         atexit.register(self.stop)
@@ -58,7 +61,15 @@ class AgentCore:
         """
         Queue log for processing.
         """
-        self._queue.put((payload, log_type))
+        self._queue.put((payload, log_type, time.time()))
+
+    def get_stats(self):
+        """
+        Snapshot of the agent's own overhead counters.
+        """
+        snap = self.stats.snapshot(queue_depth=self._queue.qsize())
+        snap["dormant"] = get_registry().get_dormant_stats()
+        return snap
 
     def _worker_loop(self):
         log_file = None
@@ -67,15 +78,17 @@ class AgentCore:
         # Batching settings
         batch_buffer = []
         current_batch_type = None
+        batch_enqueued_at = None
 
         BATCH_SIZE = 100
         FLUSH_INTERVAL = 0.5
         last_flush_time = time.time()
 
-        def process_batch(batch, batch_type):
+        def process_batch(batch, batch_type, enqueued_at=None):
             nonlocal log_file, current_file_path
             if not batch: return
 
+            flush_start = time.perf_counter()
             try:
                 target_mode = self.config.mode
 
@@ -103,10 +116,11 @@ class AgentCore:
                     type_to_send = batch_type if batch_type else "compress"
                     str_batch = [str(item) for item in batch]
 
-                    sent_success = self.net_client.send_log(str_batch, log_type=type_to_send)
+                    sent_success = self.net_client.send_log(str_batch, log_type=type_to_send, enqueued_at=enqueued_at)
 
                     if not sent_success:
                         # Fallback to local file
+                        self.stats.record_fallback(len(batch))
                         if not log_file or self.config.log_file_path != current_file_path:
                             if log_file: log_file.close()
                             current_file_path = self.config.log_file_path
@@ -121,21 +135,29 @@ class AgentCore:
 
             except Exception as e:
                 sys.stderr.write(f"[LogFun] Worker Error: {e}\n")
+            finally:
+                self.stats.record_flush(len(batch), time.perf_counter() - flush_start)
 
         while self._running or not self._queue.empty() or batch_buffer:
             try:
                 item = self._queue.get(timeout=0.1)
+                self.stats.record_queue_depth(self._queue.qsize() + 1)
 
-                if isinstance(item, tuple) and len(item) == 2:
+                enqueued_at = None
+                if isinstance(item, tuple) and len(item) == 3:
+                    payload, msg_type, enqueued_at = item
+                elif isinstance(item, tuple) and len(item) == 2:
                     payload, msg_type = item
                 else:
                     payload, msg_type = item, "compress"
 
                 if current_batch_type is not None and msg_type != current_batch_type:
-                    process_batch(batch_buffer, current_batch_type)
+                    process_batch(batch_buffer, current_batch_type, batch_enqueued_at)
                     batch_buffer = []
 
                 current_batch_type = msg_type
+                # The oldest record of a batch defines its delivery latency
+                if not batch_buffer: batch_enqueued_at = enqueued_at
                 batch_buffer.append(payload)
                 self._queue.task_done()
 
@@ -147,7 +169,7 @@ class AgentCore:
             is_stopping = (not self._running and self._queue.empty())
 
             if batch_buffer and (is_full or is_timeout or is_stopping):
-                process_batch(batch_buffer, current_batch_type)
+                process_batch(batch_buffer, current_batch_type, batch_enqueued_at)
                 batch_buffer = []
                 last_flush_time = time.time()
 
@@ -37,6 +37,9 @@ class AgentConfig:
 
         self._manager_ip = "127.0.0.1"
         self._manager_port = 9999
+        # Adaptive tracing: after this many consecutive calls without a log
+        # entry a traced function drops to a counting pass-through (0 = off).
+        self._adaptive_after = 0
         self._lock = threading.RLock()
 
         if not os.path.exists(self._output_dir):
@@ -101,6 +104,11 @@ class AgentConfig:
         with self._lock:
             return self._app_name
 
+    @property
+    def adaptive_after(self):
+        with self._lock:
+            return self._adaptive_after
+
     @property
     def manager_address(self):
         with self._lock:
@@ -121,6 +129,9 @@ class AgentConfig:
             elif k == 'manager_port':
                 with self._lock:
                     self._manager_port = int(v)
+            elif k == 'adaptive_after':
+                with self._lock:
+                    self._adaptive_after = max(0, int(v or 0))
 
 
 _global_config = AgentConfig()
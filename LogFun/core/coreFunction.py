@@ -4,13 +4,14 @@ import contextvars
 import os
 import json
 from functools import wraps
-from inspect import isgenerator
+from inspect import isgenerator, isgeneratorfunction, iscoroutinefunction, isasyncgenfunction
 from .config import get_config, LogType
 from .agent import get_agent
 from .registry import get_registry
 from .logger import CURRENT_LOG_BUFFER
 from .context import CURRENT_FUNC_ID
 from .controller import get_controller
+from .stats import get_agent_stats, OVERHEAD_SAMPLE_MASK
 
 
 def make_trace_function(function, logger):
@@ -18,6 +19,10 @@ def make_trace_function(function, logger):
 
     @wraps(function)
     def autologging_traced_function_ghost(*args, **keywords):
+        if ghost.dormant:
+            # Adaptive pass-through: no context, no buffer, no clock reads
+            ghost.dormant_calls += 1
+            return function(*args, **keywords)
         return ghost(function, args, keywords)
 
     if not hasattr(autologging_traced_function_ghost, "__wrapped__"):
@@ -33,6 +38,8 @@ class FunctionTracingGhost(object):
         self.agent = get_agent()
         self.registry = get_registry()
         self.controller = get_controller()
+        self.stats = get_agent_stats()
+        self._calls = 0
 
         try:
             filename = os.path.abspath(function.__code__.co_filename)
@@ -43,7 +50,45 @@ class FunctionTracingGhost(object):
         # Cache ID for performance
         self.cached_func_id = self.registry.get_func_id(self.unique_func_key)
 
+        # Adaptive tracing state (see basicConfig(adaptive_after=N))
+        # Generator and async bodies run after the wrapper returns, so their calls always look idle
+        self.adaptive = not (isgeneratorfunction(function) or iscoroutinefunction(function) or isasyncgenfunction(function))
+        self.dormant = False
+        self.idle_calls = 0
+        self.dormant_calls = 0
+        # Loggers recognise logs from pass-through calls by this code object
+        self.code = getattr(function, "__code__", None)
+        self.waking = False
+
     def __call__(self, function, args, keywords):
+        if self.waking: self._traced_again()
+        self._calls += 1
+        if not self._calls & OVERHEAD_SAMPLE_MASK:
+            return self._call_sampled(function, args, keywords)
+        return self._dispatch(function, args, keywords)
+
+    def _call_sampled(self, function, args, keywords):
+        """
+        Same as _dispatch, but reports the time spent outside the traced body.
+        """
+        body_time = 0.0
+
+        @wraps(function)
+        def timed_function(*a, **k):
+            nonlocal body_time
+            t = time.perf_counter()
+            try:
+                return function(*a, **k)
+            finally:
+                body_time = time.perf_counter() - t
+
+        start = time.perf_counter()
+        try:
+            return self._dispatch(timed_function, args, keywords)
+        finally:
+            self.stats.record_overhead(time.perf_counter() - start - body_time)
+
+    def _dispatch(self, function, args, keywords):
         func_id = self.cached_func_id
         # Set context first to allow internal logging control even if muted
         token_fid = CURRENT_FUNC_ID.set(func_id)
@@ -86,11 +131,40 @@ class FunctionTracingGhost(object):
             buffer = CURRENT_LOG_BUFFER.get()
             CURRENT_LOG_BUFFER.reset(token_buf)
             duration = (time.time() - start_time) * 1000
-            self._flush_compressed_log(start_time, duration, buffer, func_id)
+            if buffer:
+                self.idle_calls = 0
+                self._flush_compressed_log(start_time, duration, buffer, func_id)
+            elif self.adaptive:
+                self.idle_calls += 1
+                threshold = self.config.adaptive_after
+                if threshold and self.idle_calls >= threshold:
+                    self._go_dormant()
         if isgenerator(value):
             return GeneratorIteratorTracingProxy(function, value, self.logger)
         return value
 
+    def _go_dormant(self):
+        if self.registry.is_watched(self.cached_func_id):
+            self.idle_calls = 0
+            return
+        self.dormant = True
+        self.registry.register_dormant(self)
+
+    def rearm(self):
+        """
+        Leave the adaptive pass-through and trace every call again.
+        """
+        if not self.dormant: return
+        self.idle_calls = 0
+        self.dormant = False
+        self.waking = True
+        self.registry.unregister_dormant(self)
+
+    def _traced_again(self):
+        # First traced call after re-arming: its logs carry context again
+        self.waking = False
+        self.registry.forget_dormant_code(self)
+
     def _flush_compressed_log(self, start_time, duration, buffer, func_id):
         if not buffer: return
 
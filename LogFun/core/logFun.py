@@ -29,7 +29,12 @@ def traced(*args, **keywords):
 def basicConfig(**keywords):
     """
     Configure Global Settings.
-    Supported keys: mode, logtype, output, app_name, manager_ip, manager_port
+    Supported keys: mode, logtype, output, app_name, manager_ip, manager_port, adaptive_after
+
+    adaptive_after=N lets a traced function that has made N consecutive calls
+    without emitting a log entry fall back to a counting pass-through. It is
+    re-armed when it logs again or when the Manager watches it. Generator
+    and async functions are always traced.
     """
     config = get_config()
 
@@ -42,7 +47,7 @@ def basicConfig(**keywords):
 
     # Batch update for other props including network config
     update_kwargs = {}
-    for k in ["app_name", "manager_ip", "manager_port"]:
+    for k in ["app_name", "manager_ip", "manager_port", "adaptive_after"]:
         if k in keywords:
             update_kwargs[k] = keywords.get(k)
 
@@ -50,5 +55,14 @@ def basicConfig(**keywords):
         config.update(**update_kwargs)
 
 
+def stats():
+    """
+    Returns LogFun's own overhead counters: sampled wrapper overhead, queue
+    depth, batch/flush timings, network send latency and fallback events.
+    """
+    from .agent import get_agent
+    return get_agent().get_stats()
+
+
 def gzip_file(filename):
     pass
@@ -1,3 +1,4 @@
+import sys
 import logging
 import contextvars
 import time
@@ -20,9 +21,37 @@ class Logger:
         self.config = get_config()
         self.controller = get_controller()
 
-    def _log(self, level, msg, args=None):
+    def _untraced_owner(self):
+        """
+        Ghost of a dormant (or just re-armed) function this log comes from.
+        Its pass-through calls set no context, so look at the calling code:
+        _log <- info/error/... <- [__call__] <- the function.
+        """
+        codes = self.registry.dormant_code
+        try:
+            f = sys._getframe(3)
+        except ValueError:
+            return None
+        for _ in range(2):
+            if f is None: return None
+            ghost = codes.get(f.f_code)
+            if ghost is not None: return ghost
+            f = f.f_back
+        return None
+
+    def _log(self, level, msg, args=None, func_id=None):
         current_type = self.config.log_type
-        func_id = CURRENT_FUNC_ID.get()
+        buffer = CURRENT_LOG_BUFFER.get()
+
+        if func_id is None:
+            func_id = CURRENT_FUNC_ID.get()
+            if self.registry.dormant_code:
+                ghost = self._untraced_owner()
+                if ghost is not None:
+                    # Re-arm it; this call is not traced, so the log goes out
+                    # under its own id, not into the caller's buffer
+                    if ghost.dormant: ghost.rearm()
+                    func_id, buffer = ghost.cached_func_id, None
 
         tpl_id = self.registry.get_tpl_id(func_id, msg)
 
@@ -60,7 +89,6 @@ class Logger:
 
         # Compress Mode
         elif current_type == LogType.COMPRESS:
-            buffer = CURRENT_LOG_BUFFER.get()
             if buffer is not None:
                 stored_args = args
                 if args and len(args) == 1 and isinstance(args[0], tuple):
@@ -71,7 +99,7 @@ class Logger:
                 # Fallback for outside trace
                 orig = self.config.log_type
                 self.config.log_type = LogType.NORMAL
-                self._log(level, f"{msg} (Outside Trace)", args)
+                self._log(level, f"{msg} (Outside Trace)", args, func_id)
                 self.config.log_type = orig
 
     def info(self, msg, *args):
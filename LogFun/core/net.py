@@ -4,9 +4,11 @@ import json
 import threading
 import time
 import queue
+import collections
 from .config import get_config
 from .registry import get_registry
 from .controller import get_controller
+from .stats import get_agent_stats
 
 PROTO_VERSION = 1
 TYPE_HANDSHAKE = 1
@@ -18,6 +20,7 @@ PACKET_HEAD = struct.Struct('!BBI')
 class LogNetworkClient:
     def __init__(self):
         self.config = get_config()
+        self.stats = get_agent_stats()
         self.sock = None
         self.connected = False
         self.lock = threading.Lock()
@@ -27,6 +30,12 @@ class LogNetworkClient:
         # Async Send Queue for performance
         self.log_queue = queue.Queue(maxsize=50000)
 
+        # Clock offset to the manager (manager_clock - local_clock), estimated
+        # NTP-style from heartbeat round trips; the lowest-RTT sample wins.
+        self.clock_samples = collections.deque(maxlen=8)
+        self.clock_offset = None
+        self.clock_rtt = None
+
     def connect(self):
         if self.connected: return True
         try:
@@ -34,6 +43,7 @@ class LogNetworkClient:
             self.sock.settimeout(5.0)
             self.sock.connect(self.config.manager_address)
             self.connected = True
+            self.stats.record_connect(True)
 
             if not self.threads_started and threading.current_thread() is not threading.main_thread():
                 self.start_threads()
@@ -42,6 +52,7 @@ class LogNetworkClient:
             return True
         except Exception:
             self.connected = False
+            self.stats.record_connect(False)
             return False
 
     def start_threads(self):
@@ -62,7 +73,7 @@ class LogNetworkClient:
                 pass
             self.sock = None
 
-    def send_log(self, payload_data, log_type="compress"):
+    def send_log(self, payload_data, log_type="compress", enqueued_at=None):
         """
         Non-blocking send. Pushes to queue.
         Returns True if queued successfully, False if connection failed or queue full.
@@ -78,7 +89,9 @@ class LogNetworkClient:
 
         try:
             # Non-blocking put
-            self.log_queue.put_nowait({"log": payload_data, "type": log_type})
+            item = {"log": payload_data, "type": log_type}
+            if enqueued_at is not None: item["enq"] = enqueued_at
+            self.log_queue.put_nowait(item)
             return True
         except queue.Full:
             return False
@@ -96,16 +109,18 @@ class LogNetworkClient:
 
             try:
                 item = self.log_queue.get(timeout=0.2)
+                item["sent"] = time.time()
                 self._send_packet(TYPE_LOG_DATA, item)
                 self.log_queue.task_done()
             except queue.Empty:
                 pass
             except Exception:
+                self.stats.record_send_error()
                 self.connected = False
 
     def send_handshake(self, blocking=False):
         reg = get_registry()
-        body = {"app_name": self.config.app_name, "config": reg.data, "blocked_stats": getattr(reg, 'get_and_clear_stats', lambda: {})()}
+        body = {"timestamp": time.time(), "app_name": self.config.app_name, "config": reg.data, "blocked_stats": getattr(reg, 'get_and_clear_stats', lambda: {})()}
 
         if blocking:
             try:
@@ -125,8 +140,10 @@ class LogNetworkClient:
         if not self.sock: raise ConnectionError
         body_bytes = json.dumps(body_dict).encode('utf-8')
         header = PACKET_HEAD.pack(PROTO_VERSION, pkg_type, len(body_bytes))
+        start = time.perf_counter()
         with self.lock:
             self.sock.sendall(header + body_bytes)
+        self.stats.record_send(len(header) + len(body_bytes), time.perf_counter() - start)
 
     def _heartbeat_loop(self):
         while not self.stop_event.is_set():
@@ -134,11 +151,21 @@ class LogNetworkClient:
                 try:
                     reg = get_registry()
                     body = {"timestamp": time.time(), "app_name": self.config.app_name, "blocked_stats": getattr(reg, 'get_and_clear_stats', lambda: {})()}
+                    body["agent_stats"] = self._agent_stats()
+                    if self.clock_offset is not None:
+                        body["clock"] = {"offset": self.clock_offset, "rtt": self.clock_rtt}
                     self._send_packet(TYPE_HEARTBEAT, body)
                 except:
                     self.connected = False
             time.sleep(5.0)
 
+    def _agent_stats(self):
+        try:
+            from .agent import get_agent
+            return get_agent().get_stats()
+        except Exception:
+            return self.stats.snapshot()
+
     def _receiver_loop(self):
         while not self.stop_event.is_set():
             if not self.connected or not self.sock:
@@ -161,10 +188,18 @@ class LogNetworkClient:
             except:
                 self.connected = False
 
+    def _update_clock(self, sent_at, server_ts, received_at):
+        rtt = received_at - sent_at
+        if rtt < 0: return
+        self.clock_samples.append((rtt, server_ts - (sent_at + received_at) / 2))
+        self.clock_rtt, self.clock_offset = min(self.clock_samples)
+
     def _handle_packet(self, p_type, body):
         try:
             data = json.loads(body.decode('utf-8'))
             if p_type == TYPE_HEARTBEAT:
+                if "echo" in data and "timestamp" in data:
+                    self._update_clock(data["echo"], data["timestamp"], time.time())
                 if "config" in data:
                     get_controller().sync_policy(data["config"])
         except:
@@ -1,5 +1,6 @@
 import os
 import json
+import random
 import threading
 import atexit
 import hashlib
@@ -31,6 +32,11 @@ class UnifiedRegistry:
         self.next_tpl_id = 1
         self._dirty = False
 
+        # Adaptive tracing: fid -> dormant FunctionTracingGhost, and code object
+        # -> ghost for those plus re-armed ones not traced again yet
+        self.dormant = {}
+        self.dormant_code = {}
+
         self._load()
         atexit.register(self._on_exit)
         self._initialized = True
@@ -113,15 +119,43 @@ class UnifiedRegistry:
             self._record_block(fid_str)
             return False
 
-        if tpl_id is not None:
+        if tpl_id is None:
+            # Manager-assigned sampling rate (budget strategy); drops count as blocks
+            if func_data and func_data.get("sample", 1) < 1 and random.random() >= func_data["sample"]:
+                self._record_block(fid_str)
+                return False
+        else:
             tid_str = str(tpl_id)
             if func_data:
                 tpl_data = func_data["templates"].get(tid_str)
-                if tpl_data and not tpl_data.get("enabled", True):
+                if tpl_data and (not tpl_data.get("enabled", True) or (tpl_data.get("sample", 1) < 1 and random.random() >= tpl_data["sample"])):
                     self._record_block(f"{fid_str}:{tid_str}")
                     return False
         return True
 
+    def is_watched(self, func_id):
+        """Manager asked to keep this function fully traced."""
+        func_data = self.data["functions"].get(str(func_id))
+        return bool(func_data and func_data.get("watch", False))
+
+    def register_dormant(self, ghost):
+        with self.data_lock:
+            self.dormant[ghost.cached_func_id] = ghost
+            if ghost.code is not None: self.dormant_code[ghost.code] = ghost
+
+    def unregister_dormant(self, ghost):
+        with self.data_lock:
+            self.dormant.pop(ghost.cached_func_id, None)
+
+    def forget_dormant_code(self, ghost):
+        with self.data_lock:
+            self.dormant_code.pop(ghost.code, None)
+
+    def get_dormant_stats(self):
+        """Pass-through call counts of currently dormant functions."""
+        with self.data_lock:
+            return {str(fid): g.dormant_calls for fid, g in self.dormant.items()}
+
     def _record_block(self, key):
         # [FIX] Thread-safe recording
         with self.data_lock:
@@ -143,6 +177,10 @@ class UnifiedRegistry:
                 if fid in local_funcs:
                     is_enabled = s_func.get("enabled", True)
                     local_funcs[fid]["enabled"] = is_enabled
+                    if s_func.get("watch"): local_funcs[fid]["watch"] = True
+                    else: local_funcs[fid].pop("watch", None)
+                    if "sample" in s_func: local_funcs[fid]["sample"] = s_func["sample"]
+                    else: local_funcs[fid].pop("sample", None)
                     # If enabled, we can clear pending blocks for this key?
                     # No, let get_and_clear_stats handle it naturally.
 
@@ -151,6 +189,8 @@ class UnifiedRegistry:
                         if tid in l_tpls:
                             t_enabled = s_tpl.get("enabled", True)
                             l_tpls[tid]["enabled"] = t_enabled
+                            if "sample" in s_tpl: l_tpls[tid]["sample"] = s_tpl["sample"]
+                            else: l_tpls[tid].pop("sample", None)
                         else:
                             l_tpls[tid] = s_tpl
                             self.tpl_content_to_id[(int(fid), s_tpl["content"])] = int(tid)
@@ -159,6 +199,10 @@ class UnifiedRegistry:
                     self.func_name_to_id[s_func["name"]] = int(fid)
                     for tid, t_data in s_func.get("templates", {}).items():
                         self.tpl_content_to_id[(int(fid), t_data["content"])] = int(tid)
+
+            # Re-arm dormant functions the manager is interested in
+            for fid, ghost in list(self.dormant.items()):
+                if server_funcs.get(str(fid), {}).get("watch"): ghost.rearm()
             self.save()
 
 
@@ -0,0 +1,134 @@
+import time
+import threading
+
+# Sample 1 in (mask + 1) wrapper calls for overhead measurement.
+OVERHEAD_SAMPLE_MASK = 63
+
+
+class _Summary:
+    """
+    Count / total / max accumulator for a latency or size series.
+    """
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max: self.max = value
+
+    def to_dict(self, scale=1.0):
+        avg = (self.total / self.count) if self.count else 0.0
+        return {"count": self.count, "avg": round(avg * scale, 3), "max": round(self.max * scale, 3)}
+
+
+class AgentStats:
+    """
+    Self-instrumentation of the agent's own hot paths.
+
+    Writers are the wrapper (sampled), the LogFun-Worker thread and the
+    network threads. Every update is a handful of arithmetic ops under one
+    short lock, so the cost stays well below the work being measured.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = super(AgentStats, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if hasattr(self, "_initialized"): return
+        self.stats_lock = threading.Lock()
+        self.reset()
+        self._initialized = True
+
+    def reset(self):
+        with self.stats_lock:
+            self.start_time = time.time()
+            self.overhead = _Summary()
+            self.batch_size = _Summary()
+            self.flush_latency = _Summary()
+            self.send_latency = _Summary()
+            self.queue_high_water = 0
+            self.records_flushed = 0
+            self.bytes_sent = 0
+            self.packets_sent = 0
+            self.send_errors = 0
+            self.connects = 0
+            self.connect_failures = 0
+            self.fallback_events = 0
+            self.fallback_records = 0
+
+    def record_overhead(self, seconds):
+        with self.stats_lock:
+            self.overhead.add(seconds)
+
+    def record_queue_depth(self, depth):
+        # Only called from the worker thread; a stale read here is harmless.
+        if depth > self.queue_high_water:
+            self.queue_high_water = depth
+
+    def record_flush(self, size, seconds):
+        with self.stats_lock:
+            self.batch_size.add(size)
+            self.flush_latency.add(seconds)
+            self.records_flushed += size
+
+    def record_send(self, nbytes, seconds):
+        with self.stats_lock:
+            self.send_latency.add(seconds)
+            self.bytes_sent += nbytes
+            self.packets_sent += 1
+
+    def record_send_error(self):
+        with self.stats_lock:
+            self.send_errors += 1
+
+    def record_connect(self, success):
+        with self.stats_lock:
+            if success: self.connects += 1
+            else: self.connect_failures += 1
+
+    def record_fallback(self, size):
+        with self.stats_lock:
+            self.fallback_events += 1
+            self.fallback_records += size
+
+    def snapshot(self, queue_depth=None):
+        """
+        Returns a JSON-serializable view. Latencies are in microseconds.
+        """
+        with self.stats_lock:
+            return {
+                "uptime": round(time.time() - self.start_time, 3),
+                "overhead_us": self.overhead.to_dict(1e6),
+                "queue": {"depth": queue_depth, "high_water": self.queue_high_water},
+                "batch_size": self.batch_size.to_dict(),
+                "flush_us": self.flush_latency.to_dict(1e6),
+                "records_flushed": self.records_flushed,
+                "net": {
+                    "send_us": self.send_latency.to_dict(1e6),
+                    "bytes_sent": self.bytes_sent,
+                    "packets_sent": self.packets_sent,
+                    "send_errors": self.send_errors,
+                    "connects": self.connects,
+                    "reconnects": max(0, self.connects - 1),
+                    "connect_failures": self.connect_failures,
+                },
+                "fallback": {"events": self.fallback_events, "records": self.fallback_records},
+            }
+
+
+_stats = AgentStats()
+
+
+def get_agent_stats():
+    return _stats
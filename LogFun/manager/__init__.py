@@ -1 +1,7 @@
-from .core import LogManager
+def __getattr__(name):
+    # LogManager pulls in matplotlib and networkx; ingest and scan processes
+    # import this package without needing it
+    if name == "LogManager":
+        from .core import LogManager
+        return LogManager
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
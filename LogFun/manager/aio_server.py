@@ -0,0 +1,110 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .config import get_config
+from .protocol import PACKET_HEAD
+from .session import IngestSession
+from .stats import get_monitor
+
+
+class AsyncIngestServer:
+    """
+    asyncio stream-based ingest server speaking the same protocol as the
+    threaded server, for deployments with thousands of long-lived agents.
+
+    Connections are coroutines on one event loop instead of one OS thread
+    each. Packet handling (JSON parse, balancer, storage) runs on a bounded
+    thread pool so it never blocks the loop:
+
+    - each connection has at most one frame in flight, so records of a
+      connection are stored in arrival order and a slow connection stops
+      reading (TCP backpressure) instead of buffering without bound;
+    - at most `max_pending` frames are queued to the executor across all
+      connections; beyond that, readers wait on the semaphore;
+    - responses wait for the transport buffer to drain before the next frame
+      is read.
+
+    Exposes serve_forever / shutdown / server_close / server_address like
+    socketserver servers so callers can treat both engines the same way.
+    """
+
+    def __init__(self, host, port, workers=None, max_pending=None, read_buffer=None):
+        cfg = get_config()
+        self.workers = workers or cfg.get("server", "executor_workers") or 8
+        self.max_pending = max_pending or cfg.get("server", "max_pending") or 64
+        self.read_buffer = read_buffer or cfg.get("server", "read_buffer") or 1048576
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="LogFun-Ingest")
+        self.monitor = get_monitor()
+
+        self.loop = asyncio.new_event_loop()
+        self._stopped = threading.Event()
+        self._pending = asyncio.Semaphore(self.max_pending)
+        self._writers = set()
+        self._server = self.loop.run_until_complete(asyncio.start_server(self._handle, host, port, limit=self.read_buffer, reuse_address=True))
+        self.server_address = self._server.sockets[0].getsockname()[:2]
+
+    async def _handle(self, reader, writer):
+        peer = writer.get_extra_info("peername") or ("?", 0)
+        session = IngestSession(f"{peer[0]}:{peer[1]}")
+        writer.transport.set_write_buffer_limits(high=self.read_buffer)
+        self._writers.add(writer)
+        self.monitor.connection_opened()
+        failed = False
+
+        try:
+            while True:
+                try:
+                    head = await reader.readexactly(PACKET_HEAD.size)
+                    _, p_type, length = PACKET_HEAD.unpack(head)
+                    body = await reader.readexactly(length)
+                except asyncio.IncompleteReadError:
+                    break
+
+                async with self._pending:
+                    resp = await self.loop.run_in_executor(self.executor, session.handle_packet, p_type, body)
+                if resp:
+                    writer.write(resp)
+                    await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        except asyncio.CancelledError:
+            # server_close(): end normally, the connection is being torn down
+            pass
+        except Exception as e:
+            failed = True
+            print(f"[Manager] Handler error from {peer}: {e}")
+        finally:
+            self._writers.discard(writer)
+            self.monitor.connection_closed(error=failed)
+            writer.close()
+
+    async def _close_connections(self):
+        # Stop accepting, then cancel every connection task and wait for it to
+        # unwind, so none of them hands work to the executor once it is shut down
+        self._server.close()
+        for writer in list(self._writers):
+            writer.transport.abort()
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def serve_forever(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+        finally:
+            self._stopped.set()
+
+    def shutdown(self):
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._stopped.wait(5.0)
+
+    def server_close(self):
+        if self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._close_connections(), self.loop).result(5.0)
+        elif not self.loop.is_closed():
+            self.loop.run_until_complete(self._close_connections())
+            self.loop.close()
+        self.executor.shutdown(wait=False)
@@ -1,166 +1,868 @@
+import math
 import time
 import collections
 import statistics
 import threading
-import math
 from abc import ABC, abstractmethod
 from .config import get_config
 from .storage import get_storage
+from .stats import get_monitor
+from .sketch import WindowEntropy
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 class BaseStrategy(ABC):
-    def __init__(self, config):
+    """
+    Traffic is recorded per key, a (fid, tid) template of a function, or
+    (fid, None) for records without templates. analyze() returns the keys
+    to mute as {key: records/s they currently arrive at}; the rate is what
+    a mute's blocked volume is later compared with.
+    """
+    # Whether record() needs the decoded variable values
+    uses_vars = False
+
+    def __init__(self, config, clock=None):
         self.cfg = config
+        # Current time in epoch seconds; replaceable for offline replay (replay.py)
+        self.clock = clock or time.time
 
     @abstractmethod
-    def record(self, app, fid, ts, vars):
+    def record(self, app, key, ts, vars):
         pass
 
     @abstractmethod
     def analyze(self, app):
         pass
 
+    def record_many(self, app, ts, items):
+        """Record a frame of (key, vars, bytes) at one timestamp."""
+        for key, vars, _ in items:
+            self.record(app, key, ts, vars)
+
+    def observe_blocked(self, app, key, n, ts):
+        """Records of `key` that agents dropped (muted or sampled out)."""
+        pass
+
+    def sample_rates(self, app):
+        """Agent sampling rates {key: rate} from the last analyze(), or None if the strategy does not sample."""
+        return None
+
+    def ingest_limit(self):
+        """(amount per second, "records" or "bytes") enforced per app at ingest, or None."""
+        return None
+
+    def forget(self, app, keys):
+        """Drop the traffic recorded for `keys`, e.g. once they are muted."""
+        with self.lock:
+            recorded = self.data.get(app)
+            if recorded is None: return
+            for key in keys:
+                recorded.pop(key, None)
+
+    def resume(self, app, keys):
+        """`keys` were unmuted (after forget())."""
+        pass
+
+    def apps(self):
+        """Apps with recorded traffic."""
+        with self.lock:
+            return list(self.data)
+
+
+def zscores(counts):
+    """
+    Sample z-score of each count against all of them, in one NumPy pass
+    where available; all zeros when the counts are equal.
+    """
+    if np is not None:
+        c = np.asarray(counts, dtype=float)
+        stdev = c.std(ddof=1)
+        return (c - c.mean()) / stdev if stdev > 0 else np.zeros(len(c))
+    mean = statistics.mean(counts)
+    stdev = statistics.stdev(counts)
+    return [(c - mean) / stdev if stdev > 0 else 0.0 for c in counts]
+
+
+def pick(keys, counts, mask):
+    """{key: count} where mask (a NumPy or plain sequence of bools) is true."""
+    if np is not None: return {keys[i]: counts[i] for i in np.flatnonzero(mask)}
+    return {key: c for key, c, m in zip(keys, counts, mask) if m}
+
+
+class SlidingCounter:
+    """
+    Events per second over the last `window` seconds, in a ring of per-second
+    buckets. The window sum is kept up to date as buckets expire, so add()
+    and total() are O(1) amortized and memory does not depend on the rate.
+    """
+    __slots__ = ("window", "counts", "head", "sum", "start")
+
+    def __init__(self, window):
+        self.window = window
+        self.counts = [0] * window
+        self.head = None
+        self.sum = 0
+        # First second of the current run of the window (nothing before it was seen)
+        self.start = None
+
+    def advance(self, sec):
+        """Move the window to end at `sec`, dropping buckets that fall out of it."""
+        head = self.head
+        if head is not None and sec <= head: return
+        if head is None or sec - head >= self.window:
+            self.counts = [0] * self.window
+            self.sum = 0
+            self.start = sec
+        else:
+            counts, w = self.counts, self.window
+            for s in range(head + 1, sec + 1):
+                i = s % w
+                self.sum -= counts[i]
+                counts[i] = 0
+        self.head = sec
+
+    def add(self, sec, n=1):
+        if self.head is None or sec > self.head: self.advance(sec)
+        elif sec <= self.head - self.window: return
+        self.counts[sec % self.window] += n
+        self.sum += n
+
+    def total(self, now):
+        self.advance(now)
+        return self.sum
+
+    def rate(self, now, seconds):
+        """Events per second over the last `seconds` complete seconds (fewer if the counter is younger)."""
+        self.advance(now)
+        n = min(seconds, self.window - 1, now - self.start)
+        if n <= 0: return float(self.counts[now % self.window])
+        counts, w = self.counts, self.window
+        return sum(counts[(now - i) % w] for i in range(1, n + 1)) / n
+
+
+# Seconds over which the rate of a newly muted key is measured
+RATE_SECONDS = 10
+
 
 class ZScoreStrategy(BaseStrategy):
-    def __init__(self, cfg):
-        super().__init__(cfg)
-        self.data = collections.defaultdict(lambda: collections.defaultdict(collections.deque))
+    def __init__(self, cfg, clock=None):
+        super().__init__(cfg, clock)
+        self.window = max(1, int(self.cfg.get("window_size", 180)))
+        self.data = collections.defaultdict(dict)
         self.lock = threading.Lock()
 
-    def record(self, app, fid, ts, vars):
+    def record(self, app, key, ts, vars):
+        self.record_many(app, ts, ((key, vars, 0), ))
+
+    def record_many(self, app, ts, items):
+        sec = int(ts)
+        per_key = collections.Counter(item[0] for item in items)
         with self.lock:
-            self.data[app][fid].append(ts)
+            keys = self.data[app]
+            for key, n in per_key.items():
+                counter = keys.get(key)
+                if counter is None: counter = keys[key] = SlidingCounter(self.window)
+                counter.add(sec, n)
 
     def analyze(self, app):
-        win = int(self.cfg.get("window_size", 180))
-        thresh = float(self.cfg.get("threshold", 3.0))
-        cutoff = time.time() - win
-        counts = {}
+        now = int(self.clock())
+        picks = self._picks(app, now)
         with self.lock:
-            for fid, ts in list(self.data[app].items()):
-                while ts and ts[0] < cutoff:
-                    ts.popleft()
-                if ts: counts[fid] = len(ts)
-                else: del self.data[app][fid]
+            recorded = self.data.get(app, {})
+            return {key: recorded[key].rate(now, RATE_SECONDS) for key in picks if key in recorded}
 
-        if not counts: return []
-        vals = list(counts.values())
+    def _picks(self, app, now):
+        """Keys whose window counts stand out, as {key: count}."""
+        thresh = float(self.cfg.get("threshold", 3.0))
+        keys, counts = [], []
+        with self.lock:
+            recorded = self.data.get(app, {})
+            for key, counter in list(recorded.items()):
+                c = counter.total(now)
+                if c:
+                    keys.append(key)
+                    counts.append(c)
+                else:
+                    del recorded[key]
+            if not recorded: self.data.pop(app, None)
+
+        if not counts: return {}
 
         # [FIX] Handle single function or zero variance case
-        if len(vals) < 2:
+        if len(counts) < 2:
             # If only one function, mute if it exceeds a high absolute threshold (e.g., 2x of a reasonable freq)
             # Default fallback: if count > 100 in window, consider it a spike
-            for fid, c in counts.items():
-                if c > 100: return [fid]
-            return []
+            return {keys[0]: counts[0]} if counts[0] > 100 else {}
 
-        mean = statistics.mean(vals)
-        try:
-            stdev = statistics.stdev(vals)
-        except:
-            stdev = 0
-
-        if stdev == 0:
+        if min(counts) == max(counts):
             # All functions have same frequency. Mute if very high.
-            return [fid for fid, c in counts.items() if c > 100]
+            return dict(zip(keys, counts)) if counts[0] > 100 else {}
 
-        return [fid for fid, c in counts.items() if (c - mean) / stdev > thresh]
+        z = zscores(counts)
+        if np is not None: return pick(keys, counts, z > thresh)
+        return pick(keys, counts, [v > thresh for v in z])
 
 
 class WeightedEntropyStrategy(BaseStrategy):
-    def __init__(self, cfg):
-        super().__init__(cfg)
-        self.data = collections.defaultdict(lambda: collections.defaultdict(collections.deque))
+    """
+    Mutes frequent functions whose variable values carry little information.
+    Entropy per function comes from a WindowEntropy sketch (sketch.py), so
+    memory stays bounded however many distinct values arrive.
+    """
+    uses_vars = True
+
+    def __init__(self, cfg, clock=None):
+        super().__init__(cfg, clock)
+        self.window = max(1, int(cfg.get("window_size", 60)))
+        self.slice_seconds = cfg.get("slice_seconds")
+        self.capacity = int(cfg.get("sketch_capacity", 64))
+        self.sample_size = int(cfg.get("sketch_sample", 64))
+        self.data = collections.defaultdict(dict)
         self.lock = threading.Lock()
 
-    def record(self, app, fid, ts, vars):
-        with self.lock:
-            self.data[app][fid].append((ts, str(vars)))
+    def _sketch(self, recorded, key):
+        sketch = recorded.get(key)
+        if sketch is None:
+            sketch = recorded[key] = WindowEntropy(self.window, self.slice_seconds, self.capacity, self.sample_size)
+        return sketch
 
-    def _calc_entropy(self, logs):
-        if not logs: return 0
-        total = len(logs)
-        counts = collections.Counter(logs)
-        ent = 0
-        for count in counts.values():
-            p = count / total
-            ent -= p * math.log2(p)
-        return ent
+    def record(self, app, key, ts, vars):
+        self.record_many(app, ts, ((key, vars, 0), ))
+
+    def record_many(self, app, ts, items):
+        per_key = collections.defaultdict(collections.Counter)
+        for key, vars, _ in items:
+            per_key[key][str(vars)] += 1
+        with self.lock:
+            recorded = self.data[app]
+            for key, counts in per_key.items():
+                self._sketch(recorded, key).add_counts(ts, counts)
 
     def analyze(self, app):
-        win = int(self.cfg.get("window_size", 60))
+        now = self.clock()
+        picks = self._picks(app, now)
+        with self.lock:
+            recorded = self.data.get(app, {})
+            return {key: recorded[key].rate(now, RATE_SECONDS) for key in picks if key in recorded}
+
+    def _picks(self, app, now):
+        """Frequent, low-entropy keys as {key: count}."""
         thresh = float(self.cfg.get("threshold", 3.0))
         min_ent = float(self.cfg.get("min_entropy", 1.5))
-        cutoff = time.time() - win
-        stats = {}
+        keys, counts, entropies = [], [], []
 
         with self.lock:
-            for fid, items in list(self.data[app].items()):
-                while items and items[0][0] < cutoff:
-                    items.popleft()
-                if not items:
-                    del self.data[app][fid]
+            recorded = self.data.get(app, {})
+            for key, sketch in list(recorded.items()):
+                count = sketch.total(now)
+                if not count:
+                    del recorded[key]
                     continue
-                count = len(items)
-                var_contents = [x[1] for x in items]
-                entropy = self._calc_entropy(var_contents)
-                stats[fid] = (count, entropy)
+                keys.append(key)
+                counts.append(count)
+                entropies.append(sketch.entropy(now))
+            if not recorded: self.data.pop(app, None)
 
-        if not stats: return []
-        counts = [v[0] for v in stats.values()]
+        if not counts: return {}
 
         # [FIX] Advanced single-function detection for entropy
         if len(counts) < 2:
-            for fid, (c, ent) in stats.items():
-                # If high frequency and low entropy, mute even without a baseline
-                if c > 50 and ent < min_ent: return [fid]
-            return []
+            # If high frequency and low entropy, mute even without a baseline
+            return {keys[0]: counts[0]} if counts[0] > 50 and entropies[0] < min_ent else {}
+
+        # Mute if high frequency (Z-Score or absolute) AND low entropy
+        z = zscores(counts)
+        if np is not None:
+            c, ent = np.asarray(counts), np.asarray(entropies)
+            return pick(keys, counts, ((z > thresh) | (c > 100)) & (ent < min_ent))
+        return pick(keys, counts, [(zv > thresh or c > 100) and e < min_ent for zv, c, e in zip(z, counts, entropies)])
+
+
+def fair_shares(demands, weights, budget):
+    """
+    Weighted max-min fair allocation of `budget` over `demands`: no share
+    exceeds its demand, and the rest is split in proportion to the weights
+    (water-filling).
+    """
+    shares = [0.0] * len(demands)
+    order = sorted(range(len(demands)), key=lambda i: demands[i] / weights[i])
+    left, weight = float(budget), float(sum(weights))
+    for n, i in enumerate(order):
+        fair = left * weights[i] / weight if weight > 0 else 0.0
+        if demands[i] <= fair:
+            shares[i] = demands[i]
+            left -= demands[i]
+            weight -= weights[i]
+        else:
+            # Every remaining key wants more than the level: split what is left
+            level = left / weight
+            for j in order[n:]:
+                shares[j] = level * weights[j]
+            break
+    return shares
+
+
+class RateState:
+    """
+    O(1) state of one key for the streaming detectors: the count of the
+    current second, an EWMA baseline (mean and variance of records/s), a
+    short-term EWMA rate and the CUSUM sum.
+    """
+    __slots__ = ("sec", "count", "n", "mean", "var", "fast", "last", "cusum", "alarm", "frozen")
+
+    def __init__(self, sec):
+        self.sec = sec
+        self.count = 0
+        self.n = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.fast = 0.0
+        # Records of the last folded second
+        self.last = 0
+        self.cusum = 0.0
+        self.alarm = False
+        # Muted: nothing is folded until the mute is lifted
+        self.frozen = False
+
+
+class StreamingStrategy(BaseStrategy):
+    """
+    Compares each key with its own history instead of with the other keys
+    of the app, in O(1) state per key. Every completed second is folded
+    into an EWMA baseline (`half_life` seconds); subclasses flag seconds
+    that stand out against it. Spikes are clipped to `clamp` deviations
+    before they reach the baseline, so a burst is not learned as normal
+    while it lasts. The deviation is at least sqrt(mean) (Poisson noise)
+    and 1. Keys are not flagged during their first `warmup` seconds or
+    below `min_rate` records/s. `window_size` only sets the span over
+    which the blocked volume of a mute is measured.
+
+    The baseline of a muted key is frozen until the mute is lifted, so the
+    key is judged against its rate from before the spike, not against the
+    silence of the mute.
+    """
+    clamp = 3.0
+
+    def __init__(self, cfg, clock=None):
+        super().__init__(cfg, clock)
+        self.window = max(1, int(cfg.get("window_size", 30)))
+        half_life = max(1.0, float(cfg.get("half_life", 60.0)))
+        self.alpha = 1 - 0.5**(1 / half_life)
+        # After this many idle seconds the baseline has decayed to nothing
+        self.max_gap = int(10 * half_life)
+        self.warmup = int(cfg.get("warmup", 10))
+        self.min_rate = float(cfg.get("min_rate", 10.0))
+        self.fast_alpha = 1 - 0.5**(1 / max(1.0, float(cfg.get("fast_half_life", 5.0))))
+        self.data = collections.defaultdict(dict)
+        self.lock = threading.Lock()
 
-        mean = statistics.mean(counts)
-        try:
-            stdev = statistics.stdev(counts)
-        except:
-            stdev = 0
+    def record(self, app, key, ts, vars):
+        self.record_many(app, ts, ((key, vars, 0), ))
 
-        mutes = []
-        for fid, (c, ent) in stats.items():
-            # Z-Score check
-            z = (c - mean) / stdev if stdev > 0 else (1 if c > mean else 0)
-            # Mute if high frequency AND low entropy
-            if (z > thresh or c > 100) and ent < min_ent:
-                mutes.append(fid)
-        return mutes
+    def record_many(self, app, ts, items):
+        sec = int(ts)
+        per_key = collections.Counter(item[0] for item in items)
+        with self.lock:
+            recorded = self.data[app]
+            for key, n in per_key.items():
+                st = recorded.get(key)
+                if st is None: st = recorded[key] = RateState(sec)
+                elif sec > st.sec: self._fold(st, sec)
+                st.count += n
+
+    def _fold(self, st, sec):
+        """Fold the seconds before `sec` (the last one counted, then idle ones) into the statistics."""
+        x = st.count
+        for _ in range(0 if st.frozen else min(sec - st.sec, self.max_gap)):
+            self._update(st, x)
+            x = 0
+        st.sec, st.count = sec, 0
+
+    def _update(self, st, x):
+        mean = st.mean
+        sd = max(math.sqrt(st.var), math.sqrt(mean), 1.0)
+        st.fast += self.fast_alpha * (x - st.fast)
+        st.last = x
+        if st.n >= self.warmup:
+            self.detect(st, x, mean, sd)
+            x = min(x, mean + self.clamp * sd)
+        elif not st.n:
+            st.mean = st.fast = float(x)
+            st.n = 1
+            return
+        # A plain running average until the EWMA weight takes over, so the
+        # baseline does not lean on the first seconds
+        a = max(self.alpha, 1.0 / (st.n + 1))
+        d = x - mean
+        st.mean = mean + a * d
+        st.var = (1 - a) * (st.var + a * d * d)
+        st.n += 1
+
+    @abstractmethod
+    def detect(self, st, x, mean, sd):
+        """Update the detector with one second of `x` records; set st.alarm on a spike."""
+        pass
+
+    def analyze(self, app):
+        sec = int(self.clock())
+        picks = {}
+        with self.lock:
+            recorded = self.data.get(app, {})
+            for key, st in list(recorded.items()):
+                if sec > st.sec: self._fold(st, sec)
+                if st.alarm:
+                    st.alarm = False
+                    # The short-term average lags a step; the last second does not
+                    if st.fast >= self.min_rate: picks[key] = max(st.fast, float(st.last))
+                elif st.mean < 0.01 and st.fast < 0.01 and not st.count and not st.frozen:
+                    # Idle long enough to have no history left
+                    del recorded[key]
+            if not recorded: self.data.pop(app, None)
+        return picks
+
+    def forget(self, app, keys):
+        # Keep the baseline: the key is judged against it again once unmuted
+        with self.lock:
+            recorded = self.data.get(app, {})
+            for key in keys:
+                st = recorded.get(key)
+                if st is not None:
+                    st.cusum = 0.0
+                    st.alarm = False
+                    st.frozen = True
+
+    def resume(self, app, keys):
+        sec = int(self.clock())
+        with self.lock:
+            recorded = self.data.get(app, {})
+            for key in keys:
+                st = recorded.get(key)
+                if st is not None and st.frozen:
+                    st.frozen = False
+                    st.sec, st.count = sec, 0
+                    st.fast = st.mean
+
+
+class EwmaStrategy(StreamingStrategy):
+    """
+    EWMA control chart: flags a key when its short-term rate (EWMA with
+    `fast_half_life`) exceeds the baseline by `threshold` standard
+    deviations of that short-term average.
+    """
+
+    def __init__(self, cfg, clock=None):
+        super().__init__(cfg, clock)
+        a = self.fast_alpha
+        self.limit = float(cfg.get("threshold", 4.0)) * math.sqrt(a / (2 - a))
+
+    def detect(self, st, x, mean, sd):
+        if st.fast > mean + self.limit * sd: st.alarm = True
+
+
+class CusumStrategy(StreamingStrategy):
+    """
+    One-sided CUSUM change-point detector: sums how far each second lies
+    above the baseline, in deviations minus a `drift` allowance, and flags
+    the key when the sum passes `threshold`. Sustained shifts of a few
+    deviations are caught within seconds.
+    """
+
+    def __init__(self, cfg, clock=None):
+        super().__init__(cfg, clock)
+        self.drift = float(cfg.get("drift", 1.0))
+        self.threshold = float(cfg.get("threshold", 8.0))
+
+    def detect(self, st, x, mean, sd):
+        st.cusum = max(0.0, st.cusum + (x - mean) / sd - self.drift)
+        if st.cusum > self.threshold: st.alarm = True
+
+
+class BudgetKey:
+    """Window counters of one key for the budget strategy."""
+    __slots__ = ("records", "bytes", "blocked", "sketch")
+
+    def __init__(self, window, sketch=None):
+        self.records = SlidingCounter(window)
+        self.bytes = SlidingCounter(window)
+        self.blocked = SlidingCounter(window)
+        self.sketch = sketch
+
+
+class BudgetStrategy(BaseStrategy):
+    """
+    Shares an ingest budget per app (`records_per_sec`, or `bytes_per_sec`
+    when set) across its templates instead of muting them. Demand is what
+    arrived plus what agents report dropping; the budget is split max-min
+    fair, weighted by 1 + the entropy (bits) of each template's values when
+    `weighting` is "entropy", and each template gets the sampling rate that
+    fits its share. The same budget (times `enforce_slack`) is enforced at
+    ingest for agents that do not sample.
+    """
+
+    def __init__(self, cfg, clock=None):
+        super().__init__(cfg, clock)
+        self.window = max(1, int(cfg.get("window_size", 60)))
+        self.records_per_sec = float(cfg.get("records_per_sec", 1000.0))
+        self.bytes_per_sec = float(cfg.get("bytes_per_sec", 0.0))
+        self.uses_vars = cfg.get("weighting", "entropy") == "entropy"
+        self.min_rate = float(cfg.get("min_rate", 0.01))
+        self.slack = float(cfg.get("enforce_slack", 1.5))
+        self.data = collections.defaultdict(dict)
+        self.rates = {}
+        self.lock = threading.Lock()
+
+    def _key(self, recorded, key):
+        entry = recorded.get(key)
+        if entry is None:
+            entry = recorded[key] = BudgetKey(self.window, WindowEntropy(self.window) if self.uses_vars else None)
+        return entry
+
+    def record(self, app, key, ts, vars):
+        self.record_many(app, ts, ((key, vars, 0), ))
+
+    def record_many(self, app, ts, items):
+        sec = int(ts)
+        per_key = {}
+        for key, vars, size in items:
+            acc = per_key.get(key)
+            if acc is None: acc = per_key[key] = [0, 0, collections.Counter() if self.uses_vars else None]
+            acc[0] += 1
+            acc[1] += size
+            if acc[2] is not None: acc[2][str(vars)] += 1
+        with self.lock:
+            recorded = self.data[app]
+            for key, (n, nbytes, values) in per_key.items():
+                entry = self._key(recorded, key)
+                entry.records.add(sec, n)
+                entry.bytes.add(sec, nbytes)
+                if values is not None: entry.sketch.add_counts(ts, values)
+
+    def observe_blocked(self, app, key, n, ts):
+        with self.lock:
+            entry = self.data.get(app, {}).get(key)
+            if entry is not None: entry.blocked.add(int(ts), n)
+
+    def analyze(self, app):
+        now = self.clock()
+        sec = int(now)
+        keys, demands, weights = [], [], []
+        with self.lock:
+            recorded = self.data.get(app, {})
+            for key, entry in list(recorded.items()):
+                received = entry.records.total(sec)
+                if not received:
+                    # Nothing arrives any more (gone, or muted): no share
+                    del recorded[key]
+                    continue
+                demand = received + entry.blocked.total(sec)
+                if self.bytes_per_sec > 0: demand *= entry.bytes.total(sec) / received
+                keys.append(key)
+                demands.append(demand / self.window)
+                weights.append(1.0 + entry.sketch.entropy(now) if entry.sketch is not None else 1.0)
+            if not recorded: self.data.pop(app, None)
+
+        budget = self.bytes_per_sec if self.bytes_per_sec > 0 else self.records_per_sec
+        rates = {}
+        if keys and sum(demands) > budget:
+            # Agents apply a function's own rate at entry, to all its records;
+            # functions that also log templates are left to ingest enforcement
+            templated = {key[0] for key in keys if key[1] is not None}
+            for key, demand, share in zip(keys, demands, fair_shares(demands, weights, budget)):
+                if key[1] is None and key[0] in templated: continue
+                if share < demand: rates[key] = max(self.min_rate, share / demand)
+        self.rates[app] = rates
+        return {}
+
+    def sample_rates(self, app):
+        return self.rates.get(app, {})
+
+    def ingest_limit(self):
+        if self.bytes_per_sec > 0: return (self.bytes_per_sec * self.slack, "bytes")
+        return (self.records_per_sec * self.slack, "records")
+
+
+class TokenBucket:
+    """Allows `rate` units per second on average, in bursts of up to `burst` units."""
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = None
+
+    def refill(self, now):
+        if self.stamp is not None: self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+
+def parse_blocked_key(key):
+    """(fid, tid) of an agent blocked_stats key, "fid" or "fid:tid"; None if malformed."""
+    try:
+        fid, _, tid = str(key).partition(':')
+        return (int(fid), int(tid) if tid else None)
+    except ValueError:
+        return None
+
+
+class BalancerMute:
+    """
+    One balancer mute: when it started, how long it is held at least, the
+    rate (records/s) that triggered it, and the volume agents have reported
+    blocking since `tracked` (the mute, or when this process took it over).
+    """
+    __slots__ = ("since", "hold", "rate", "blocked", "tracked")
+
+    def __init__(self, since, hold, rate, window, tracked=None):
+        self.since = since
+        self.hold = hold
+        self.rate = rate
+        self.blocked = SlidingCounter(window)
+        self.tracked = since if tracked is None else tracked
+
+    def judged(self, now, window):
+        """Whether the hold is over and enough blocked volume was counted to judge the mute."""
+        return now - self.since >= self.hold and now - self.tracked >= min(self.hold, window)
+
+    def blocked_rate(self, now, window):
+        """Blocked records/s over the part of the window the blocked volume was counted for."""
+        span = min(window, max(1.0, now - self.tracked))
+        return self.blocked.total(int(now)) / span
+
+
+STRATEGIES = {"zscore": ZScoreStrategy, "weighted_entropy": WeightedEntropyStrategy, "budget": BudgetStrategy, "ewma": EwmaStrategy, "cusum": CusumStrategy}
+
+
+def frame_items(records, uses_vars):
+    """
+    (key, vars, bytes) items of a frame of ParsedRecords, one per template
+    of each record; the record's size is split evenly over its templates.
+    Variable values are only decoded when `uses_vars`.
+    """
+    items = []
+    for rec in records:
+        if rec.fid is None: continue
+        try:
+            fid = int(rec.fid)
+            tids = [int(t) for t in rec.tids]
+        except ValueError:
+            continue
+        values = rec.values() if uses_vars else None
+        if not tids:
+            items.append(((fid, None), values, len(rec.line)))
+            continue
+        size = len(rec.line) // len(tids)
+        for tid in tids:
+            items.append(((fid, tid), values, size))
+    return items
 
 
 class LogBalancer:
-    def __init__(self):
+    """
+    Records traffic into the active strategy and analyzes every app on a
+    fixed cadence (algo_config.interval seconds) in one scheduler thread,
+    started with the first recorded frame.
+
+    Mutes are per template ((fid, None) for records without templates).
+    After `mute_hold` seconds a mute is re-evaluated every pass against the
+    volume the agents report blocking (blocked_stats): it is lifted once
+    that falls below `unmute_ratio` of the rate that triggered it. A key
+    muted again soon after is held twice as long, up to `mute_hold_max`.
+    """
+
+    def __init__(self, storage=None, monitor=None, clock=None):
         self.config = get_config()
+        # Current time in epoch seconds, shared with the strategies (see replay.py)
+        self.clock = clock or time.time
+        # Mutes are applied here; defaults to the process-wide storage
+        self.storage = storage
+        # Analysis timings and mute counts go here; defaults to the process-wide monitor
+        self.monitor = monitor
+        # Called with (name, params) after a strategy switch
+        self.listeners = []
+        self.lock = threading.Lock()
+        self._thread = None
+        # {app: {key: BalancerMute}}; an app is present once its stored mutes were adopted
+        self.mutes = {}
+        # {app: {key: (times muted in a row, last unmute)}}
+        self.strikes = {}
+        # Apps whose config carries sampling rates from this balancer
+        self.sampled = set()
         self._init_strategy()
 
     def _init_strategy(self):
         cfg = self.config.algo_config
         active = cfg.get("active", "zscore")
         params = cfg.get(active, {})
-        if active == "weighted_entropy": self.strategy = WeightedEntropyStrategy(params)
-        else: self.strategy = ZScoreStrategy(params)
+        self.strategy = STRATEGIES.get(active, ZScoreStrategy)(params, self.clock)
+        with self.lock:
+            self.buckets = {}
 
     def update_strategy(self, name, params):
         self.config.algo_config["active"] = name
         self.config.algo_config[name] = params
         self._init_strategy()
+        for cb in self.listeners:
+            cb(name, params)
+
+    def record_traffic(self, app, fid, vars=None, tid=None):
+        self.strategy.record(app, (fid, tid), self.clock(), vars)
+
+    def record_batch(self, app, records):
+        """
+        Record one frame of ParsedRecords (see frame_items). The config is
+        read once per frame.
+        """
+        if app == "unknown" or not records or not self.config.algo_config.get("enable", True): return
+        if self._thread is None: self.start()
+        strategy = self.strategy
+        items = frame_items(records, strategy.uses_vars)
+        if items: strategy.record_many(app, self.clock(), items)
+
+    def admit(self, app, records):
+        """
+        The records of a frame that fit the strategy's ingest limit (all of
+        them if it has none). The rest are counted as shed.
+        """
+        limit = self.strategy.ingest_limit()
+        if limit is None or app == "unknown" or not records: return records
+        amount, unit = limit
+        now = self.clock()
+        with self.lock:
+            bucket = self.buckets.get(app)
+            if bucket is None or bucket.rate != amount:
+                bucket = self.buckets[app] = TokenBucket(amount, amount * float(self.config.algo_config.get("burst_seconds", 5.0)))
+            bucket.refill(now)
+            if unit == "bytes":
+                kept = 0
+                for rec in records:
+                    size = len(rec.line)
+                    if size > bucket.tokens: break
+                    bucket.tokens -= size
+                    kept += 1
+            else:
+                kept = min(len(records), int(bucket.tokens))
+                bucket.tokens -= kept
+        if kept < len(records): (self.monitor or get_monitor()).observe_shed(app, len(records) - kept)
+        return records if kept == len(records) else records[:kept]
+
+    def observe_blocked(self, app, stats_dict):
+        """Agent-reported blocked counts (heartbeat blocked_stats) of the app's mutes."""
+        if app == "unknown" or not stats_dict: return
+        if app not in self.mutes: self._adopt(app)
+        now = int(self.clock())
+        blocked = []
+        with self.lock:
+            mutes = self.mutes.get(app, {})
+            for k, v in stats_dict.items():
+                key = parse_blocked_key(k)
+                if key is None: continue
+                blocked.append((key, int(v)))
+                mute = mutes.get(key)
+                if mute is not None: mute.blocked.add(now, int(v))
+        strategy = self.strategy
+        for key, n in blocked:
+            strategy.observe_blocked(app, key, n, now)
+
+    def _window(self):
+        return getattr(self.strategy, "window", 60)
+
+    def _adopt(self, app):
+        """Track balancer mutes already in the app's stored config (e.g. after a restart)."""
+        now, window = self.clock(), self._window()
+        hold = float(self.config.algo_config.get("mute_hold", 60.0))
+        found = {}
+        try:
+            funcs = (self.storage or get_storage()).get_app_config(app).get("functions", {})
+        except:
+            funcs = {}
+        for fid, func in funcs.items():
+            nodes = [(None, func)] if func.get("muted_by") == "balancer" else func.get("templates", {}).items()
+            for tid, node in nodes:
+                if node.get("muted_by") != "balancer" or node.get("enabled", True): continue
+                key = parse_blocked_key(fid if tid is None else f"{fid}:{tid}")
+                # Without a recorded rate the mute is re-evaluated from scratch after the hold
+                # Blocked volume is only counted from now on
+                if key: found[key] = BalancerMute(node.get("muted_at", now), hold, node.get("mute_rate", float('inf')), window, tracked=now)
+        with self.lock:
+            if app not in self.mutes: self.mutes[app] = found
 
-    def record_traffic(self, app, fid, vars=None):
-        self.strategy.record(app, fid, time.time(), vars)
+    def start(self):
+        with self.lock:
+            if self._thread is not None: return
+            self._thread = threading.Thread(target=self._schedule_loop, daemon=True, name="LogFun-Balancer")
+            self._thread.start()
+
+    def _schedule_loop(self):
+        while True:
+            interval = float(self.config.algo_config.get("interval", 5.0))
+            time.sleep(max(0.1, interval))
+            try:
+                self.run_all()
+            except Exception as e:
+                print(f"[LogFun-Manager] Balancer analysis error: {e}")
+
+    def run_all(self):
+        """One analysis pass over every app with recorded traffic or mutes. Returns {app: muted keys}."""
+        if not self.config.algo_config.get("enable", True): return {}
+        results = {}
+        with self.lock:
+            apps = set(self.mutes) | self.sampled
+        for app in apps.union(self.strategy.apps()):
+            mutes = self.run_analysis_cycle(app)
+            if mutes: results[app] = mutes
+        return results
 
     def run_analysis_cycle(self, app):
+        """
+        Analyze one app: mute the keys the strategy picks and lift decayed
+        mutes, in one storage call. Returns the newly muted keys.
+        """
         if app == "unknown": return []
-        mutes = self.strategy.analyze(app)
-        if mutes:
-            storage = get_storage()
-            for fid in mutes:
-                storage.update_control(app, fid, None, False, source="balancer")
-            return mutes
-        return []
+        if app not in self.mutes: self._adopt(app)
+        cfg = self.config.algo_config
+        hold = float(cfg.get("mute_hold", 60.0))
+        hold_max = float(cfg.get("mute_hold_max", 3600.0))
+        ratio = float(cfg.get("unmute_ratio", 0.5))
+        window = self._window()
+
+        t_analysis = time.perf_counter()
+        picks = self.strategy.analyze(app)
+        now = self.clock()
+        with self.lock:
+            current = self.mutes.setdefault(app, {})
+            new = {key: rate for key, rate in picks.items() if key not in current}
+            unmutes = [key for key, m in current.items() if m.judged(now, window) and m.blocked_rate(now, window) < ratio * m.rate]
+        muted = unmuted = []
+        if new or unmutes:
+            muted, unmuted = (self.storage or get_storage()).apply_mutes(app, new, unmutes, source="balancer")
+        with self.lock:
+            strikes = self.strikes.setdefault(app, {})
+            for key in unmutes:
+                current.pop(key, None)
+                n, _ = strikes.get(key, (0, 0))
+                strikes[key] = (n, now)
+            for key in muted:
+                n, last = strikes.get(key, (0, 0))
+                # Muted again before a full maximum hold passed: back off
+                n = n + 1 if now - last < hold_max else 0
+                strikes[key] = (n, now)
+                current[key] = BalancerMute(now, min(hold_max, hold * 2**n), new[key], window)
+        # From here on a mute is judged by what the agents block, not by stale window counts
+        if muted: self.strategy.forget(app, muted)
+        if unmutes: self.strategy.resume(app, unmutes)
+        rates = self.strategy.sample_rates(app)
+        if rates or app in self.sampled:
+            # Rates of a strategy that no longer samples are cleared
+            (self.storage or get_storage()).apply_sampling(app, rates or {})
+            if rates: self.sampled.add(app)
+            else: self.sampled.discard(app)
+        (self.monitor or get_monitor()).observe_analysis(app, time.perf_counter() - t_analysis, len(muted))
+        return muted
 
 
 _balancer = LogBalancer()
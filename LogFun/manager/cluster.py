@@ -0,0 +1,319 @@
+"""
+Multi-process ingest: one coordinator, N worker processes.
+
+The coordinator owns the listening port, the web console, the config tree
+and the monitor. It reads the app name from the first packet of each new
+connection (MSG_PEEK, nothing is consumed) and hands the socket to worker
+crc32(app) % N over a unix socket, so every connection of an app lands on
+the same worker and its records are written in order by one process.
+
+Workers do the per-record work (JSON parsing, balancer recording, log
+writes) on their own core. Because an app is pinned to one worker, the
+worker's balancer sees all of that app's traffic and runs the analysis
+locally; the resulting mutes and all config-tree calls go to the
+coordinator's storage over a multiprocessing manager. Monitor updates are
+batched and shipped to the coordinator every 100 ms. Log files are written
+by the workers, so the console sees new records once the workers' writers
+flush (storage.flush_interval).
+
+SO_REUSEPORT is not used: the kernel balances connections by address hash,
+which cannot pin an app to a worker.
+"""
+import os
+import re
+import json
+import time
+import zlib
+import socket
+import threading
+import multiprocessing
+from multiprocessing.managers import BaseManager
+from .config import get_config
+from .protocol import PACKET_HEAD, TYPE_HANDSHAKE, TYPE_HEARTBEAT
+from .storage import StorageManager, get_storage
+from .stats import get_monitor, frame_traffic
+
+PEEK_BYTES = 65536
+PEEK_TIMEOUT = 1.0
+APP_NAME_RE = re.compile(rb'"app_name":\s*"((?:[^"\\]|\\.)*)"')
+
+# Monitor calls a worker may forward to the coordinator
+MONITOR_EVENTS = ("tick", "observe_traffic", "observe_write", "observe_write_lost", "observe_analysis", "observe_shed", "observe_stages", "observe_latency", "connection_opened", "connection_closed")
+
+
+class ControlPlane(BaseManager):
+    pass
+
+
+ControlPlane.register("storage", callable=get_storage)
+
+
+def peek_app_name(conn, timeout=PEEK_TIMEOUT):
+    """
+    Look at the first packet without consuming it. Returns the app name from a
+    handshake or heartbeat, or None if it does not show up within `timeout`.
+    """
+    deadline = time.time() + timeout
+    conn.settimeout(timeout)
+    try:
+        while True:
+            data = conn.recv(PEEK_BYTES, socket.MSG_PEEK)
+            if not data: return None
+            if len(data) >= PACKET_HEAD.size:
+                _, p_type, length = PACKET_HEAD.unpack_from(data)
+                if p_type not in (TYPE_HANDSHAKE, TYPE_HEARTBEAT): return None
+                m = APP_NAME_RE.search(data, PACKET_HEAD.size)
+                if m: return json.loads(b'"' + m.group(1) + b'"')
+                if len(data) >= min(PACKET_HEAD.size + length, PEEK_BYTES): return None
+            if time.time() >= deadline: return None
+            time.sleep(0.01)
+    except (OSError, ValueError):
+        return None
+    finally:
+        conn.settimeout(None)
+
+
+class WorkerStorage(StorageManager):
+    """
+    Storage as seen from a worker: log files are written locally, the config
+    tree and stats live in the coordinator.
+    """
+
+    def __init__(self, remote, root_dir):
+        super().__init__()
+        self.remote = remote
+        self.root_dir = root_dir
+
+    def sync_config(self, app_name, client_config):
+        return self.remote.sync_config(app_name, client_config)
+
+    def get_app_config(self, app_name):
+        return self.remote.get_app_config(app_name)
+
+    def update_control(self, app_name, target_id, sub_id, enable, source="manual"):
+        return self.remote.update_control(app_name, target_id, sub_id, enable, source)
+
+    def apply_mutes(self, app_name, mutes, unmutes=(), source="balancer"):
+        return self.remote.apply_mutes(app_name, dict(mutes), list(unmutes), source)
+
+    def apply_sampling(self, app_name, rates, tolerance=0.02):
+        return self.remote.apply_sampling(app_name, dict(rates), tolerance)
+
+    def update_stats(self, app_name, stats_dict):
+        return self.remote.update_stats(app_name, stats_dict)
+
+    def update_agent_stats(self, app_name, agent_key, stats):
+        return self.remote.update_agent_stats(app_name, agent_key, stats)
+
+
+class MonitorUplink:
+    """
+    Worker-side stand-in for LogMonitor. Calls are buffered and shipped to the
+    coordinator in one queue message per interval; ticks and per-function
+    traffic are summed.
+    """
+
+    def __init__(self, queue, interval=0.1):
+        self.queue = queue
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.ticks = 0
+        self.frames = 0
+        # {app: {fid: [records, bytes]}}
+        self.traffic = {}
+        self.events = []
+        threading.Thread(target=self._flush_loop, daemon=True, name="LogFun-Uplink").start()
+
+    def tick(self, count=1, app_name=None, records=None):
+        funcs = frame_traffic(records) if records else None
+        with self.lock:
+            self.ticks += count
+            self.frames += 1
+            if app_name and funcs:
+                pending = self.traffic.setdefault(app_name, {})
+                for fid, (n, b) in funcs.items():
+                    c = pending.get(fid)
+                    if c is None: pending[fid] = [n, b]
+                    else:
+                        c[0] += n
+                        c[1] += b
+
+    def _push(self, name, *args):
+        with self.lock:
+            self.events.append((name, args))
+
+    def observe_stages(self, records, timings):
+        self._push("observe_stages", records, timings)
+
+    def observe_latency(self, app_name, samples, weight=1):
+        self._push("observe_latency", app_name, samples, weight)
+
+    def observe_write(self, seconds, nbytes):
+        self._push("observe_write", seconds, nbytes)
+
+    def observe_write_lost(self, app_name, records):
+        self._push("observe_write_lost", app_name, records)
+
+    def observe_analysis(self, app_name, seconds, mutes):
+        self._push("observe_analysis", app_name, seconds, mutes)
+
+    def observe_shed(self, app_name, records):
+        self._push("observe_shed", app_name, records)
+
+    def connection_opened(self):
+        self._push("connection_opened")
+
+    def connection_closed(self, error=False):
+        self._push("connection_closed", error)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                events, ticks, frames, traffic = self.events, self.ticks, self.frames, self.traffic
+                self.events, self.ticks, self.frames, self.traffic = [], 0, 0, {}
+            for app_name, funcs in traffic.items():
+                events.insert(0, ("observe_traffic", (0, app_name, funcs, 0)))
+            if frames: events.insert(0, ("observe_traffic", (ticks, None, None, frames)))
+            if events: self.queue.put(events)
+
+
+def _worker_main(index, num_workers, ctrl, uplink, rpc_address, root_dir):
+    from .balancer import LogBalancer
+    from .server import serve_connection
+    from .session import IngestSession
+
+    plane = ControlPlane(address=rpc_address)
+    plane.connect()
+    monitor = MonitorUplink(uplink)
+    storage = WorkerStorage(plane.storage(), root_dir)
+    storage.writers.monitor = monitor
+    # Only maintain the segments of apps routed here; other workers write the rest
+    storage.writers.owns = lambda app_name: app_name != "unknown" and zlib.crc32(app_name.encode('utf-8')) % num_workers == index
+    storage.start_maintenance()
+    balancer = LogBalancer(storage=storage, monitor=monitor)
+
+    while True:
+        try:
+            msg, fds, _, _ = socket.recv_fds(ctrl, 65536, 1)
+        except OSError:
+            break
+        if not msg: break
+        cmd = json.loads(msg.decode('utf-8'))
+        op = cmd.get("op")
+
+        if op == "conn" and fds:
+            sock = socket.socket(fileno=fds[0])
+            peer = tuple(cmd.get("peer", ("?", 0)))
+            session = IngestSession(f"{peer[0]}:{peer[1]}", storage=storage, balancer=balancer, monitor=monitor)
+            threading.Thread(target=serve_connection, args=(sock, peer, session, monitor), daemon=True).start()
+        elif op == "strategy":
+            balancer.update_strategy(cmd["name"], cmd["params"])
+        elif op == "stop":
+            break
+        else:
+            for fd in fds:
+                os.close(fd)
+
+    storage.writers.close_all()
+
+
+class ClusterServer:
+    """
+    Coordinator of the multi-process ingest mode. Same serve_forever /
+    shutdown / server_close / server_address surface as the other engines.
+    """
+
+    def __init__(self, host, port, workers=None):
+        cfg = get_config()
+        self.num_workers = workers or cfg.get("server", "workers") or os.cpu_count() or 1
+        self.monitor = get_monitor()
+        self._stopped = threading.Event()
+        self._closing = False
+
+        # Control plane: workers call into this process's storage
+        self.plane = ControlPlane(address=("127.0.0.1", 0))
+        self.rpc_server = self.plane.get_server()
+        threading.Thread(target=self.rpc_server.serve_forever, daemon=True, name="LogFun-ControlPlane").start()
+
+        ctx = multiprocessing.get_context("spawn")
+        self.uplink = ctx.Queue()
+        self.workers = []
+        root_dir = get_storage().root_dir
+        for i in range(self.num_workers):
+            parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+            proc = ctx.Process(target=_worker_main, args=(i, self.num_workers, child, self.uplink, self.rpc_server.address, root_dir), daemon=True, name=f"LogFun-Ingest-{i}")
+            proc.start()
+            child.close()
+            self.workers.append((proc, parent, threading.Lock()))
+
+        threading.Thread(target=self._apply_uplink, daemon=True, name="LogFun-Uplink").start()
+        from .balancer import get_balancer
+        get_balancer().listeners.append(self._broadcast_strategy)
+
+        self.listener = socket.create_server((host, port), backlog=1024)
+        self.server_address = self.listener.getsockname()[:2]
+
+    def _send(self, index, cmd, fds=()):
+        _, ctrl, lock = self.workers[index]
+        with lock:
+            socket.send_fds(ctrl, [json.dumps(cmd).encode('utf-8')], list(fds))
+
+    def _broadcast_strategy(self, name, params):
+        for i in range(len(self.workers)):
+            self._send(i, {"op": "strategy", "name": name, "params": params})
+
+    def _apply_uplink(self):
+        monitor = self.monitor
+        while True:
+            events = self.uplink.get()
+            if events is None: break
+            for name, args in events:
+                if name in MONITOR_EVENTS:
+                    getattr(monitor, name)(*args)
+
+    def worker_for(self, app_name, addr):
+        key = app_name if app_name and app_name != "unknown" else addr[0]
+        return zlib.crc32(key.encode('utf-8')) % len(self.workers)
+
+    def _dispatch(self, conn, addr):
+        try:
+            idx = self.worker_for(peek_app_name(conn), addr)
+            self._send(idx, {"op": "conn", "peer": list(addr[:2])}, [conn.fileno()])
+        except OSError as e:
+            print(f"[Manager] Dispatch error for {addr}: {e}")
+        finally:
+            conn.close()
+
+    def serve_forever(self):
+        try:
+            while not self._closing:
+                try:
+                    conn, addr = self.listener.accept()
+                except OSError:
+                    break
+                threading.Thread(target=self._dispatch, args=(conn, addr), daemon=True).start()
+        finally:
+            self._stopped.set()
+
+    def shutdown(self):
+        self._closing = True
+        try:
+            self.listener.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._stopped.wait(5.0)
+
+    def server_close(self):
+        self._closing = True
+        self.listener.close()
+        for i, (proc, ctrl, _) in enumerate(self.workers):
+            try:
+                self._send(i, {"op": "stop"})
+            except OSError:
+                pass
+            proc.join(timeout=2.0)
+            if proc.is_alive(): proc.terminate()
+            ctrl.close()
+        self.uplink.put(None)
+        self.rpc_server.stop_event.set()
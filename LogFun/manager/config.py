@@ -2,7 +2,7 @@ import os
 import json
 import threading
 
-DEFAULT_SERVER_CONFIG = {"server": {"host": "0.0.0.0", "port": 9999}, "storage": {"root_dir": "./logfun_data"}, "algo_config": {"enable": True, "active": "weighted_entropy", "zscore": {"window_size": 180, "threshold": 3.0}, "weighted_entropy": {"window_size": 180, "zscore_threshold": 3.0, "entropy_threshold": 0.8, "min_samples": 20}}}
+DEFAULT_SERVER_CONFIG = {"server": {"host": "0.0.0.0", "port": 9999, "engine": "threaded", "workers": 0, "executor_workers": 8, "max_pending": 64, "read_buffer": 1048576}, "storage": {"root_dir": "./logfun_data", "flush_bytes": 65536, "flush_interval": 0.2, "fsync": "never", "fsync_interval": 1.0, "idle_close": 60.0, "max_buffer_bytes": 16777216, "segment_seconds": 3600, "segment_bytes": 268435456, "block_bytes": 65536, "compress": False, "retention_days": 0, "retention_bytes": 0, "var_index": "off", "var_index_apps": {}, "scan_workers": 1, "scan_unit_bytes": 4194304, "scan_parallel_bytes": 33554432}, "metrics": {"top_functions": 20, "max_apps": 64, "persist_interval": 60.0}, "algo_config": {"enable": True, "active": "weighted_entropy", "interval": 5.0, "mute_hold": 60.0, "mute_hold_max": 3600.0, "unmute_ratio": 0.5, "burst_seconds": 5.0, "zscore": {"window_size": 180, "threshold": 3.0}, "weighted_entropy": {"window_size": 180, "zscore_threshold": 3.0, "entropy_threshold": 0.8, "min_samples": 20, "sketch_capacity": 64, "sketch_sample": 64}, "budget": {"window_size": 60, "records_per_sec": 1000.0, "bytes_per_sec": 0.0, "weighting": "entropy", "min_rate": 0.01, "enforce_slack": 1.5}, "ewma": {"window_size": 30, "half_life": 60.0, "fast_half_life": 5.0, "threshold": 4.0, "warmup": 10, "min_rate": 10.0}, "cusum": {"window_size": 30, "half_life": 60.0, "drift": 1.0, "threshold": 8.0, "warmup": 10, "min_rate": 10.0}}}
 
 
 class ServerConfig:
@@ -1,35 +1,43 @@
+import re
 import json
-import os
+import time
 from .storage import get_storage
+from .stats import get_monitor
 from .config import get_config
+from .indexer import query_tokens, value_tokens
+from .scan import get_scanner, encode_cursor, decode_cursor
+from .template_cache import CompiledApp, get_template_cache
+
+_raw_decode = json.JSONDecoder().raw_decode
+_skip_ws = re.compile(r'\s*').match
 
 
 class LogDecoder:
-    def __init__(self, app_name=None, custom_config=None):
+    def __init__(self, app_name=None, custom_config=None, revision=None):
+        """
+        Templates come from the shared template cache when the config is the
+        app's stored one (or a custom config with a known revision).
+        """
         self.app_name = app_name
         self.storage = get_storage()
 
         # Support loading config from storage OR directly passed (for offline decode)
-        if custom_config:
+        if custom_config is not None:
             self.config = custom_config
-            self.log_path = None  # No file path for custom config mode
+            self.segments = None  # No stored segments for custom config mode
+            self.revision = revision
+            if revision is None: self.compiled = CompiledApp(custom_config)
+            else: self.compiled = get_template_cache().get(app_name, custom_config, revision)
         else:
+            # Loading the config from disk bumps the revision, so read it afterwards
             self.config = self.storage.get_app_config(app_name)
-            self.log_path = self.storage._get_log_path(app_name)
+            self.revision = self.storage.get_config_revision(app_name)
+            self.storage.flush_logs(app_name)
+            self.segments = self.storage.get_segments(app_name)
+            self.compiled = get_template_cache().get(app_name, self.config, self.revision)
 
-        self.func_map = {}
-        self.tpl_map = {}
-        self._build_maps()
-
-    def _build_maps(self):
-        if not self.config or "functions" not in self.config:
-            return
-
-        for fid, func in self.config["functions"].items():
-            self.func_map[str(fid)] = func.get("name", f"Func<{fid}>")
-            if "templates" in func:
-                for tid, tpl in func["templates"].items():
-                    self.tpl_map[str(tid)] = tpl.get("content", f"Tpl<{tid}>")
+        self.func_map = self.compiled.func_names
+        self.tpl_map = self.compiled.contents
 
     def _parse_line(self, line):
         """
@@ -45,17 +53,15 @@ class LogDecoder:
             ts, app_id, func_id, duration, rest = parts
 
             # Robust JSON decoding
-            decoder = json.JSONDecoder()
             try:
-                log_data, idx = decoder.raw_decode(rest)
-                vars_str = rest[idx:].lstrip()
-                variables, _ = decoder.raw_decode(vars_str)
+                log_data, idx = _raw_decode(rest)
+                variables, _ = _raw_decode(rest, _skip_ws(rest, idx).end())
             except:
                 # Fallback: maybe split by known separator if JSON fails?
                 # For now return None to skip malformed lines
                 return None
 
-            return {"ts": ts, "fid": str(func_id), "dur": duration, "data": log_data, "vars": variables}
+            return {"ts": ts, "fid": func_id, "dur": duration, "data": log_data, "vars": variables}
         except Exception:
             return None
 
@@ -63,90 +69,134 @@ class LogDecoder:
         if not parsed: return []
 
         results = []
-        func_name = self.func_map.get(parsed["fid"], f"Func<{parsed['fid']}>")
-        ts = parsed["ts"]
-        vars_iter = iter(parsed["vars"])
+        compiled = self.compiled
+        fid = parsed["fid"]
+        func_name = compiled.func_names.get(fid)
+        if func_name is None: func_name = f"Func<{fid}>"
+        prefix = f"{parsed['ts']} ["
+        variables = parsed["vars"]
+        if not isinstance(variables, list): variables = list(variables)
+        pos = 0
+
+        templates = compiled.templates
+        suffix = f"] [{func_name}] "
 
         for entry in parsed["data"]:
             if len(entry) < 2: continue
-            lvl, tid = entry[0], str(entry[1])
-            tpl_content = self.tpl_map.get(tid, f"Unresolved<{tid}>")
-
-            needed_vars = tpl_content.count("%s")
-            current_vars = []
-            try:
-                for _ in range(needed_vars):
-                    current_vars.append(next(vars_iter))
-            except StopIteration:
-                pass
-
-            try:
-                msg = tpl_content % tuple(current_vars) if current_vars else tpl_content
-            except:
-                msg = f"{tpl_content} [Vars Error: {current_vars}]"
-
-            results.append(f"{ts} [{lvl}] [{func_name}] {msg}")
+            tid = entry[1]
+            tpl = templates.get(tid) if tid.__class__ in (int, str) else None
+            if tpl is None: tpl = compiled.template(tid)
+            n = tpl.nargs
+            if not n:
+                msg = tpl.content
+            else:
+                args = variables[pos:pos + n]
+                pos += n
+                msg = tpl.fmt.format(*args) if tpl.fmt is not None and len(args) == n else tpl.render(args)
+            results.append(f"{prefix}{entry[0]}{suffix}{msg}")
 
         return results
 
-    def search_logs(self, search_type, keyword, limit=1000):
-        if not self.log_path or not os.path.exists(self.log_path): return []
+    def search_spec(self, search_type, keyword):
+        """
+        Precomputed filter for match_line(), or None if nothing can match.
 
-        results = []
+        Variable search is a substring match, except for apps whose values are
+        indexed (storage.var_index): there a value matches when it contains
+        all of the keyword's tokens, which lets the index skip segments/blocks.
+        """
         keyword = keyword.lower().strip()
-
-        target_fids = set()
-        target_tids = set()
+        spec = {"type": search_type, "keyword": keyword, "fids": set(), "tids": set(), "tokens": None, "literal": keyword}
 
         # Pre-filter maps
         if search_type == 'function':
             for fid, name in self.func_map.items():
-                if keyword in name.lower(): target_fids.add(fid)
-            if not target_fids: return []
+                if keyword in name.lower(): spec["fids"].add(fid)
+            if not spec["fids"]: return None
         elif search_type == 'template':
             for tid, content in self.tpl_map.items():
-                if keyword in content.lower(): target_tids.add(tid)
-            if not target_tids: return []
-
+                if keyword in content.lower(): spec["tids"].add(tid)
+            if not spec["tids"]: return None
+        elif search_type == 'variable' and self.segments is not None and self.segments.opts.var_index != "off":
+            tokens = query_tokens(keyword)
+            if tokens:
+                spec["tokens"] = tokens
+                # A token spelled as in the keyword also appears verbatim in the raw record
+                spec["literal"] = max((t for t in tokens if t.isascii() and t in keyword), key=len, default="")
+        return spec
+
+    def match_line(self, line, spec):
+        """Decoded lines of a record matching `spec` (everything if spec is None), else None."""
+        if spec is not None and spec["type"] == 'variable':
+            # Quick skip for variable search
+            if spec["literal"] not in line.lower(): return None
+
+        parsed = self._parse_line(line)
+        if not parsed: return None
+        if spec is None: return self.decode_line_to_text(parsed)
+
+        match = False
+        search_type = spec["type"]
+        if search_type == 'function':
+            if parsed["fid"] in spec["fids"]: match = True
+        elif search_type == 'template':
+            for entry in parsed["data"]:
+                if str(entry[1]) in spec["tids"]:
+                    match = True
+                    break
+        elif search_type == 'variable':
+            # Double check JSON decoded vars
+            tokens, keyword = spec["tokens"], spec["keyword"]
+            for v in parsed["vars"]:
+                if (tokens <= value_tokens(v)) if tokens else (keyword in str(v).lower()):
+                    match = True
+                    break
+
+        return self.decode_line_to_text(parsed) if match else None
+
+    def search_logs(self, search_type, keyword, limit=1000, start=None, end=None):
+        """
+        Matching records in [start, end] (epoch seconds, either may be None),
+        oldest first, up to about `limit` decoded lines.
+        """
+        if self.segments is None: return []
+        t_search = time.perf_counter()
+        spec = self.search_spec(search_type, keyword)
+        results = []
         try:
-            with open(self.log_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    # Quick skip for variable search
-                    if search_type == 'variable' and keyword not in line.lower(): continue
-
-                    parsed = self._parse_line(line)
-                    if not parsed: continue
-
-                    match = False
-                    if search_type == 'function':
-                        if parsed["fid"] in target_fids: match = True
-                    elif search_type == 'template':
-                        for entry in parsed["data"]:
-                            if str(entry[1]) in target_tids:
-                                match = True
-                                break
-                    elif search_type == 'variable':
-                        # Double check JSON decoded vars
-                        for v in parsed["vars"]:
-                            if keyword in str(v).lower():
-                                match = True
-                                break
-
-                    if match:
-                        results.extend(self.decode_line_to_text(parsed))
-                        if len(results) >= limit: break
+            for _, texts in get_scanner().scan(self, spec, start, end, limit) if spec is not None else ():
+                results.extend(texts)
+                if len(results) >= limit: break
         except:
             pass
+        get_monitor().observe_search(search_type, time.perf_counter() - t_search)
         return results
 
-    def decode_all_generator(self):
-        if not self.log_path or not os.path.exists(self.log_path): return
-        with open(self.log_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                parsed = self._parse_line(line)
-                if parsed:
-                    for txt in self.decode_line_to_text(parsed):
-                        yield txt + "\n"
+    def search_page(self, search_type, keyword, limit=500, start=None, end=None, cursor=None):
+        """
+        Like search_logs, but yields each matching record's decoded lines as
+        soon as they are found, resuming after `cursor`. Finally yields
+        (None, next_cursor); next_cursor is None once nothing is left.
+        Raises ValueError for an invalid cursor.
+        """
+        after = decode_cursor(cursor) if cursor else None
+        t_search = time.perf_counter()
+        spec = self.search_spec(search_type, keyword) if self.segments is not None else None
+        count, last = 0, None
+        if spec is not None:
+            for key, texts in get_scanner().scan(self, spec, start, end, limit, after):
+                yield texts, None
+                count += len(texts)
+                last = key
+                if count >= limit: break
+        get_monitor().observe_search(search_type, time.perf_counter() - t_search)
+        yield None, (encode_cursor(last) if count >= limit else None)
+
+    def decode_all_generator(self, start=None, end=None):
+        if self.segments is None: return
+        for _, texts in get_scanner().scan(self, None, start, end):
+            for txt in texts:
+                yield txt + "\n"
 
     def decode_offline_files(self, log_content_str):
         """
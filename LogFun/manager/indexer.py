@@ -0,0 +1,364 @@
+"""
+Sparse per-segment index: for every function id and template id, the list
+of blocks (see segments.py) that contain at least one of its records.
+Time bounds per block already live in the manifest's block table.
+
+The index of the active segment is built as frames are written and saved
+next to the segment as <segment>.idx with the manifest; sealed segments'
+indexes never change. Existing data (including a pre-segment <app>.log)
+can be indexed offline:
+
+    python -m LogFun.manager.indexer                 # all apps under storage.root_dir
+    python -m LogFun.manager.indexer my_app --root ./logfun_data
+
+Variable values can be indexed too (storage.var_index, per app via
+storage.var_index_apps), by the compactor once a segment is sealed: "bloom"
+keeps a Bloom filter of value tokens per segment, so searches skip
+segments that cannot match; "full" keeps token -> blocks postings instead
+(<segment>.tok), larger but down to the block. Tokens are lowercased word
+runs, the dotted/dashed IDs they form and canonical numbers, see tokenize().
+
+Run the rebuild while the Manager is stopped, or for apps it is not writing.
+"""
+import os
+import re
+import sys
+import json
+import math
+import mmap
+import struct
+import bisect
+import hashlib
+import argparse
+from array import array
+from .parser import parse_frame
+
+VAR_INDEX_MODES = ("off", "bloom", "full")
+
+# IDs such as "ord-42", "a.b@c" or "user_id" are kept whole; WORD_RE splits them
+TOKEN_RE = re.compile(r'\w+(?:[-.:@/#+]\w+)*')
+WORD_RE = re.compile(r'[^\W_]+')
+
+
+def _canonical_number(tok):
+    try:
+        f = float(tok)
+    except ValueError:
+        return None
+    if f != f or f in (float('inf'), float('-inf')): return None
+    if f.is_integer() and abs(f) < 1e18: return str(int(f))
+    return repr(f)
+
+
+def tokenize(text):
+    """Set of search tokens of a value: whole IDs, their words, canonical numbers."""
+    out = set()
+    for tok in TOKEN_RE.findall(text.lower()):
+        out.add(tok)
+        parts = WORD_RE.findall(tok) if not tok.isalnum() else ()
+        out.update(parts)
+        for t in (tok, *parts):
+            if t[0].isdigit():
+                num = _canonical_number(t)
+                if num is not None: out.add(num)
+    return out
+
+
+def query_tokens(text):
+    """
+    Tokens a value must contain to match a search keyword; numbers are only
+    matched by value, so "42.0" finds 42.
+    """
+    out = set()
+    for tok in TOKEN_RE.findall(text.lower()):
+        num = _canonical_number(tok) if tok[0].isdigit() else None
+        if num is not None:
+            out.add(num)
+            continue
+        out.add(tok)
+        if not tok.isalnum(): out.update(WORD_RE.findall(tok))
+    return out
+
+
+def value_tokens(value):
+    """Tokens of one decoded variable; non-strings are tokenized as their JSON text."""
+    return tokenize(value if isinstance(value, str) else json.dumps(value))
+
+
+def frame_tokens(records):
+    """Union of the variable tokens of a frame of ParsedRecords."""
+    tokens = set()
+    for rec in records:
+        text = rec.vars_text()
+        if text is None: continue
+        if '\\' not in text:
+            # No escapes: the raw JSON text tokenizes like the decoded values
+            tokens |= tokenize(text)
+            continue
+        for v in rec.values():
+            tokens |= value_tokens(v)
+    return tokens
+
+
+def frame_keys(records):
+    """Sets of fids and tids appearing in a frame of ParsedRecords."""
+    fids, tids = set(), set()
+    for rec in records:
+        if rec.fid is None: continue
+        fids.add(rec.fid)
+        tids.update(rec.tids)
+    return fids, tids
+
+
+class SegmentIndex:
+    """
+    Posting lists {key: [block, ...]} for fids and tids of one segment.
+    `blocks` is how many blocks of the segment are covered; later blocks (and
+    any unindexed tail) must be scanned.
+    """
+
+    def __init__(self, data=None):
+        data = data or {}
+        self.fid = data.get("fid", {})
+        self.tid = data.get("tid", {})
+        self.blocks = data.get("blocks", 0)
+        # Block table of a legacy file, which has none in the manifest
+        self.block_table = data.get("block_table")
+        self.dirty = False
+
+    def add(self, block, fids, tids):
+        for key, postings in ((self.fid, fids), (self.tid, tids)):
+            for k in postings:
+                lst = key.get(k)
+                if lst is None: key[k] = [block]
+                elif lst[-1] != block: lst.append(block)
+        if block + 1 > self.blocks: self.blocks = block + 1
+        self.dirty = True
+
+    def lookup(self, fids=None, tids=None):
+        """Blocks that may hold any of the given fids or tids."""
+        found = set()
+        for key, wanted in ((self.fid, fids), (self.tid, tids)):
+            for k in wanted or ():
+                found.update(key.get(str(k), ()))
+        return found
+
+    def to_dict(self):
+        d = {"fid": self.fid, "tid": self.tid, "blocks": self.blocks}
+        if self.block_table is not None: d["block_table"] = self.block_table
+        return d
+
+    def save(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp, path)
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls(json.load(f))
+        except (OSError, ValueError):
+            return None
+
+
+def token_hash(token):
+    """Stable 64-bit hash of a token (str hashes are salted per process)."""
+    return int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class BloomFilter:
+    """Bloom filter with double hashing; `bits` may be a bytearray or an mmap view."""
+
+    def __init__(self, capacity, error=0.01, m=None, k=None, bits=None):
+        self.capacity = max(1, capacity)
+        self.m = m or max(64, int(math.ceil(-self.capacity * math.log(error) / (math.log(2) ** 2))))
+        self.k = k or max(1, int(round(self.m / self.capacity * math.log(2))))
+        self.bits = bits if bits is not None else bytearray((self.m + 7) // 8)
+
+    def positions(self, h):
+        h1, h2, m = h & 0xFFFFFFFF, (h >> 32) | 1, self.m
+        return [(h1 + i * h2) % m for i in range(self.k)]
+
+    def add(self, h):
+        bits, m = self.bits, self.m
+        p, step = (h & 0xFFFFFFFF) % m, ((h >> 32) | 1) % m
+        for _ in range(self.k):
+            bits[p >> 3] |= 1 << (p & 7)
+            p = (p + step) % m
+
+    def __contains__(self, h):
+        bits = self.bits
+        for p in self.positions(h):
+            if not bits[p >> 3] & (1 << (p & 7)): return False
+        return True
+
+
+def _hash_buckets(block_tokens, full):
+    """
+    Token hashes bucketed by their top byte: (hash32 << 32 | block) keys for
+    postings, plain 64-bit hashes for a Bloom filter. Sorting one bucket at a
+    time keeps the build's memory near 8 bytes per token occurrence.
+    """
+    buckets = [array('Q') for _ in range(256)]
+    for block, tokens in block_tokens:
+        for t in tokens:
+            h = token_hash(t)
+            if full:
+                h &= 0xFFFFFFFF
+                buckets[h >> 24].append(h << 32 | block)
+            else:
+                buckets[h >> 56].append(h)
+    return buckets
+
+
+class TokenIndex:
+    """
+    Variable-token index of one sealed segment, read through mmap so a lookup
+    only touches the pages it needs.
+
+    "bloom": <segment>.bloom, a Bloom filter (1% false positives) of all
+    tokens; answers "not in this segment" or "maybe anywhere".
+    "full":  <segment>.tok, sorted uint64 keys (hash32 << 32 | block), one
+    per token and block; answers with the candidate blocks.
+    """
+    BLOOM_MAGIC = b"LFBLOOM1"
+    TOK_MAGIC = b"LFTOK001"
+    HEAD = struct.Struct('<8sQ')
+
+    def __init__(self, path, mode):
+        self.path = path
+        self.mode = mode
+
+    @classmethod
+    def build(cls, base, mode, block_tokens):
+        """Write the index from (block, tokens) pairs. Returns the number of keys stored."""
+        full = mode == "full"
+        buckets = _hash_buckets(block_tokens, full)
+        for i, bucket in enumerate(buckets):
+            buckets[i] = array('Q', sorted(set(bucket)))
+        count = sum(len(b) for b in buckets)
+
+        path = base + (".tok" if full else ".bloom")
+        with open(path + ".tmp", 'wb') as f:
+            if full:
+                f.write(cls.HEAD.pack(cls.TOK_MAGIC, count))
+                for bucket in buckets:
+                    bucket.tofile(f)
+            else:
+                bloom = BloomFilter(count)
+                for bucket in buckets:
+                    for h in bucket:
+                        bloom.add(h)
+                f.write(cls.HEAD.pack(cls.BLOOM_MAGIC, bloom.m))
+                f.write(struct.pack('<Q', bloom.k))
+                f.write(bloom.bits)
+        os.replace(path + ".tmp", path)
+        return count
+
+    @classmethod
+    def load(cls, base, mode):
+        path = base + (".tok" if mode == "full" else ".bloom")
+        return cls(path, mode) if os.path.exists(path) else None
+
+    def lookup(self, tokens):
+        """
+        Blocks that may hold all tokens: set() if none can, None if the index
+        cannot narrow it down (Bloom hit, or unreadable index).
+        """
+        try:
+            with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if self.mode == "full": return self._lookup_postings(mm, tokens)
+                return None if self._bloom_hit(mm, tokens) else set()
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def _bloom_hit(self, mm, tokens):
+        magic, m = self.HEAD.unpack_from(mm)
+        if magic != self.BLOOM_MAGIC: raise ValueError("bad bloom file")
+        k = struct.unpack_from('<Q', mm, self.HEAD.size)[0]
+        bits = memoryview(mm)[self.HEAD.size + 8:]
+        try:
+            bloom = BloomFilter(1, m=m, k=k, bits=bits)
+            return all(token_hash(t) in bloom for t in tokens)
+        finally:
+            bits.release()
+
+    def _lookup_postings(self, mm, tokens):
+        magic, count = self.HEAD.unpack_from(mm)
+        if magic != self.TOK_MAGIC: raise ValueError("bad token index")
+        keys = memoryview(mm)[self.HEAD.size:self.HEAD.size + count * 8].cast('Q')
+        try:
+            found = None
+            for t in tokens:
+                h = token_hash(t) & 0xFFFFFFFF
+                lo = bisect.bisect_left(keys, h << 32)
+                hi = bisect.bisect_left(keys, (h + 1) << 32, lo)
+                blocks = {keys[i] & 0xFFFFFFFF for i in range(lo, hi)}
+                found = blocks if found is None else found & blocks
+                if not found: return set()
+            return found
+        finally:
+            keys.release()
+
+
+def rebuild_tokens(segments, seg):
+    """Build the variable-token index of one sealed segment in segments.opts.var_index mode."""
+    def block_tokens():
+        for i, data in enumerate(segments.iter_blocks(seg)):
+            if i >= len(seg["blocks"]): break
+            yield i, frame_tokens(parse_frame(data.decode('utf-8', errors='replace').splitlines()))
+    os.makedirs(segments.seg_dir, exist_ok=True)
+    return TokenIndex.build(segments.token_base(seg), segments.opts.var_index, block_tokens())
+
+
+def rebuild_segment(segments, seg):
+    """Index one non-active segment from its data. Returns the SegmentIndex."""
+    if seg.get("legacy") and not seg["blocks"]:
+        segments._rescan(seg)
+    index = SegmentIndex()
+    if seg.get("legacy"): index.block_table = seg["blocks"]
+    for i, data in enumerate(segments.iter_blocks(seg)):
+        if i >= len(seg["blocks"]): break
+        fids, tids = frame_keys(parse_frame(data.decode('utf-8', errors='replace').splitlines()))
+        index.add(i, fids, tids)
+    index.blocks = len(seg["blocks"])
+    os.makedirs(segments.seg_dir, exist_ok=True)
+    index.save(segments.index_path(seg))
+    return index
+
+
+def rebuild_app(app_dir, app_name, opts=None, verbose=True):
+    from .segments import AppSegments
+    segments = AppSegments(app_dir, app_name, opts)
+    for seg in list(segments.segments):
+        if seg["state"] == "active": continue
+        index = rebuild_segment(segments, seg)
+        if verbose: print(f"  {seg['name']}: {index.blocks} blocks, {len(index.fid)} functions, {len(index.tid)} templates")
+        if segments.opts.var_index != "off" and index.blocks:
+            count = rebuild_tokens(segments, seg)
+            seg["var_index"] = segments.opts.var_index
+            segments.dirty = True
+            if verbose: print(f"  {seg['name']}: {count} value tokens ({segments.opts.var_index})")
+    segments.save()
+
+
+def main(argv=None):
+    from .config import get_config
+    from .storage import get_storage
+    parser = argparse.ArgumentParser(description="Rebuild LogFun segment indexes")
+    parser.add_argument("apps", nargs="*", help="app names (default: all)")
+    parser.add_argument("--root", default="", help="storage root (default: storage.root_dir)")
+    opts = parser.parse_args(argv)
+
+    root = opts.root or get_config().get("storage", "root_dir")
+    apps = opts.apps or sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+    for app_name in apps:
+        print(f"[Indexer] {app_name}")
+        rebuild_app(os.path.join(root, app_name), app_name, get_storage().segment_opts_for(app_name))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,340 @@
+"""
+Ingest load generator for the Manager.
+
+Spawns N simulated agents that speak the real PACKET_HEAD protocol
+(handshake, heartbeats, compressed log batches) and reports how many records
+per second the Manager ingests, its CPU use, per-stage latency and dropped
+connections.
+
+    # In-process manager on an ephemeral port with a throwaway storage dir
+    python -m LogFun.manager.loadgen --agents 50 --rate 2000 --duration 30
+
+    # Same load against the asyncio engine
+    python -m LogFun.manager.loadgen --agents 50 --rate 2000 --engine asyncio
+
+    # Against a running manager (client-side numbers + /api/status)
+    python -m LogFun.manager.loadgen --target 127.0.0.1:9999 --agents 200
+"""
+import os
+import sys
+import json
+import time
+import random
+import string
+import socket
+import hashlib
+import argparse
+import tempfile
+import threading
+import urllib.request
+from .protocol import pack_packet, TYPE_HANDSHAKE, TYPE_LOG_DATA, TYPE_HEARTBEAT
+
+
+def zipf_weights(n, skew):
+    return [1.0 / ((i + 1)**skew) for i in range(n)]
+
+
+class TrafficProfile:
+    """
+    Describes what one simulated app emits: how many functions and templates,
+    how skewed the template popularity is and how many distinct variable
+    values appear (0 means every value is unique).
+    """
+
+    def __init__(self, functions=20, templates=3, skew=1.1, var_cardinality=50, vars_per_tpl=2, var_len=8):
+        self.functions = functions
+        self.templates = templates
+        self.skew = skew
+        self.var_cardinality = var_cardinality
+        self.vars_per_tpl = vars_per_tpl
+        self.var_len = var_len
+
+    def build_config(self, app_name):
+        funcs = {}
+        tid = 1
+        for fid in range(1, self.functions + 1):
+            tpls = {}
+            for _ in range(self.templates):
+                content = f"loadgen step {tid} " + " ".join(["v=%s"] * self.vars_per_tpl)
+                tpls[str(tid)] = {"content": content, "enabled": True}
+                tid += 1
+            funcs[str(fid)] = {"name": f"loadgen.py:func_{fid}", "enabled": True, "templates": tpls}
+        return {"app_name": app_name, "functions": funcs}
+
+    def build_pool(self, config, size, rng):
+        """
+        Pre-render record bodies (everything after the timestamp and app id)
+        so the generator spends its CPU on sending, not formatting.
+        """
+        fids = list(config["functions"].keys())
+        weights = zipf_weights(len(fids), self.skew)
+        values = None
+        if self.var_cardinality > 0:
+            values = [''.join(rng.choices(string.ascii_letters + string.digits, k=self.var_len)) for _ in range(self.var_cardinality)]
+
+        pool = []
+        for _ in range(size):
+            fid = rng.choices(fids, weights=weights)[0]
+            tids = list(config["functions"][fid]["templates"].keys())
+            chosen = rng.sample(tids, rng.randint(1, len(tids)))
+            meta = [["INFO", int(t)] for t in chosen]
+            n_vars = len(chosen) * self.vars_per_tpl
+            if values:
+                vars_list = [rng.choice(values) for _ in range(n_vars)]
+            else:
+                vars_list = [''.join(rng.choices(string.ascii_letters + string.digits, k=self.var_len)) for _ in range(n_vars)]
+            pool.append(f"{fid} {rng.uniform(0.01, 5.0):.2f} {json.dumps(meta)} {json.dumps(vars_list)}")
+        return pool
+
+
+class SimulatedAgent(threading.Thread):
+    def __init__(self, idx, address, app_name, profile, rate, batch_size, heartbeat, stop_event, seed=None):
+        super().__init__(daemon=True, name=f"LoadGen-{idx}")
+        self.address = address
+        self.app_name = app_name
+        self.app_id = hashlib.md5(app_name.encode('utf-8')).hexdigest()[:8]
+        self.profile = profile
+        self.rate = rate
+        self.batch_size = batch_size
+        self.heartbeat = heartbeat
+        self.stop_event = stop_event
+        self.rng = random.Random(seed if seed is not None else idx)
+
+        self.sent_records = 0
+        self.sent_bytes = 0
+        self.sent_frames = 0
+        self.dropped = 0
+        self.connect_failures = 0
+        self.sock = None
+
+    def _connect(self):
+        sock = socket.create_connection(self.address, timeout=5.0)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # Blocking sends: a saturated manager throttles the agent through TCP
+        # backpressure instead of tripping a timeout and counting as a drop.
+        sock.settimeout(None)
+        body = json.dumps({"app_name": self.app_name, "config": self.config, "blocked_stats": {}}).encode('utf-8')
+        sock.sendall(pack_packet(TYPE_HANDSHAKE, body))
+        return sock
+
+    def _drain(self, sock):
+        # The manager answers handshakes and heartbeats with the config tree.
+        # MSG_DONTWAIT rather than select(), which fails past fd 1024.
+        while True:
+            try:
+                chunk = sock.recv(65536, socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                return
+            if not chunk: raise ConnectionError("closed by manager")
+
+    def run(self):
+        self.config = self.profile.build_config(self.app_name)
+        pool = self.profile.build_pool(self.config, 2000, self.rng)
+        interval = self.batch_size / self.rate if self.rate > 0 else 0
+        cursor = 0
+        next_send = time.time()
+        next_hb = time.time() + self.heartbeat
+
+        while not self.stop_event.is_set():
+            try:
+                if self.sock is None:
+                    self.sock = self._connect()
+
+                now = time.time()
+                if now >= next_hb:
+                    hb = {"timestamp": now, "app_name": self.app_name, "blocked_stats": {}}
+                    self.sock.sendall(pack_packet(TYPE_HEARTBEAT, json.dumps(hb).encode('utf-8')))
+                    next_hb = now + self.heartbeat
+
+                prefix = f"{now:.4f} {self.app_id} "
+                batch = []
+                for _ in range(self.batch_size):
+                    batch.append(prefix + pool[cursor])
+                    cursor = (cursor + 1) % len(pool)
+                frame = pack_packet(TYPE_LOG_DATA, json.dumps({"log": batch, "type": "compress"}).encode('utf-8'))
+                self.sock.sendall(frame)
+                self.sent_records += len(batch)
+                self.sent_bytes += len(frame)
+                self.sent_frames += 1
+                self._drain(self.sock)
+
+                if interval:
+                    next_send += interval
+                    delay = next_send - time.time()
+                    if delay > 0: self.stop_event.wait(delay)
+                    else: next_send = time.time()
+            except (OSError, ConnectionError):
+                if self.sock is not None:
+                    if not self.stop_event.is_set(): self.dropped += 1
+                    try:
+                        self.sock.close()
+                    except OSError:
+                        pass
+                else:
+                    self.connect_failures += 1
+                self.sock = None
+                self.stop_event.wait(0.2)
+
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+
+    def stop(self):
+        # Unblocks a sendall() stuck behind a saturated manager
+        sock = self.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def start_local_manager(engine=None):
+    """
+    Starts an ingest server in this process on an ephemeral port, writing to a
+    temporary storage root. Returns (address, server).
+    """
+    from .storage import get_storage
+    from .server import create_server
+    get_storage().root_dir = tempfile.mkdtemp(prefix="logfun_loadgen_")
+    server = create_server("127.0.0.1", 0, engine=engine)
+    threading.Thread(target=server.serve_forever, daemon=True, name="LoadGen-Manager").start()
+    return server.server_address, server
+
+
+def process_cpu(pids):
+    """
+    User + system CPU seconds of running processes, read from /proc (Linux).
+    None if any of them cannot be read.
+    """
+    total = 0.0
+    tick = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat", 'r') as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            total += (int(fields[11]) + int(fields[12])) / tick
+        except (OSError, IndexError, ValueError):
+            return None
+    return total
+
+
+def fetch_status(url):
+    try:
+        with urllib.request.urlopen(url, timeout=2.0) as resp:
+            return json.loads(resp.read().decode('utf-8'))
+    except Exception:
+        return None
+
+
+def run_load(opts):
+    local = opts.target == ""
+    server = None
+    if local:
+        from .stats import get_monitor
+        address, server = start_local_manager(opts.engine)
+        monitor = get_monitor()
+        read_status = monitor.get_snapshot
+    else:
+        host, port = opts.target.rsplit(":", 1)
+        address = (host, int(port))
+        status_url = opts.status_url or f"http://{host}:9998/api/status"
+        read_status = lambda: fetch_status(status_url)
+
+    profile = TrafficProfile(functions=opts.functions, templates=opts.templates, skew=opts.skew, var_cardinality=opts.var_cardinality, vars_per_tpl=opts.vars_per_tpl, var_len=opts.var_len)
+    stop_event = threading.Event()
+    agents = [SimulatedAgent(i, address, f"{opts.app_prefix}_{i % opts.apps}", profile, opts.rate, opts.batch, opts.heartbeat, stop_event) for i in range(opts.agents)]
+
+    print(f"=== LogFun Ingest Load ({opts.agents} agents x {opts.rate} rec/s, {opts.apps} apps, {opts.duration}s) -> {address[0]}:{address[1]} ===")
+    for a in agents:
+        a.start()
+
+    # Let connections and handshakes settle before measuring
+    time.sleep(min(2.0, opts.duration / 5))
+    status_start = read_status() or {}
+    sent_start = sum(a.sent_records for a in agents)
+    # Cluster workers are separate processes still running, so os.times() misses them
+    worker_pids = []
+    if local:
+        from .cluster import ClusterServer
+        if isinstance(server, ClusterServer): worker_pids = [proc.pid for proc, _, _ in server.workers]
+    cpu_start = os.times()
+    workers_start = process_cpu(worker_pids)
+    t_start = time.time()
+
+    time.sleep(opts.duration)
+
+    elapsed = time.time() - t_start
+    cpu_end = os.times()
+    workers_end = process_cpu(worker_pids)
+    sent_end = sum(a.sent_records for a in agents)
+    status_end = read_status() or {}
+    stop_event.set()
+    for a in agents:
+        a.stop()
+    for a in agents:
+        a.join(timeout=2.0)
+
+    cpu = (cpu_end.user - cpu_start.user) + (cpu_end.system - cpu_start.system)
+    cpu_complete = not worker_pids or (workers_start is not None and workers_end is not None)
+    if worker_pids and cpu_complete: cpu += workers_end - workers_start
+    report = {
+        "engine": (opts.engine or "config") if local else "remote",
+        "agents": opts.agents,
+        "apps": opts.apps,
+        "duration": round(elapsed, 3),
+        "offered_rps": round((sent_end - sent_start) / elapsed, 1),
+        "sent_bytes": sum(a.sent_bytes for a in agents),
+        "dropped_connections": sum(a.dropped for a in agents),
+        "connect_failures": sum(a.connect_failures for a in agents),
+        "cpu_percent": round(cpu / elapsed * 100, 1),
+        "cpu_includes_generator": local,
+        # False: cluster worker CPU could not be read, cpu_percent covers this process only
+        "cpu_complete": cpu_complete,
+    }
+    if "total_logs" in status_end and "total_logs" in status_start:
+        report["ingest_rps"] = round((status_end["total_logs"] - status_start["total_logs"]) / elapsed, 1)
+    if status_end.get("stages"):
+        report["stages"] = status_end["stages"]
+    if status_end.get("connections"):
+        report["server_connections"] = status_end["connections"]
+
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="LogFun manager ingest load generator")
+    parser.add_argument("--target", default="", help="host:port of a running manager (default: start one in-process)")
+    parser.add_argument("--engine", default="", choices=["", "threaded", "asyncio", "cluster"], help="in-process server engine (default: server_config.json)")
+    parser.add_argument("--status-url", default="", help="manager /api/status URL when using --target")
+    parser.add_argument("--agents", type=int, default=10)
+    parser.add_argument("--apps", type=int, default=1, help="spread agents over this many app names")
+    parser.add_argument("--app-prefix", default="loadgen_app")
+    parser.add_argument("--rate", type=float, default=1000, help="records/s per agent (0 = as fast as possible)")
+    parser.add_argument("--batch", type=int, default=100, help="records per LOG_DATA frame")
+    parser.add_argument("--heartbeat", type=float, default=5.0)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--functions", type=int, default=20)
+    parser.add_argument("--templates", type=int, default=3)
+    parser.add_argument("--skew", type=float, default=1.1, help="zipf exponent of function popularity")
+    parser.add_argument("--var-cardinality", type=int, default=50, help="distinct variable values (0 = all unique)")
+    parser.add_argument("--vars-per-tpl", type=int, default=2)
+    parser.add_argument("--var-len", type=int, default=8)
+    parser.add_argument("--json", default="", help="write the report to this file")
+    opts = parser.parse_args(argv)
+
+    report = run_load(opts)
+    print(json.dumps(report, indent=2))
+    if opts.json:
+        with open(opts.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,382 @@
+"""
+Downsampled ingest history per app and function, for the dashboard.
+
+Every series keeps records, bytes, blocked records (agent-reported, see
+StorageManager.update_stats) and mute events at three resolutions: 1 s for
+the last 10 minutes, 1 min for the last day and 1 h for the last 30 days.
+Each resolution is a ring of at most that many points, allocated as points
+arrive, so a series never grows past ~110 KB and a quiet one stays small.
+
+An app has a total series, one series per function for its `top_functions`
+busiest functions and an "_other" series for the rest, so memory is bounded
+by max_apps * (top_functions + 2) series however many functions are traced.
+Once the slots are taken, a function is promoted when it logs more than
+twice as much in a minute as the weakest tracked one, or when a tracked one
+has been idle for an hour; the evicted series is added into "_other", so
+total = functions + _other at any time. Apps beyond max_apps share "_other".
+
+The store is saved to <storage.root_dir>/_metrics.json every
+metrics.persist_interval seconds and loaded back on start.
+"""
+import os
+import json
+import time
+import atexit
+import threading
+from array import array
+from collections import deque
+from .config import get_config
+
+METRICS_FILE = "_metrics.json"
+OTHER = "_other"
+FIELDS = ("records", "bytes", "blocked", "mutes")
+# (seconds per point, points kept)
+RESOLUTIONS = ((1, 600), (60, 1440), (3600, 720))
+MAX_POINTS = 1000
+IDLE_EVICT = 3600
+EVENTS_KEPT = 200
+
+
+class Rollup:
+    """
+    One resolution of a series: a ring of up to `size` points of `step`
+    seconds. The ring starts empty and doubles while the points it holds
+    span more slots than it has, so a quiet series stays small.
+    """
+    __slots__ = ("step", "size", "slots", "values")
+
+    def __init__(self, step, size):
+        self.step = step
+        self.size = size
+        self.slots = array('q')
+        self.values = array('q')
+
+    def _at(self, slot):
+        cap = len(self.slots)
+        if cap:
+            i = slot % cap
+            old = self.slots[i]
+            if old == slot: return i * len(FIELDS)
+        if not cap or old != -1 and abs(slot - old) < self.size:
+            # The point there is still in the window: make room instead
+            self._grow(slot)
+            i = slot % len(self.slots)
+        self.slots[i] = slot
+        base = i * len(FIELDS)
+        for f in range(len(FIELDS)):
+            self.values[base + f] = 0
+        return base
+
+    def _grow(self, slot):
+        """Re-slot the points still in the window into a ring where they and `slot` all fit."""
+        n = len(FIELDS)
+        newest = max(max(self.slots, default=slot), slot)
+        live = [(s, self.values[i * n:(i + 1) * n]) for i, s in enumerate(self.slots) if s != -1 and newest - self.size < s <= newest]
+        wanted = [s for s, _ in live] + [slot]
+        cap = max(8, len(self.slots) * 2)
+        while cap < self.size and len({s % cap for s in wanted}) < len(wanted):
+            cap *= 2
+        cap = min(cap, self.size)
+        self.slots = array('q', [-1]) * cap
+        self.values = array('q', [0]) * (cap * n)
+        for s, counts in live:
+            i = s % cap
+            self.slots[i] = s
+            self.values[i * n:(i + 1) * n] = counts
+
+    def add(self, ts, counts):
+        base = self._at(int(ts // self.step))
+        for f, v in enumerate(counts):
+            if v: self.values[base + f] += v
+
+    def get(self, slot):
+        if not self.slots: return (0, ) * len(FIELDS)
+        i = slot % len(self.slots)
+        if self.slots[i] != slot: return (0, ) * len(FIELDS)
+        base = i * len(FIELDS)
+        return tuple(self.values[base:base + len(FIELDS)])
+
+    def points(self, now):
+        """(slot start time, counts) of the points still in the window, unordered."""
+        newest = int(now // self.step)
+        for i, slot in enumerate(self.slots):
+            if newest - self.size < slot <= newest:
+                base = i * len(FIELDS)
+                yield slot * self.step, self.values[base:base + len(FIELDS)]
+
+    def merge(self, other, now):
+        for t, counts in other.points(now):
+            self.add(t, counts)
+
+    def to_list(self, now):
+        return [[int(t // self.step)] + list(c) for t, c in self.points(now) if any(c)]
+
+    def load_list(self, points):
+        for p in points:
+            self.add(p[0] * self.step, p[1:1 + len(FIELDS)])
+
+
+class Series:
+    __slots__ = ("rollups", "last_seen")
+
+    def __init__(self, created=0.0):
+        self.rollups = [Rollup(step, size) for step, size in RESOLUTIONS]
+        self.last_seen = created
+
+    def add(self, ts, counts):
+        for r in self.rollups:
+            r.add(ts, counts)
+        if counts[0] and ts > self.last_seen: self.last_seen = ts
+
+    def merge(self, other, now):
+        for mine, theirs in zip(self.rollups, other.rollups):
+            mine.merge(theirs, now)
+        self.last_seen = max(self.last_seen, other.last_seen)
+
+    def to_dict(self, now):
+        return {"last_seen": self.last_seen, "rollups": [r.to_list(now) for r in self.rollups]}
+
+    @classmethod
+    def from_dict(cls, data):
+        series = cls()
+        series.last_seen = float(data.get("last_seen", 0.0))
+        for r, points in zip(series.rollups, data.get("rollups", ())):
+            r.load_list(points)
+        return series
+
+
+class AppMetrics:
+    def __init__(self):
+        self.total = Series()
+        self.other = Series()
+        self.funcs = {}
+        # [records, overcount] per untracked function in the current minute, for promotion
+        self.minute = 0
+        self.candidates = {}
+        # Mute / unmute events: [ts, fid, tid, action, source]
+        self.events = deque(maxlen=EVENTS_KEPT)
+
+
+class MetricsStore:
+    def __init__(self, top_functions=20, max_apps=64, persist_interval=60.0):
+        self.top_functions = top_functions
+        self.max_apps = max_apps
+        self.persist_interval = persist_interval
+        # Defaults to the storage root_dir when the store is first used
+        self.root_dir = None
+        self.apps = {}
+        # Called before queries and saves to push pending counts in (LogMonitor.fold_shards)
+        self.sources = []
+        self.lock = threading.Lock()
+        self._thread = None
+
+    # --- Recording ---
+
+    def _app(self, app_name):
+        """AppMetrics for app_name; caller holds the lock."""
+        app = self.apps.get(app_name)
+        if app is None:
+            if len(self.apps) - (OTHER in self.apps) >= self.max_apps: app_name = OTHER
+            app = self.apps.get(app_name)
+            if app is None: app = self.apps[app_name] = AppMetrics()
+        return app
+
+    def _series(self, app, fid, ts, records):
+        """Series a function's counts go to; caller holds the lock."""
+        if fid is None: return app.other
+        series = app.funcs.get(fid)
+        if series is not None: return series
+        minute = int(ts // 60)
+        if minute != app.minute:
+            self._rebalance(app, minute, ts)
+            # The rebalance may just have promoted this function
+            series = app.funcs.get(fid)
+            if series is not None: return series
+        if len(app.funcs) < self.top_functions:
+            series = app.funcs[fid] = Series(ts)
+            return series
+        candidates = app.candidates
+        c = candidates.get(fid)
+        if c is not None: c[0] += records
+        elif len(candidates) < self.top_functions * 4: candidates[fid] = [records, 0]
+        else:
+            # Space-saving: the new function takes over the smallest count, which
+            # is then its possible overcount
+            low = min(candidates, key=lambda f: candidates[f][0])
+            n = candidates.pop(low)[0]
+            candidates[fid] = [n + records, n]
+        return app.other
+
+    def _rebalance(self, app, minute, now):
+        """Once a minute: free idle slots and promote the busiest untracked functions."""
+        prev, last = app.candidates, app.minute
+        app.candidates, app.minute = {}, minute
+        for fid, series in list(app.funcs.items()):
+            if now - series.last_seen > IDLE_EVICT:
+                app.other.merge(app.funcs.pop(fid), now)
+        minute_count = lambda f: app.funcs[f].rollups[1].get(last)[0]
+        promoted = set()
+        for fid, count in sorted(((f, n - err) for f, (n, err) in prev.items()), key=lambda c: -c[1]):
+            if count <= 0: break
+            if len(app.funcs) >= self.top_functions:
+                weakest = min((f for f in app.funcs if f not in promoted), key=minute_count, default=None)
+                if weakest is None or count <= 2 * minute_count(weakest): break
+                app.other.merge(app.funcs.pop(weakest), now)
+            app.funcs[fid] = Series(now)
+            promoted.add(fid)
+
+    def observe_traffic(self, sec, apps):
+        """One second of ingest: {app: [records, bytes, {fid: [records, bytes]}]}."""
+        self._ensure_started()
+        with self.lock:
+            for app_name, (n, b, funcs) in apps.items():
+                app = self._app(app_name)
+                app.total.add(sec, (n, b, 0, 0))
+                for fid, (fn, fb) in funcs.items():
+                    self._series(app, fid, sec, fn).add(sec, (fn, fb, 0, 0))
+
+    def observe_blocked(self, app_name, stats_dict, ts=None):
+        """Agent-reported blocked counts, keyed "fid" or "fid:tid"."""
+        ts = time.time() if ts is None else ts
+        per_fid = {}
+        for key, v in stats_dict.items():
+            fid = str(key).split(':', 1)[0]
+            per_fid[fid] = per_fid.get(fid, 0) + int(v)
+        self._ensure_started()
+        with self.lock:
+            app = self._app(app_name)
+            for fid, v in per_fid.items():
+                app.total.add(ts, (0, 0, v, 0))
+                series = app.funcs.get(fid, app.other)
+                series.add(ts, (0, 0, v, 0))
+
+    def observe_control(self, app_name, fid, tid, enable, source, ts=None):
+        ts = time.time() if ts is None else ts
+        fid = str(fid)
+        self._ensure_started()
+        with self.lock:
+            app = self._app(app_name)
+            app.events.append([ts, fid, None if tid is None else str(tid), "unmute" if enable else "mute", source])
+            if enable: return
+            app.total.add(ts, (0, 0, 0, 1))
+            app.funcs.get(fid, app.other).add(ts, (0, 0, 0, 1))
+
+    # --- Queries ---
+
+    def query(self, app_name, fid=None, start=None, end=None, step=None):
+        """
+        Points [t, records, bytes, blocked, mutes] of an app's series in
+        [start, end], `step` seconds apart (rounded to a stored resolution,
+        at most MAX_POINTS points), plus the tracked functions and the mute
+        events in the range. fid None is the app total, "_other" the
+        untracked functions.
+        """
+        self._pull()
+        now = time.time()
+        end = now if end is None else min(float(end), now)
+        start = end - 600 if start is None else max(float(start), now - RESOLUTIONS[-1][0] * RESOLUTIONS[-1][1])
+        if start > end: start = end
+        # Finest resolution that still covers `start`
+        for res, (res_step, size) in enumerate(RESOLUTIONS):
+            if now - res_step * size <= start + res_step: break
+        else:
+            res, (res_step, size) = len(RESOLUTIONS) - 1, RESOLUTIONS[-1]
+        step = max(res_step, int(step or res_step) // res_step * res_step)
+        while (end - start) / step > MAX_POINTS:
+            step *= 2
+        first = int(start // step) * step
+        buckets = {}
+        with self.lock:
+            app = self.apps.get(app_name)
+            if app is None: series = None
+            elif fid is None or fid == "": series = app.total
+            elif fid == OTHER: series = app.other
+            else: series = app.funcs.get(str(fid))
+            if series is not None:
+                for t, counts in series.rollups[res].points(now):
+                    if t + res_step <= start or t > end: continue
+                    b = buckets.get(int(t // step) * step)
+                    if b is None: b = buckets[int(t // step) * step] = [0] * len(FIELDS)
+                    for f, v in enumerate(counts):
+                        b[f] += v
+            tracked = sorted(app.funcs) if app is not None else []
+            events = [e for e in app.events if start <= e[0] <= end and (fid in (None, "") or e[1] == str(fid))] if app is not None else []
+        points = []
+        t = first
+        while t <= end:
+            points.append([t] + buckets.get(t, [0] * len(FIELDS)))
+            t += step
+        return {"app": app_name, "fid": fid, "from": start, "to": end, "step": step, "fields": ["t"] + list(FIELDS), "tracked": series is not None, "functions": tracked, "points": points, "events": events}
+
+    # --- Persistence ---
+
+    def _path(self):
+        root = self.root_dir
+        if root is None:
+            from .storage import get_storage
+            root = get_storage().root_dir
+        return os.path.join(root, METRICS_FILE)
+
+    def _pull(self):
+        for source in self.sources:
+            source()
+
+    def save(self):
+        self._pull()
+        now = time.time()
+        with self.lock:
+            if not self.apps: return
+            data = {"saved": now, "apps": {
+                name: {"total": app.total.to_dict(now), "other": app.other.to_dict(now), "functions": {fid: s.to_dict(now) for fid, s in app.funcs.items()}, "events": list(app.events)}
+                for name, app in self.apps.items()
+            }}
+        path = self._path()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(path + ".tmp", path)
+
+    def _load(self):
+        """Merge the saved store into this one, if there is one; caller holds the lock."""
+        try:
+            with open(self._path(), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        for name, saved in data.get("apps", {}).items():
+            app = self.apps.get(name)
+            if app is None: app = self.apps[name] = AppMetrics()
+            app.total = Series.from_dict(saved.get("total", {}))
+            app.other = Series.from_dict(saved.get("other", {}))
+            for fid, s in list(saved.get("functions", {}).items())[:self.top_functions]:
+                app.funcs[fid] = Series.from_dict(s)
+            app.events.extend(saved.get("events", ()))
+
+    def _ensure_started(self):
+        """On first use, load the saved store and start saving it periodically."""
+        if self._thread is not None: return
+        with self.lock:
+            if self._thread is not None: return
+            self._load()
+            self._thread = threading.Thread(target=self._persist_loop, daemon=True, name="LogFun-Metrics")
+            self._thread.start()
+        atexit.register(self._save_quietly)
+
+    def _save_quietly(self):
+        try:
+            self.save()
+        except OSError as e:
+            print(f"[LogFun-Manager] Metrics save error: {e}")
+
+    def _persist_loop(self):
+        while True:
+            time.sleep(self.persist_interval)
+            self._save_quietly()
+
+
+_cfg = get_config().get("metrics") or {}
+_metrics = MetricsStore(int(_cfg.get("top_functions", 20)), int(_cfg.get("max_apps", 64)), float(_cfg.get("persist_interval", 60.0)))
+
+
+def get_metrics():
+    return _metrics
@@ -0,0 +1,86 @@
+"""
+Single-pass parsing of ingested records.
+
+A compressed record is "<ts> <app_id> <fid> <dur> <meta> <vars>", where meta
+is the JSON list [[level, tid], ...] and vars the JSON list of values; a
+"normal" record is one JSON object (core/logger.py). parse_frame() reads
+each record of a frame once into a ParsedRecord, which the balancer,
+monitor, writer and indexers all use instead of splitting the line again.
+Variable values are only decoded on demand (ParsedRecord.values()).
+"""
+import re
+import json
+
+_raw_decode = json.JSONDecoder().raw_decode
+_skip_ws = re.compile(r'\s*').match
+
+# Template ids in the [[level, tid], ...] meta of a compressed record
+TID_RE = re.compile(r'(\d+)\]')
+
+
+class ParsedRecord:
+    """
+    One record as stored: `line` (stripped, newline-terminated), `ts` (float
+    or None), `fid` (str or None) and `tids` (tuple of str).
+    """
+    __slots__ = ("line", "ts", "fid", "tids", "vars_at", "_values")
+
+    def __init__(self, line, ts=None, fid=None, tids=()):
+        self.line = line
+        self.ts = ts
+        self.fid = fid
+        self.tids = tids
+        # Offset of the vars JSON in `line`, -1 if there is none
+        self.vars_at = -1
+        self._values = None
+
+    def vars_text(self):
+        """Raw JSON text of the variable values, or None."""
+        if self.vars_at < 0: return None
+        return self.line[self.vars_at:].strip()
+
+    def values(self):
+        """Decoded variable values; [] if there are none or they do not parse."""
+        if self._values is None:
+            self._values = []
+            if self.vars_at >= 0:
+                try:
+                    values, _ = _raw_decode(self.line, _skip_ws(self.line, self.vars_at).end())
+                    if isinstance(values, list): self._values = values
+                except ValueError:
+                    pass
+        return self._values
+
+
+def parse_record(text, log_type="compress"):
+    """ParsedRecord of one raw record; fields that do not parse stay None."""
+    line = str(text).strip()
+    rec = ParsedRecord(line + "\n")
+    try:
+        if log_type == "normal" or line.startswith('{'):
+            obj = json.loads(line)
+            fid, tid = obj.get("fid"), obj.get("tid")
+            if fid is not None: rec.fid = str(fid)
+            if tid is not None: rec.tids = (str(tid), )
+            return rec
+        a = line.index(' ')
+        try:
+            rec.ts = float(line[:a])
+        except ValueError:
+            pass
+        b = line.index(' ', a + 1)
+        c = line.index(' ', b + 1)
+        d = line.index(' ', c + 1)
+        # Levels are plain strings, so the meta list ends at the first "]]"
+        end = line.index(']]', d) + 2
+        rec.tids = tuple(TID_RE.findall(line, d, end))
+        rec.fid = line[b + 1:c]
+        rec.vars_at = end
+    except (ValueError, AttributeError):
+        pass
+    return rec
+
+
+def parse_frame(raws, log_type="compress"):
+    """ParsedRecords of a frame's raw records, in order."""
+    return [parse_record(raw, log_type) for raw in raws]
@@ -0,0 +1,349 @@
+"""
+Offline replay of traffic through the balancer strategies.
+
+Feeds stored app logs, or synthetic traffic profiles, through a LogBalancer
+on a virtual clock: no manager, sockets or sleeping, so an hour of traffic
+replays in seconds. Simulated agents drop the records of muted templates
+(and sample as told) from their next heartbeat on and report the drops as
+blocked, as real agents do. For each strategy it reports the mute
+decisions, time-to-detect and false mutes (synthetic profiles know which
+template misbehaves and from when), and the CPU time and memory of
+record/analyze per million records.
+
+    # Every strategy against one profile
+    python -m LogFun.manager.replay --profile spam
+
+    # Tune: override strategy parameters
+    python -m LogFun.manager.replay --profile busy --strategy ewma,cusum --set cusum.threshold=6
+
+    # Stored logs of an app (only what was not muted at the time is stored)
+    python -m LogFun.manager.replay --app shop --from 1700000000 --to 1700003600
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+from .config import get_config
+from . import balancer as balancer_module, sketch as sketch_module
+from .balancer import LogBalancer, STRATEGIES
+from .parser import parse_record
+
+
+class VirtualClock:
+    """Injectable clock (see LogBalancer); time only moves when set."""
+
+    def __init__(self, now=0.0):
+        self.now = float(now)
+
+    def __call__(self):
+        return self.now
+
+
+class ReplayStorage:
+    """
+    Stand-in for the storage side of the balancer: keeps the current mutes
+    and sampling rates per app and logs every decision with its time.
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.mutes = {}
+        self.rates = {}
+        self.events = []
+
+    def get_app_config(self, app_name):
+        return {"functions": {}}
+
+    def apply_mutes(self, app_name, mutes, unmutes=(), source="balancer"):
+        current = self.mutes.setdefault(app_name, {})
+        muted, unmuted = [], []
+        for key, rate in mutes.items():
+            if key in current: continue
+            current[key] = rate
+            muted.append(key)
+            self.events.append({"t": self.clock(), "action": "mute", "key": key, "rate": rate})
+        for key in unmutes:
+            if current.pop(key, None) is None: continue
+            unmuted.append(key)
+            self.events.append({"t": self.clock(), "action": "unmute", "key": key})
+        return muted, unmuted
+
+    def apply_sampling(self, app_name, rates, tolerance=0.02):
+        self.rates[app_name] = {k: r for k, r in rates.items() if r < 1}
+
+
+class ReplayMonitor:
+    def __init__(self):
+        self.shed = 0
+
+    def observe_analysis(self, app_name, seconds, mutes):
+        pass
+
+    def observe_shed(self, app_name, records):
+        self.shed += records
+
+
+class Template:
+    """
+    Synthetic traffic of one key: `rate(sec)` records/s with Poisson noise
+    (or `noise` times the rate as standard deviation), whose values repeat
+    from `cardinality` choices (0 = all distinct).
+    """
+
+    def __init__(self, key, rate, cardinality=50, noise=0.0):
+        self.key = key
+        self.rate = rate
+        self.cardinality = cardinality
+        self.noise = noise
+
+    def count(self, sec, rnd):
+        r = self.rate(sec)
+        if r <= 0: return 0
+        return max(0, int(round(rnd.gauss(r, self.noise * r if self.noise else r**0.5))))
+
+    def value(self, rnd):
+        if self.cardinality: return [rnd.randrange(self.cardinality)]
+        return [rnd.getrandbits(48)]
+
+
+class SyntheticProfile:
+    """Templates plus the keys that misbehave and the second they start ({key: onset})."""
+
+    def __init__(self, name, description, templates, expect=None, duration=300):
+        self.name = name
+        self.description = description
+        self.templates = templates
+        self.expect = expect or {}
+        self.duration = duration
+
+    def seconds(self, uses_vars, seed=1):
+        """Yields (sec, {key: [vars, ...]}) for every second, vars None unless `uses_vars`."""
+        rnd = random.Random(seed)
+        for sec in range(self.duration):
+            traffic = {}
+            for t in self.templates:
+                n = t.count(sec, rnd)
+                if n: traffic[t.key] = [t.value(rnd) for _ in range(n)] if uses_vars else [None] * n
+            yield EPOCH + sec, traffic
+
+
+ONSET = 120
+# Synthetic traffic starts at this epoch second (mute backoff compares against time 0)
+EPOCH = 1700000000
+
+
+def _background(n=20, top=100.0, cardinality=50, noise=0.0):
+    return [Template((i, i), lambda s, r=top / i: r, cardinality, noise) for i in range(1, n + 1)]
+
+
+def _profiles():
+    bg = _background
+    return {
+        "steady": SyntheticProfile("steady", "20 templates at steady zipf rates, nothing to mute", bg()),
+        "spam": SyntheticProfile("spam", "one template jumps from 5/s to 400/s of 5 repeating values", bg() + [Template((21, 21), lambda s: 400.0 if s >= ONSET else 5.0, 5)], {(21, 21): ONSET}),
+        "burst": SyntheticProfile("burst", "one template jumps from 5/s to 400/s of distinct values (informative, keep)", bg() + [Template((21, 21), lambda s: 400.0 if s >= ONSET else 5.0, 0)]),
+        "busy": SyntheticProfile("busy", "20 templates at 150-250/s with 30% noise; one goes 4x", [Template((i, i), lambda s, i=i: (150.0 + 5 * i) * (4 if i == 1 and s >= ONSET else 1), 50, 0.3) for i in range(1, 21)], {(1, 1): ONSET}),
+        "ramp": SyntheticProfile("ramp", "one template ramps from 5/s to 300/s over two minutes", bg() + [Template((21, 21), lambda s: 5.0 + 295.0 * min(1.0, max(0, s - ONSET) / 120), 5)], {(21, 21): ONSET}),
+    }
+
+
+PROFILES = _profiles()
+
+
+class StoredLogs:
+    """Records of a stored app between `start` and `end`, per second of their timestamps."""
+
+    def __init__(self, app_name, start=None, end=None):
+        self.app_name = app_name
+        self.start = start
+        self.end = end
+        # Nobody knows which mutes are right
+        self.expect = None
+
+    def seconds(self, uses_vars, seed=1):
+        from .storage import get_storage
+        from .balancer import frame_items
+        sec, traffic = None, {}
+        for line in get_storage().get_segments(self.app_name).iter_lines(self.start, self.end):
+            rec = parse_record(line)
+            if rec.ts is None: continue
+            if sec is not None and int(rec.ts) != sec:
+                yield sec, traffic
+                traffic = {}
+            sec = int(rec.ts)
+            for key, values, _ in frame_items([rec], uses_vars):
+                traffic.setdefault(key, []).append(values)
+        if sec is not None: yield sec, traffic
+
+
+def _key_text(key):
+    fid, tid = key
+    return str(fid) if tid is None else f"{fid}:{tid}"
+
+
+def replay(source, name, params, app="replay", interval=None, heartbeat=5.0, frame=100, seed=1, memory=False):
+    """
+    Replays `source` (a SyntheticProfile or StoredLogs) through strategy
+    `name`. With `memory`, tracemalloc measures the balancer's state at
+    the end and the peak (slower; the CPU times of that run are not
+    meaningful). The peak also counts one second of replayed traffic, and
+    reading stored logs.
+    """
+    if memory: tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0] if memory else 0
+    clock = VirtualClock()
+    storage = ReplayStorage(clock)
+    balancer = LogBalancer(storage=storage, monitor=ReplayMonitor(), clock=clock)
+    strategy = balancer.strategy = STRATEGIES[name](params, clock)
+    interval = float(interval or balancer.config.algo_config.get("interval", 5.0))
+    rnd = random.Random(seed)
+    records = 0
+    t_record = t_analyze = 0.0
+    first = None
+    next_analysis = next_heartbeat = None
+    # What the agents apply (from their last heartbeat) and have dropped since
+    agent_mutes, agent_rates, blocked = set(), {}, {}
+
+    for sec, traffic in source.seconds(strategy.uses_vars, seed):
+        if first is None:
+            first = sec
+            next_analysis, next_heartbeat = sec + interval, sec + heartbeat
+        if sec >= next_heartbeat:
+            clock.now = float(sec)
+            if blocked: balancer.observe_blocked(app, {_key_text(k): n for k, n in blocked.items()})
+            blocked = {}
+            agent_mutes = set(storage.mutes.get(app, {}))
+            agent_rates = dict(storage.rates.get(app, {}))
+            next_heartbeat += heartbeat
+        items = []
+        for key, values in traffic.items():
+            n = len(values)
+            if key in agent_mutes:
+                blocked[key] = blocked.get(key, 0) + n
+                continue
+            rate = agent_rates.get(key)
+            if rate is not None:
+                kept = int(n * rate + rnd.random())
+                if kept < n: blocked[key] = blocked.get(key, 0) + n - kept
+                values = values[:kept]
+            items.extend((key, v, 64) for v in values)
+        rnd.shuffle(items)
+        # Frames spread over the second, as agents flush them
+        n_frames = max(1, (len(items) + frame - 1) // frame)
+        for i in range(n_frames):
+            chunk = items[i * frame:(i + 1) * frame]
+            if not chunk: break
+            clock.now = sec + i / n_frames
+            t0 = time.process_time()
+            strategy.record_many(app, clock.now, chunk)
+            t_record += time.process_time() - t0
+        records += len(items)
+        if sec + 1 >= next_analysis:
+            clock.now = float(sec + 1)
+            t0 = time.process_time()
+            balancer.run_analysis_cycle(app)
+            t_analyze += time.process_time() - t0
+            next_analysis += interval
+
+    report = {"strategy": name, "params": params, "records": records, "seconds": (sec - first + 1) if first is not None else 0}
+    report["events"] = [dict(e, t=round(e["t"] - first, 1), key=_key_text(e["key"])) for e in storage.events]
+    mutes = [e for e in report["events"] if e["action"] == "mute"]
+    report["detect"], report["false_mutes"] = {}, None
+    if source.expect is not None:
+        expect = {_key_text(k): onset for k, onset in source.expect.items()}
+        for key, onset in expect.items():
+            hit = next((e["t"] for e in mutes if e["key"] == key and e["t"] >= onset), None)
+            report["detect"][key] = None if hit is None else round(hit - onset, 1)
+        report["false_mutes"] = sum(1 for e in mutes if e["key"] not in expect or e["t"] < expect[e["key"]])
+    if storage.rates.get(app): report["sampling"] = {_key_text(k): round(r, 3) for k, r in storage.rates[app].items()}
+    per_m = 1e6 / records if records else 0.0
+    report["record_s_per_M"] = round(t_record * per_m, 3)
+    report["analyze_s_per_M"] = round(t_analyze * per_m, 3)
+    if memory:
+        # State: what the balancer code allocated and still holds (the
+        # process total would also count e.g. CPython's tuple free list)
+        code = [tracemalloc.Filter(True, balancer_module.__file__), tracemalloc.Filter(True, sketch_module.__file__)]
+        state = sum(t.size for t in tracemalloc.take_snapshot().filter_traces(code).traces)
+        report["state_kb"] = round(state / 1024, 1)
+        report["peak_kb"] = round((tracemalloc.get_traced_memory()[1] - base) / 1024, 1)
+        tracemalloc.stop()
+    return report
+
+
+def _parse_value(text):
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def _params(name, overrides):
+    params = dict(get_config().algo_config.get(name, {}))
+    for item in overrides:
+        target, _, value = item.partition("=")
+        strategy, _, field = target.partition(".")
+        if strategy == name and field: params[field] = _parse_value(value)
+    return params
+
+
+def print_report(reports):
+    print(f"{'strategy':<18}{'mutes':>6}{'false':>7}  {'time to detect':<22}{'record s/M':>11}{'analyze s/M':>12}{'state KB':>10}{'peak KB':>9}")
+    for r in reports:
+        detect = ", ".join(f"{k}={'missed' if v is None else f'{v:.0f}s'}" for k, v in r["detect"].items()) or "-"
+        mutes = sum(1 for e in r["events"] if e["action"] == "mute")
+        print(f"{r['strategy']:<18}{mutes:>6}{'-' if r['false_mutes'] is None else r['false_mutes']:>7}  {detect:<22}{r['record_s_per_M']:>11.2f}{r['analyze_s_per_M']:>12.3f}{r.get('state_kb', '-'):>10}{r.get('peak_kb', '-'):>9}")
+        for e in r["events"]:
+            rate = f" at {e['rate']:.1f} rec/s" if "rate" in e else ""
+            print(f"    t={e['t']:>7.1f}s {e['action']:<6} {e['key']}{rate}")
+        if r.get("sampling"): print(f"    sampling at the end: {r['sampling']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay stored or synthetic traffic through the balancer strategies on a virtual clock")
+    parser.add_argument("--profile", default="spam", choices=sorted(PROFILES), help="synthetic traffic profile")
+    parser.add_argument("--app", default="", help="replay this app's stored logs instead of a profile")
+    parser.add_argument("--from", dest="start", type=float, default=None, help="stored logs from (epoch seconds)")
+    parser.add_argument("--to", dest="end", type=float, default=None, help="stored logs to (epoch seconds)")
+    parser.add_argument("--strategy", default=",".join(STRATEGIES), help="comma-separated strategies to compare")
+    parser.add_argument("--set", action="append", default=[], metavar="STRATEGY.PARAM=VALUE", help="override a strategy parameter")
+    parser.add_argument("--duration", type=int, default=0, help="seconds of synthetic traffic (default: the profile's)")
+    parser.add_argument("--interval", type=float, default=0, help="analysis interval (default: algo_config.interval)")
+    parser.add_argument("--heartbeat", type=float, default=5.0, help="agent heartbeat: how soon mutes apply and drops are reported")
+    parser.add_argument("--frame", type=int, default=100, help="records per recorded frame")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run per strategy")
+    parser.add_argument("--json", default="", help="write the reports to this file")
+    opts = parser.parse_args(argv)
+
+    if opts.app:
+        source = StoredLogs(opts.app, opts.start, opts.end)
+        print(f"=== Balancer replay: stored logs of {opts.app} ===")
+    else:
+        source = PROFILES[opts.profile]
+        if opts.duration: source.duration = opts.duration
+        print(f"=== Balancer replay: {source.name} ({source.description}), {source.duration}s ===")
+
+    reports = []
+    for name in opts.strategy.split(","):
+        name = name.strip()
+        if name not in STRATEGIES:
+            parser.error(f"unknown strategy {name!r} (one of {', '.join(STRATEGIES)})")
+        params = _params(name, opts.set)
+        args = dict(interval=opts.interval, heartbeat=opts.heartbeat, frame=opts.frame, seed=opts.seed)
+        report = replay(source, name, params, **args)
+        if not opts.no_memory:
+            mem = replay(source, name, params, memory=True, **args)
+            report["state_kb"], report["peak_kb"] = mem["state_kb"], mem["peak_kb"]
+        reports.append(report)
+
+    print_report(reports)
+    if opts.json:
+        with open(opts.json, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, indent=2)
+    return reports
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
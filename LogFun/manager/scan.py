@@ -0,0 +1,183 @@
+"""
+Parallel scans for search and download.
+
+An app's segments are cut into scan units (AppSegments.plan_units): runs of
+blocks, or line-aligned byte ranges where there is no block table. Units are
+parsed, filtered and decoded in this process by default. With
+storage.scan_workers above 1 (0 = one per core), scans of at least
+storage.scan_parallel_bytes go to a process pool instead, and the matches
+are merged by timestamp. Units are planned in
+order of their earliest timestamp, so once unit i is done, every match
+older than unit i+1's earliest timestamp can be emitted; a search stops
+submitting work as soon as it has `limit` lines.
+
+Every record has a key (ts, segment, byte offset), which gives a total
+order; a search can resume after any key (encode_cursor / decode_cursor),
+reading only blocks that end at or after the key's timestamp.
+
+Like the cluster engine, the pool uses spawn, so a script starting the
+Manager needs an `if __name__ == "__main__":` guard when it is enabled.
+"""
+import os
+import json
+import heapq
+import base64
+import itertools
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from .config import get_config
+from .segments import read_unit, record_ts, overlaps
+
+
+def scan_unit(unit, decoder, spec, start=None, end=None, limit=0, after=None):
+    """
+    Matches of one unit as [(key, [line, ...]), ...] in key order, where key
+    is (ts, segment created, segment name, raw offset). Only matches after
+    the key `after` are kept, cut after the first `limit` decoded lines
+    (0 = all).
+    """
+    bounded = start is not None or end is not None
+    lo, created, name = unit["lo"], unit["created"], unit["seg"]
+    # Variable searches can rule out whole blocks by their raw text
+    literal = spec["literal"] if spec is not None and spec["type"] == 'variable' else None
+    out = []
+    for offset, chunk in read_unit(unit):
+        if literal is not None and literal not in chunk.lower(): continue
+        size = len if chunk.isascii() else (lambda t: len(t.encode('utf-8')))
+        lines = chunk.split('\n')
+        done = 0
+        for i, line in enumerate(lines):
+            if bounded:
+                ts = record_ts(line)
+                if ts is not None and not overlaps(ts, ts, start, end): continue
+            texts = decoder.match_line(line, spec)
+            if not texts: continue
+            if not bounded: ts = record_ts(line)
+            for j in range(done, i):
+                offset += size(lines[j]) + 1
+            done = i
+            key = (lo if ts is None else ts, created, name, offset)
+            if after is not None and key <= after: continue
+            out.append((key, texts))
+    out.sort(key=lambda m: m[0])
+    if limit:
+        count = 0
+        for i, (_, texts) in enumerate(out):
+            count += len(texts)
+            if count >= limit: return out[:i + 1]
+    return out
+
+
+def encode_cursor(key):
+    """Opaque resume token for the record `key` (see scan_unit)."""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(token):
+    """Key of a resume token. Raises ValueError if it is not one."""
+    try:
+        ts, created, name, offset = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        return (float(ts), float(created), str(name), int(offset))
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError("invalid cursor")
+
+
+def _scan_unit_task(unit, app_name, revision, config, spec, start, end, limit, after):
+    """Pool entry point. None means the unit's file is gone (compressed or expired)."""
+    from .decoder import LogDecoder
+    try:
+        return scan_unit(unit, LogDecoder(app_name, custom_config=config, revision=revision), spec, start, end, limit, after)
+    except FileNotFoundError:
+        return None
+
+
+class ParallelScanner:
+    def __init__(self, workers=1, unit_bytes=4194304, parallel_bytes=33554432):
+        self.workers = workers or os.cpu_count() or 1
+        self.unit_bytes = unit_bytes
+        # Smaller scans are not worth a round trip through the pool
+        self.parallel_bytes = parallel_bytes
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def _get_pool(self):
+        with self.lock:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self.pool
+
+    def scan(self, decoder, spec, start=None, end=None, limit=0, after=None):
+        """
+        Yields (key, lines) for each matching record of decoder's app, oldest
+        first, resuming after the record key `after` if given. spec comes from
+        decoder.search_spec(); None decodes everything.
+        """
+        segments = decoder.segments
+        fids = tids = tokens = None
+        if spec is not None: fids, tids, tokens = spec["fids"], spec["tids"], spec["tokens"]
+        # Blocks that ended before the resume point are not read again
+        since = start if after is None else max(after[0], start if start is not None else after[0])
+        units = segments.plan_units(since, end, fids, tids, tokens, self.unit_bytes)
+        if not units: return
+
+        def run_local(unit):
+            try:
+                return scan_unit(unit, decoder, spec, start, end, limit, after)
+            except FileNotFoundError:
+                return None
+
+        parallel = self.workers > 1 and len(units) > 1 and sum(u["raw_end"] - u["raw_start"] for u in units) >= self.parallel_bytes
+        if parallel:
+            pool = self._get_pool()
+            window = self.workers * 2
+            submit = lambda u: pool.submit(_scan_unit_task, u, decoder.app_name, decoder.revision, decoder.config, spec, start, end, limit, after)
+        pending = deque()
+        queued = iter(units)
+        heap, seq, emitted = [], itertools.count(), 0
+        try:
+            for i, unit in enumerate(units):
+                if parallel:
+                    while len(pending) < window:
+                        nxt = next(queued, None)
+                        if nxt is None: break
+                        pending.append(submit(nxt))
+                    matches = pending.popleft().result()
+                else:
+                    matches = run_local(unit)
+                if matches is None:
+                    fresh = segments.replan_unit(unit)
+                    matches = run_local(fresh) if fresh is not None else None
+                # Nothing in later units is older than the next unit's lower bound
+                bound = units[i + 1]["lo"] if i + 1 < len(units) else float('inf')
+                if matches and not heap and matches[-1][0][0] <= bound:
+                    # Common case: units do not overlap in time, emit as is
+                    for key, texts in matches:
+                        yield key, texts
+                        emitted += len(texts)
+                        if limit and emitted >= limit: return
+                    continue
+                for key, texts in matches or ():
+                    heapq.heappush(heap, (key, next(seq), texts))
+                while heap and heap[0][0][0] <= bound:
+                    key, _, texts = heapq.heappop(heap)
+                    yield key, texts
+                    emitted += len(texts)
+                    if limit and emitted >= limit: return
+        finally:
+            for f in pending:
+                f.cancel()
+
+    def shutdown(self):
+        with self.lock:
+            if self.pool is not None: self.pool.shutdown(wait=False)
+            self.pool = None
+
+
+_cfg = get_config().get("storage")
+_scanner = ParallelScanner(int(_cfg.get("scan_workers", 1)), int(_cfg.get("scan_unit_bytes", 4194304)), int(_cfg.get("scan_parallel_bytes", 33554432)))
+
+
+def get_scanner():
+    return _scanner
@@ -0,0 +1,562 @@
+"""
+Time/size partitioned log segments for one app.
+
+    <root>/<app>/manifest.json
+    <root>/<app>/segments/<app>-<created>-<seq>.log      active or sealed
+    <root>/<app>/segments/<app>-<created>-<seq>.log.gz   compressed
+
+The single writer of an app appends to the active segment and rotates it
+when the time window (segment_seconds) changes or it reaches segment_bytes.
+Each segment is cut into line-aligned blocks of about block_bytes; the
+manifest keeps, per block, [raw_offset, raw_length, first_ts, last_ts]
+and, once compressed, [comp_offset, comp_length]. Compression writes one
+gzip member per block, so the .gz stays a valid gzip file while any block
+can be read on its own.
+
+Each segment also has a sparse fid/tid -> blocks index (indexer.py) so
+function and template searches only read candidate blocks. When
+var_index is not "off", the compactor also gives every sealed segment a
+variable-token index (<segment>.bloom, plus <segment>.tok in "full" mode);
+the manifest records which mode a segment was indexed with.
+
+A pre-segment <app>.log is listed as a sealed "legacy" segment without
+blocks; it is read as-is and never compressed. `python -m
+LogFun.manager.indexer` gives it a block table and an index.
+"""
+import os
+import json
+import time
+import gzip
+import zlib
+import threading
+from .indexer import SegmentIndex, TokenIndex, rebuild_segment, rebuild_tokens
+
+SEGMENT_DIR = "segments"
+MANIFEST = "manifest.json"
+TAIL_CHUNK = 1 << 20
+
+# Block table columns
+B_RAW_OFF, B_RAW_LEN, B_FIRST, B_LAST, B_COMP_OFF, B_COMP_LEN = range(6)
+
+
+def record_ts(line):
+    """Leading epoch timestamp of a compressed record, or None."""
+    try:
+        return float(line[:line.index(' ')])
+    except ValueError:
+        return None
+
+
+def frame_bounds(records):
+    """(min_ts, max_ts) of a list of ParsedRecords; ingest time for records without one."""
+    lo = hi = None
+    for rec in records:
+        ts = rec.ts
+        if ts is None: continue
+        if lo is None or ts < lo: lo = ts
+        if hi is None or ts > hi: hi = ts
+    if lo is None:
+        lo = hi = time.time()
+    return lo, hi
+
+
+def overlaps(first, last, start, end):
+    if start is not None and last is not None and last < start: return False
+    if end is not None and first is not None and first > end: return False
+    return True
+
+
+class SegmentOptions:
+    def __init__(self, segment_seconds=3600, segment_bytes=268435456, block_bytes=65536, compress=False, retention_days=0, retention_bytes=0, var_index="off"):
+        self.segment_seconds = segment_seconds
+        self.segment_bytes = segment_bytes
+        self.block_bytes = block_bytes
+        self.compress = compress
+        self.retention_days = retention_days
+        self.retention_bytes = retention_bytes
+        self.var_index = var_index
+
+
+class AppSegments:
+    """
+    Segments and manifest of one app.
+
+    Writers call write() (always from the app's single AppLogWriter) and
+    maintain() from the background compactor. Readers use a separate instance
+    loaded from disk via open_reader(), so they also work in the coordinator
+    process of the cluster engine.
+    """
+
+    def __init__(self, app_dir, app_name, opts=None, writable=True):
+        self.app_dir = app_dir
+        self.app_name = app_name
+        self.opts = opts or SegmentOptions()
+        self.writable = writable
+        self.seg_dir = os.path.join(app_dir, SEGMENT_DIR)
+        self.manifest_path = os.path.join(app_dir, MANIFEST)
+        self.lock = threading.RLock()
+        self.segments = []
+        self.active = None
+        # Index of the active segment, built as frames are written
+        self.index = None
+        self.f = None
+        self.seq = 0
+        self.dirty = False
+        self.last_save = 0.0
+        self.load()
+
+    # --- Manifest ---
+
+    def load(self):
+        data = {}
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except:
+                data = {}
+        with self.lock:
+            self.segments = data.get("segments", [])
+            self.seq = data.get("seq", len(self.segments))
+
+            legacy = f"{self.app_name}.log"
+            if not any(s.get("legacy") for s in self.segments) and os.path.exists(os.path.join(self.app_dir, legacy)):
+                self.segments.insert(0, {"name": legacy, "file": legacy, "legacy": True, "state": "sealed", "created": 0, "start": None, "end": None, "records": None, "bytes": os.path.getsize(os.path.join(self.app_dir, legacy)), "blocks": []})
+                self.dirty = True
+            for seg in self.segments:
+                if seg.get("legacy") and not seg["blocks"]:
+                    index = SegmentIndex.load(self.index_path(seg))
+                    if index is not None and index.block_table: seg["blocks"] = index.block_table
+
+            if self.writable:
+                # An "active" segment on disk means the previous process stopped
+                # without sealing it; its tail may be missing from the block table.
+                for seg in self.segments:
+                    if seg["state"] == "active":
+                        # Block boundaries change with the rescan, so the index is rebuilt too
+                        self._rescan(seg)
+                        seg["state"] = "sealed"
+                        rebuild_segment(self, seg)
+                        self.dirty = True
+
+    def save(self, min_interval=0.0):
+        with self.lock:
+            if not self.dirty or time.time() - self.last_save < min_interval: return
+            payload = json.dumps({"app_name": self.app_name, "seq": self.seq, "segments": self.segments})
+            if self.index is not None and self.index.dirty: self.index.save(self.index_path(self.active))
+            self.dirty = False
+            self.last_save = time.time()
+            tmp = self.manifest_path + ".tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(payload)
+            os.replace(tmp, self.manifest_path)
+
+    def index_path(self, seg):
+        return os.path.join(self.seg_dir, seg["name"] + ".idx")
+
+    def token_base(self, seg):
+        return os.path.join(self.seg_dir, seg["name"])
+
+    def path_of(self, seg):
+        if seg.get("legacy"): return os.path.join(self.app_dir, seg["file"])
+        return os.path.join(self.seg_dir, seg["file"])
+
+    # --- Writing ---
+
+    def write(self, chunks):
+        """
+        Append buffered frames, each (text, records, first_ts, last_ts, fids,
+        tids) with newline-terminated records, to the active segment (rotating
+        first if needed). Frames are never split, so blocks stay line-aligned.
+        """
+        raws = [c[0].encode('utf-8') for c in chunks]
+        total = sum(len(r) for r in raws)
+        now = time.time()
+        if self.active is None or self._should_rotate(now, total):
+            self._rotate(now)
+        elif self.f is None:
+            self.f = open(self.path_of(self.active), 'ab')
+
+        seg = self.active
+        try:
+            self.f.write(b"".join(raws))
+            self.f.flush()
+        except OSError:
+            self._discard_tail(seg)
+            raise
+
+        with self.lock:
+            blocks = seg["blocks"]
+            offset = seg["bytes"]
+            for raw, (_, records, first_ts, last_ts, fids, tids) in zip(raws, chunks):
+                if blocks and blocks[-1][B_RAW_LEN] < self.opts.block_bytes:
+                    blk = blocks[-1]
+                    blk[B_RAW_LEN] += len(raw)
+                    if first_ts < blk[B_FIRST]: blk[B_FIRST] = first_ts
+                    if last_ts > blk[B_LAST]: blk[B_LAST] = last_ts
+                else:
+                    blocks.append([offset, len(raw), first_ts, last_ts])
+                self.index.add(len(blocks) - 1, fids, tids)
+                offset += len(raw)
+                seg["records"] += records
+                if seg["start"] is None or first_ts < seg["start"]: seg["start"] = first_ts
+                if seg["end"] is None or last_ts > seg["end"]: seg["end"] = last_ts
+            seg["bytes"] = seg["size"] = offset
+            self.dirty = True
+
+    def _discard_tail(self, seg):
+        """After a failed append: drop the handle and any partial frame, so a retry starts at the recorded end."""
+        try:
+            self.f.close()
+        except OSError:
+            pass
+        self.f = None
+        try:
+            os.truncate(self.path_of(seg), seg["bytes"])
+        except OSError:
+            pass
+
+    def _should_rotate(self, now, incoming):
+        seg = self.active
+        if seg["bytes"] and seg["bytes"] + incoming > self.opts.segment_bytes: return True
+        return int(now // self.opts.segment_seconds) != seg["window"]
+
+    def _rotate(self, now):
+        with self.lock:
+            if self.active is not None: self._seal_active()
+            os.makedirs(self.seg_dir, exist_ok=True)
+            self.seq += 1
+            name = f"{self.app_name}-{int(now)}-{self.seq}.log"
+            seg = {"name": name, "file": name, "state": "active", "created": now, "window": int(now // self.opts.segment_seconds), "start": None, "end": None, "records": 0, "bytes": 0, "size": 0, "blocks": []}
+            self.segments.append(seg)
+            self.active = seg
+            self.index = SegmentIndex()
+            self.f = open(self.path_of(seg), 'ab')
+            self.dirty = True
+        self.save()
+
+    def _seal_active(self):
+        seg = self.active
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+        if self.index is not None:
+            self.index.blocks = len(seg["blocks"])
+            self.index.save(self.index_path(seg))
+            self.index = None
+        seg["state"] = "sealed"
+        self.active = None
+        self.dirty = True
+
+    def close(self):
+        """Stop writing; the active segment is sealed so a restart starts a new one."""
+        with self.lock:
+            if self.active is not None: self._seal_active()
+        self.save()
+
+    def release(self):
+        """Close the active handle while idle; write() reopens it."""
+        with self.lock:
+            if self.f is not None:
+                self.f.close()
+                self.f = None
+
+    def _rescan(self, seg):
+        """Rebuild the block table of an uncompressed segment from its file."""
+        path = self.path_of(seg)
+        blocks, records, lo, hi = [], 0, None, None
+        if os.path.exists(path):
+            offset = 0
+            blk = None
+            with open(path, 'rb') as f:
+                for raw in f:
+                    ts = record_ts(raw.decode('utf-8', errors='replace'))
+                    if ts is None: ts = lo if lo is not None else os.path.getmtime(path)
+                    if blk is None or blk[B_RAW_LEN] >= self.opts.block_bytes:
+                        blk = [offset, 0, ts, ts]
+                        blocks.append(blk)
+                    blk[B_RAW_LEN] += len(raw)
+                    if ts < blk[B_FIRST]: blk[B_FIRST] = ts
+                    if ts > blk[B_LAST]: blk[B_LAST] = ts
+                    offset += len(raw)
+                    records += 1
+                    lo = ts if lo is None or ts < lo else lo
+                    hi = ts if hi is None or ts > hi else hi
+            seg["bytes"] = seg["size"] = offset
+        seg.update({"blocks": blocks, "records": records, "start": lo, "end": hi})
+        return seg
+
+    # --- Background maintenance ---
+
+    def maintain(self, now=None):
+        """Compress and index sealed segments, apply retention. Runs off the write path."""
+        now = now or time.time()
+        if self.opts.compress:
+            with self.lock:
+                pending = [s for s in self.segments if s["state"] == "sealed" and not s.get("legacy")]
+            for seg in pending:
+                try:
+                    self.compress(seg)
+                except OSError as e:
+                    print(f"[LogFun-Manager] Segment compression failed for {seg['name']}: {e}")
+        if self.opts.var_index != "off": self.index_tokens()
+        self.enforce_retention(now)
+        self.save()
+
+    def index_tokens(self):
+        """Build variable-token indexes for sealed segments that lack one for the current mode."""
+        mode = self.opts.var_index
+        with self.lock:
+            pending = [s for s in self.segments if s["state"] != "active" and s["blocks"] and s.get("var_index") not in (mode, "full")]
+        for seg in pending:
+            try:
+                rebuild_tokens(self, seg)
+            except OSError as e:
+                print(f"[LogFun-Manager] Value indexing failed for {seg['name']}: {e}")
+                continue
+            with self.lock:
+                seg["var_index"] = mode
+                self.dirty = True
+
+    def compress(self, seg):
+        src = self.path_of(seg)
+        dst_name = seg["name"] + ".gz"
+        dst = os.path.join(self.seg_dir, dst_name)
+        blocks = [list(b[:4]) for b in seg["blocks"]]
+        with open(src, 'rb') as fin, open(dst + ".tmp", 'wb') as fout:
+            for blk in blocks:
+                fin.seek(blk[B_RAW_OFF])
+                member = gzip.compress(fin.read(blk[B_RAW_LEN]), compresslevel=6, mtime=0)
+                blk.extend([fout.tell(), len(member)])
+                fout.write(member)
+            size = fout.tell()
+        os.replace(dst + ".tmp", dst)
+        with self.lock:
+            seg.update({"file": dst_name, "state": "compressed", "size": size, "blocks": blocks})
+            self.dirty = True
+        self.save()
+        os.remove(src)
+
+    def enforce_retention(self, now):
+        days = self.opts.retention_days
+        max_bytes = self.opts.retention_bytes
+        if not days and not max_bytes: return
+        with self.lock:
+            candidates = [s for s in self.segments if s["state"] != "active"]
+            doomed = []
+            if days:
+                cutoff = now - days * 86400
+                doomed = [s for s in candidates if (s["end"] if s["end"] is not None else s.get("created", 0)) < cutoff]
+            if max_bytes:
+                total = sum(s.get("size", s["bytes"]) for s in self.segments if s not in doomed)
+                for s in candidates:
+                    if total <= max_bytes: break
+                    if s in doomed: continue
+                    doomed.append(s)
+                    total -= s.get("size", s["bytes"])
+            for s in doomed:
+                self.segments.remove(s)
+                self.dirty = True
+        for s in doomed:
+            self._remove_files(s)
+
+    def _remove_files(self, seg):
+        if seg.get("legacy"):
+            base = self.token_base(seg)
+            paths = [self.path_of(seg), self.index_path(seg), base + ".bloom", base + ".tok"]
+        else:
+            paths = [os.path.join(self.seg_dir, n) for n in os.listdir(self.seg_dir) if n.startswith(seg["name"])] if os.path.isdir(self.seg_dir) else []
+        for p in paths:
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+    # --- Reading ---
+
+    def select(self, start=None, end=None):
+        """Segments whose time range overlaps [start, end], oldest first."""
+        with self.lock:
+            segs = [s for s in self.segments if overlaps(s["start"], s["end"], start, end) or s["state"] == "active"]
+        return sorted(segs, key=lambda s: (0 if s.get("legacy") else 1, s.get("created", 0)))
+
+    def read_block(self, seg, index, f=None):
+        """Raw bytes of one block. `f` is an already opened segment file."""
+        blk = seg["blocks"][index]
+        own = f is None
+        if own: f = open(self.path_of(seg), 'rb')
+        try:
+            if seg["state"] == "compressed":
+                f.seek(blk[B_COMP_OFF])
+                return zlib.decompress(f.read(blk[B_COMP_LEN]), 31)
+            f.seek(blk[B_RAW_OFF])
+            return f.read(blk[B_RAW_LEN])
+        finally:
+            if own: f.close()
+
+    def iter_blocks(self, seg, start=None, end=None, wanted=None):
+        """
+        Yields raw bytes of the segment's blocks overlapping [start, end]
+        (restricted to block indexes in `wanted` if given), followed by any
+        tail written after the manifest was last saved.
+        """
+        try:
+            f = open(self.path_of(seg), 'rb')
+        except FileNotFoundError:
+            # Compressed (or expired) since the manifest was read
+            fresh = self._refresh(seg)
+            if fresh is not None and fresh["file"] != seg["file"]:
+                yield from self.iter_blocks(fresh, start, end, wanted)
+            return
+        with f:
+            known = 0
+            for i, blk in enumerate(seg["blocks"]):
+                known = blk[B_RAW_OFF] + blk[B_RAW_LEN]
+                if wanted is not None and i not in wanted: continue
+                if not overlaps(blk[B_FIRST], blk[B_LAST], start, end): continue
+                yield self.read_block(seg, i, f)
+            if seg["state"] != "compressed":
+                f.seek(known)
+                carry = b""
+                while True:
+                    chunk = f.read(TAIL_CHUNK)
+                    if not chunk: break
+                    chunk = carry + chunk
+                    cut = chunk.rfind(b"\n") + 1
+                    carry = chunk[cut:]
+                    if cut: yield chunk[:cut]
+                if carry: yield carry
+
+    def _refresh(self, seg):
+        if not self.writable: self.load()
+        with self.lock:
+            for s in self.segments:
+                if s["name"] == seg["name"]: return s
+        return None
+
+    def candidate_blocks(self, seg, fids=None, tids=None, tokens=None):
+        """
+        Block indexes that may contain the given fids/tids and all of
+        `tokens`, or None when every block must be read (no filter, or no
+        index for the segment). An empty set skips the segment's known blocks.
+        """
+        wanted = None
+        if fids or tids:
+            index = self.index if seg is self.active else SegmentIndex.load(self.index_path(seg))
+            if index is not None:
+                wanted = index.lookup(fids, tids) | set(range(index.blocks, len(seg["blocks"])))
+        mode = seg.get("var_index")
+        if tokens and mode and self.opts.var_index != "off":
+            index = TokenIndex.load(self.token_base(seg), mode)
+            found = index.lookup(tokens) if index is not None else None
+            if found is not None:
+                wanted = found if wanted is None else wanted & found
+        return wanted
+
+    def plan_units(self, start=None, end=None, fids=None, tids=None, tokens=None, unit_bytes=4194304):
+        """
+        Split the segments overlapping [start, end] into independent scan
+        units of about unit_bytes raw data, for read_unit() in any process:
+        runs of candidate blocks, plus line-aligned byte ranges for data not
+        in a block table (legacy files, tails written since the last manifest
+        save). Each unit carries `lo`, a lower bound of its timestamps.
+        Records are identified across units by (ts, created, segment name,
+        raw byte offset).
+        """
+        units = []
+        for seg in self.select(start, end):
+            path = self.path_of(seg)
+            compressed = seg["state"] == "compressed"
+            wanted = self.candidate_blocks(seg, fids, tids, tokens)
+            run, run_bytes, known = [], 0, 0
+            for i, blk in enumerate(seg["blocks"]):
+                known = blk[B_RAW_OFF] + blk[B_RAW_LEN]
+                if wanted is not None and i not in wanted: continue
+                if not overlaps(blk[B_FIRST], blk[B_LAST], start, end): continue
+                if run and run_bytes + blk[B_RAW_LEN] > unit_bytes:
+                    units.append(self._block_unit(seg, path, compressed, run))
+                    run, run_bytes = [], 0
+                run.append((i, blk))
+                run_bytes += blk[B_RAW_LEN]
+            if run: units.append(self._block_unit(seg, path, compressed, run))
+            if compressed: continue
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            for off in range(known, size, unit_bytes):
+                units.append({"seg": seg["name"], "created": seg.get("created", 0), "path": path, "compressed": False, "blocks": None, "raw_start": off, "raw_end": min(off + unit_bytes, size), "lo": self._first_ts(path, off)})
+        return sorted(units, key=lambda u: u["lo"])
+
+    def _first_ts(self, path, offset):
+        """
+        Timestamp of the first record starting at or after offset, as the
+        lower bound of a byte range; only approximate, since records from
+        different agents may be slightly out of order.
+        """
+        try:
+            with open(path, 'rb') as f:
+                f.seek(max(offset - 1, 0))
+                if offset: f.readline()
+                ts = record_ts(f.readline(TAIL_CHUNK).decode('utf-8', errors='replace'))
+        except OSError:
+            ts = None
+        return float('-inf') if ts is None else ts
+
+    def _block_unit(self, seg, path, compressed, run):
+        blocks = [blk for _, blk in run]
+        return {"seg": seg["name"], "created": seg.get("created", 0), "path": path, "compressed": compressed, "blocks": blocks, "raw_start": blocks[0][B_RAW_OFF], "raw_end": blocks[-1][B_RAW_OFF] + blocks[-1][B_RAW_LEN], "lo": min(b[B_FIRST] for b in blocks)}
+
+    def replan_unit(self, unit):
+        """
+        Unit covering the same raw bytes after its file went away (the
+        segment was compressed meanwhile), or None if the segment is gone.
+        """
+        fresh = self._refresh({"name": unit["seg"]})
+        if fresh is None or fresh["state"] != "compressed": return None
+        run = [(i, b) for i, b in enumerate(fresh["blocks"]) if unit["raw_start"] <= b[B_RAW_OFF] < unit["raw_end"]]
+        if not run: return None
+        return self._block_unit(fresh, self.path_of(fresh), True, run)
+
+    def iter_lines(self, start=None, end=None, fids=None, tids=None, tokens=None):
+        for seg in self.select(start, end):
+            wanted = self.candidate_blocks(seg, fids, tids, tokens)
+            for data in self.iter_blocks(seg, start, end, wanted):
+                for line in data.decode('utf-8', errors='replace').splitlines():
+                    yield line
+
+
+def read_unit(unit):
+    """
+    Text of a scan unit (see AppSegments.plan_units) as (raw_offset, text)
+    chunks of whole lines: one per block, or one for a raw byte range
+    holding every line that starts inside [start, end).
+    """
+    with open(unit["path"], 'rb') as f:
+        if unit["blocks"] is not None:
+            for blk in unit["blocks"]:
+                if unit["compressed"]:
+                    f.seek(blk[B_COMP_OFF])
+                    data = zlib.decompress(f.read(blk[B_COMP_LEN]), 31)
+                else:
+                    f.seek(blk[B_RAW_OFF])
+                    data = f.read(blk[B_RAW_LEN])
+                yield blk[B_RAW_OFF], data.decode('utf-8', errors='replace')
+            return
+        start, end = unit["raw_start"], unit["raw_end"]
+        base = max(start - 1, 0)
+        f.seek(base)
+        data = f.read(end - base)
+        if start:
+            # Drop the line straddling the range start; the previous range owns it
+            cut = data.find(b"\n") + 1
+            if not cut: return
+            data = data[cut:]
+            base += cut
+        if not data: return
+        if not data.endswith(b"\n"): data += f.readline()
+        yield base, data.decode('utf-8', errors='replace')
+
+
+def open_reader(app_dir, app_name, opts=None):
+    return AppSegments(app_dir, app_name, opts, writable=False)
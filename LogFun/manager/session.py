@@ -0,0 +1,122 @@
+import json
+import time
+from .parser import parse_frame
+from .protocol import pack_packet, TYPE_HANDSHAKE, TYPE_LOG_DATA, TYPE_HEARTBEAT
+from .storage import get_storage
+from .balancer import get_balancer
+from .stats import get_monitor
+
+
+class IngestSession:
+    """
+    Protocol state of one agent connection, independent of the transport.
+
+    The threaded and asyncio servers read packets off the wire and hand them
+    to handle_packet(); whatever bytes it returns are written back to the
+    agent. Storage, balancer and monitor can be swapped out (e.g. for worker
+    processes that forward control-plane calls to a coordinator).
+    """
+
+    def __init__(self, peer, storage=None, balancer=None, monitor=None):
+        self.peer = peer
+        self.app_name = "unknown"
+        self.storage = storage or get_storage()
+        self.balancer = balancer or get_balancer()
+        self.monitor = monitor or get_monitor()
+        # Agent-reported offset of the manager clock relative to the agent clock
+        self.clock_offset = 0.0
+
+    def handle_packet(self, p_type, body):
+        """
+        Process one packet. Returns response bytes or None.
+        """
+        t_parse = time.perf_counter()
+        try:
+            data = json.loads(body.decode('utf-8'))
+        except:
+            return None
+        t_parse = time.perf_counter() - t_parse
+
+        if p_type == TYPE_HANDSHAKE:
+            return self._on_handshake(data)
+        elif p_type == TYPE_LOG_DATA:
+            self._on_log_data(data, t_parse)
+        elif p_type == TYPE_HEARTBEAT:
+            return self._on_heartbeat(data)
+        return None
+
+    def _config_response(self, data):
+        full_config = self.storage.get_app_config(self.app_name)
+        resp = {"timestamp": time.time(), "config": full_config, "echo": data.get("timestamp")}
+        return pack_packet(TYPE_HEARTBEAT, json.dumps(resp).encode('utf-8'))
+
+    def _on_handshake(self, data):
+        self.app_name = data.get("app_name", "unknown")
+        if self.app_name == "unknown": return None
+        if "config" in data: self.storage.sync_config(self.app_name, data["config"])
+        if "blocked_stats" in data:
+            self.storage.update_stats(self.app_name, data["blocked_stats"])
+            self.balancer.observe_blocked(self.app_name, data["blocked_stats"])
+        return self._config_response(data)
+
+    def _on_heartbeat(self, data):
+        if "app_name" in data: self.app_name = data["app_name"]
+        if "clock" in data: self.clock_offset = float(data["clock"].get("offset", 0.0))
+        if self.app_name == "unknown": return None
+        if "blocked_stats" in data:
+            self.storage.update_stats(self.app_name, data["blocked_stats"])
+            self.balancer.observe_blocked(self.app_name, data["blocked_stats"])
+        if "agent_stats" in data: self.storage.update_agent_stats(self.app_name, self.peer, data["agent_stats"])
+        return self._config_response(data)
+
+    def _on_log_data(self, data, t_parse):
+        app_name = self.app_name
+        storage = self.storage
+        balancer = self.balancer
+        monitor = self.monitor
+
+        raw_input = data.get("log", "")
+        log_type = data.get("type", "compress")
+        logs = raw_input if isinstance(raw_input, list) else [raw_input]
+
+        # IMPORTANT: If app_name is still unknown, we shouldn't record balancer traffic
+        # Handshake usually arrives first, but we handle it defensively
+        records = ()
+        if app_name != "unknown":
+            t_records = time.perf_counter()
+            records = parse_frame(logs, log_type)
+            t_parse += time.perf_counter() - t_records
+
+        t_balancer = time.perf_counter()
+        balancer.record_batch(app_name, records)
+        parsed = len(records)
+        records = balancer.admit(app_name, records)
+        t_balancer = time.perf_counter() - t_balancer
+        # Records shed by the ingest limit are not counted as ingested
+        monitor.tick(len(logs) - (parsed - len(records)), app_name, records)
+
+        # Only appends to the app's write buffer; the writer reports the "flush" stage
+        t_enqueue = time.perf_counter()
+        storage.write_records(app_name, records)
+        t_enqueue = time.perf_counter() - t_enqueue
+
+        monitor.observe_stages(len(logs), {"parse": t_parse, "balancer": t_balancer, "enqueue": t_enqueue})
+        if "enq" in data and app_name != "unknown":
+            self._observe_latency(data, len(logs))
+
+    def _observe_latency(self, data, count):
+        """
+        Frame delivery latency: agent enqueue (oldest record) -> storage write,
+        split into time queued on the agent and transit (send -> write).
+        """
+        try:
+            now = time.time()
+            enq = float(data["enq"])
+            samples = {"e2e": now - (enq + self.clock_offset)}
+            if "sent" in data:
+                sent = float(data["sent"])
+                samples["agent_queue"] = sent - enq
+                samples["transit"] = now - (sent + self.clock_offset)
+            self.monitor.observe_latency(self.app_name, samples, weight=count)
+        except (TypeError, ValueError):
+            pass
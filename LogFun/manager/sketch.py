@@ -0,0 +1,180 @@
+"""
+Bounded-memory entropy estimation over a sliding time window.
+
+WindowEntropy keeps one Slice per `slice_seconds` of the window. A slice
+holds, for the values seen during it:
+  * their number,
+  * a Misra-Gries summary (the deterministic twin of space-saving): at most
+    `capacity` values with lower bounds on their counts, which finds the
+    values that dominate the entropy,
+  * a bottom-k sample: the `sample_size` distinct values with the smallest
+    hashes and their exact counts, a uniform sample of the distinct values
+    that also gives the distinct count (KMV estimate).
+Both merge across slices (summed summaries; the values under the smallest
+slice threshold), so whole slices drop out as the window slides.
+
+entropy() takes the heavy values from the summary (exact counts where they
+were sampled) and spreads the remaining mass like the sampled values' counts
+beyond their summary counts. While a window has no more distinct values than the
+summary holds the result is exact; test_entropy_sketch.py compares the
+estimate with the exact entropy on several distributions.
+
+Only 64-bit hashes of the values are kept (collisions are negligible at
+these sizes). They come from hash(), so sketches are only comparable within
+one process.
+"""
+import math
+import heapq
+from collections import Counter
+
+_MASK64 = (1 << 64) - 1
+_SPACE = float(1 << 64)
+
+
+def _hash64(value):
+    # hash() of an int is the int itself, so spread the bits
+    h = (hash(value) * 0x9E3779B97F4A7C15) & _MASK64
+    return h ^ (h >> 29)
+
+
+class Slice:
+    """Values seen during one time slice, keyed by their 64-bit hash."""
+    __slots__ = ("start", "total", "counts", "since", "cut", "sample", "limit")
+
+    def __init__(self, start):
+        self.start = start
+        self.total = 0
+        # Misra-Gries summary {hash: lower bound of its count}
+        self.counts = {}
+        # Total subtracted so far, and its value when each summary entry was
+        # (re)inserted: an entry lost only the cuts made since then
+        self.cut = 0
+        self.since = {}
+        # Bottom-k sample {hash: count}; every hash below `limit` is in it
+        self.sample = {}
+        self.limit = _MASK64 + 1
+
+    def add_counts(self, counts, capacity, sample_size):
+        """Add a {value: count} batch."""
+        table, since, sample, limit = self.counts, self.since, self.sample, self.limit
+        for value, n in counts.items():
+            h = _hash64(value)
+            self.total += n
+            if h in table: table[h] += n
+            else:
+                table[h] = n
+                since[h] = self.cut
+            if h < limit:
+                if h in sample: sample[h] += n
+                else: sample[h] = n
+        if len(table) > capacity:
+            # Subtract the (capacity+1)-th largest count from all
+            cut = heapq.nlargest(capacity + 1, table.values())[-1]
+            self.counts = {h: c - cut for h, c in table.items() if c > cut}
+            self.since = {h: since[h] for h in self.counts}
+            self.cut += cut
+        if len(sample) > sample_size + sample_size // 2:
+            kept = sorted(sample)
+            self.limit = kept[sample_size]
+            self.sample = {h: sample[h] for h in kept[:sample_size]}
+
+
+class WindowEntropy:
+    """
+    Approximate Shannon entropy (bits) of the values added during the last
+    `window` seconds, in memory bounded by the number of slices, `capacity`
+    and `sample_size`.
+    """
+    __slots__ = ("window", "slice_seconds", "capacity", "sample_size", "slices")
+
+    def __init__(self, window, slice_seconds=None, capacity=64, sample_size=64):
+        self.window = max(1, int(window))
+        self.slice_seconds = max(1, int(slice_seconds or math.ceil(self.window / 12)))
+        self.capacity = max(1, int(capacity))
+        self.sample_size = max(1, int(sample_size))
+        self.slices = []
+
+    def add(self, ts, value, n=1):
+        self.add_counts(ts, {value: n})
+
+    def add_counts(self, ts, counts):
+        """Add a {value: count} batch seen at time `ts`."""
+        start = int(ts) - int(ts) % self.slice_seconds
+        if not self.slices or self.slices[-1].start < start:
+            self.expire(ts)
+            self.slices.append(Slice(start))
+        cur = self.slices[-1]
+        if cur.start > start:
+            # Out-of-order batch: charge it to the slice it belongs to, if kept
+            for s in self.slices:
+                if s.start == start:
+                    cur = s
+                    break
+        cur.add_counts(counts, self.capacity, self.sample_size)
+
+    def expire(self, now):
+        """Drop slices that ended before the window; returns the values left."""
+        cutoff = now - self.window
+        slices = self.slices
+        while slices and slices[0].start + self.slice_seconds <= cutoff:
+            slices.pop(0)
+        return sum(s.total for s in slices)
+
+    def total(self, now):
+        return self.expire(now)
+
+    def rate(self, now, seconds):
+        """Values per second in the slices covering the last `seconds`."""
+        self.expire(now)
+        recent = [s for s in self.slices if s.start + self.slice_seconds > now - seconds]
+        if not recent: return 0.0
+        return sum(s.total for s in recent) / max(1.0, now - recent[0].start)
+
+    def sample(self, now):
+        """Merged bottom-k sample of the window as ({hash: count}, limit)."""
+        self.expire(now)
+        limit = min((s.limit for s in self.slices), default=_MASK64 + 1)
+        merged = Counter()
+        for s in self.slices:
+            for h, c in s.sample.items():
+                if h < limit: merged[h] += c
+        return merged, limit
+
+    def distinct(self, now):
+        """Estimated number of distinct values in the window."""
+        merged, limit = self.sample(now)
+        if limit > _MASK64: return len(merged)
+        return len(merged) * _SPACE / limit
+
+    def entropy(self, now):
+        total = self.expire(now)
+        if not total: return 0.0
+        sampled, _ = self.sample(now)
+        heavy = Counter()
+        for s in self.slices:
+            # A value lost exactly the cuts made while it was in the summary
+            cut, since = s.cut, s.since
+            heavy.update({h: c + cut - since[h] for h, c in s.counts.items()})
+        # sum of c*log2(c) over the heavy values, exact counts where sampled
+        weighted, mass = 0.0, 0
+        for h, c in heavy.items():
+            c = sampled.get(h, c)
+            if c <= 0: continue
+            mass += c
+            weighted += c * math.log2(c)
+        rest = total - mass
+        if rest > 0:
+            # The rest is what the sampled values have beyond their summary
+            # counts, each part weighted by the log of its value's full count
+            lost = [(c - heavy.get(h, 0), c) for h, c in sampled.items() if c > heavy.get(h, 0)]
+            lost_mass = sum(u for u, _ in lost)
+            if lost_mass: weighted += rest * sum(u * math.log2(c) for u, c in lost) / lost_mass
+        return max(0.0, math.log2(total) - weighted / total)
+
+
+def exact_entropy(values):
+    """Shannon entropy (bits) of an iterable of values."""
+    counts = Counter(values)
+    total = sum(counts.values())
+    if not total: return 0.0
+    return -sum(c / total * math.log2(c / total) for c in counts.values())
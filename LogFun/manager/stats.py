@@ -1,5 +1,131 @@
 import time
+import bisect
 import threading
+from .config import get_config
+from .metrics import get_metrics, OTHER
+
+# Seconds of per-app/per-function traffic kept, and the window rates are averaged over
+TRAFFIC_SECONDS = 60
+RATE_WINDOW = 5
+
+# Upper bounds (seconds) of the delivery latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+# Per-frame stage, storage write and balancer analysis durations
+STAGE_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket histogram; the last bucket collects everything above 60s.
+    """
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds, weight=1):
+        if seconds < 0: seconds = 0.0
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += weight
+        self.total += weight
+        self.sum += seconds * weight
+        if seconds > self.max: self.max = seconds
+
+    def quantile(self, q):
+        if not self.total: return 0.0
+        rank = q * self.total
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.total,
+            "avg_ms": round(self.sum / self.total * 1000, 3) if self.total else 0,
+            "p50_ms": round(self.quantile(0.5) * 1000, 3),
+            "p90_ms": round(self.quantile(0.9) * 1000, 3),
+            "p99_ms": round(self.quantile(0.99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+class TrafficRing:
+    """
+    Records and bytes per second for the last `size` seconds, plus totals.
+    Bytes are counted as characters of the stored record line.
+    """
+    __slots__ = ("size", "secs", "records", "bytes", "total_records", "total_bytes", "last")
+
+    def __init__(self, size=TRAFFIC_SECONDS):
+        self.size = size
+        self.secs = [-1] * size
+        # Latest second with traffic
+        self.last = -1
+        self.records = [0] * size
+        self.bytes = [0] * size
+        self.total_records = 0
+        self.total_bytes = 0
+
+    def add(self, sec, records, nbytes):
+        i = sec % self.size
+        if self.secs[i] != sec:
+            self.secs[i] = sec
+            self.records[i] = self.bytes[i] = 0
+            if sec > self.last: self.last = sec
+        self.records[i] += records
+        self.bytes[i] += nbytes
+        self.total_records += records
+        self.total_bytes += nbytes
+
+    def rate(self, now_sec, window=RATE_WINDOW):
+        """(records/s, bytes/s) over the `window` complete seconds before now_sec."""
+        n = b = 0
+        for i, sec in enumerate(self.secs):
+            if now_sec - window <= sec < now_sec:
+                n += self.records[i]
+                b += self.bytes[i]
+        return n / window, b / window
+
+    def series(self, now_sec):
+        """Records per second, oldest first, ending with the current second."""
+        out = [0] * self.size
+        for i, sec in enumerate(self.secs):
+            age = now_sec - sec
+            if 0 <= age < self.size: out[self.size - 1 - age] = self.records[i]
+        return out
+
+
+class _TrafficShard:
+    """
+    Counts of one connection thread for the current second, folded into the
+    monitor's rings when the second changes (or a snapshot is taken), so a
+    frame only takes this shard's uncontended lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = threading.current_thread()
+        self.sec = int(time.time())
+        self.count = 0
+        self.frames = 0
+        # {app: [records, bytes, {fid: [records, bytes]}]}
+        self.apps = {}
+
+
+def frame_traffic(records):
+    """{fid: [records, bytes]} of a frame of ParsedRecords; fid None for unparsed ones."""
+    funcs = {}
+    for rec in records:
+        c = funcs.get(rec.fid)
+        if c is None: c = funcs[rec.fid] = [0, 0]
+        c[0] += 1
+        c[1] += len(rec.line)
+    return funcs
 
 
 class LogMonitor:
@@ -16,30 +142,313 @@ class LogMonitor:
     def __init__(self):
         if hasattr(self, "_initialized"): return
         self.start_time = time.time()
-        self.total_logs = 0
-        self.interval_logs = 0
-        self.last_check = time.time()
-        self.qps = 0
         # [FIX] Add lock for thread-safe counters
         self.stats_lock = threading.Lock()
+
+        # Ingest throughput: all records, frames, per app and per app function.
+        # Bounded like the metrics store: apps past max_apps and functions
+        # past an app's top_functions are counted under "_other"
+        cfg = get_config().get("metrics") or {}
+        self.top_functions = int(cfg.get("top_functions", 20))
+        self.max_apps = int(cfg.get("max_apps", 64))
+        self.traffic = TrafficRing()
+        self.frames = TrafficRing()
+        self.app_traffic = {}
+        self.func_traffic = {}
+        self._local = threading.local()
+        self._shards = []
+        get_metrics().sources.append(self.fold_shards)
+
+        # Ingest pipeline telemetry: {stage: [records, total_seconds, max_seconds_per_frame]}
+        self.stages = {}
+        self.open_connections = 0
+        self.total_connections = 0
+        self.handler_errors = 0
+
+        # Histograms for /metrics: per-frame stage seconds, storage flushes,
+        # balancer analysis cycles and searches by type
+        self.stage_hist = {}
+        self.write_hist = LatencyHistogram(STAGE_BUCKETS)
+        self.write_bytes = 0
+        # {app: records dropped because storage writes kept failing}
+        self.write_lost = {}
+        self.analysis_hist = LatencyHistogram(STAGE_BUCKETS)
+        self.mutes = {}
+        # {app: records dropped at ingest by the balancer's budget backstop}
+        self.shed = {}
+        self.search_hist = {}
+
+        # Delivery latency per app: {app: {"e2e"|"agent_queue"|"transit": LatencyHistogram}}
+        self.latency = {}
         self._initialized = True
 
-    def tick(self, count=1):
+    def tick(self, count=1, app_name=None, records=None):
+        """
+        Count one frame of `count` records; with app_name and its
+        ParsedRecords, also per app and per function.
+        """
+        self.observe_traffic(count, app_name, frame_traffic(records) if records else None)
+
+    def observe_traffic(self, count, app_name=None, funcs=None, frames=1):
+        """Count `count` records, of which `funcs` ({fid: [records, bytes]}) belong to app_name."""
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _TrafficShard()
+            with self.stats_lock:
+                self._shards.append(shard)
+        sec = int(time.time())
+        with shard.lock:
+            if sec != shard.sec:
+                self._fold(shard)
+                shard.sec = sec
+            shard.count += count
+            shard.frames += frames
+            if app_name and funcs:
+                app = shard.apps.get(app_name)
+                if app is None: app = shard.apps[app_name] = [0, 0, {}]
+                app_funcs = app[2]
+                for fid, (n, b) in funcs.items():
+                    app[0] += n
+                    app[1] += b
+                    c = app_funcs.get(fid)
+                    if c is None: app_funcs[fid] = [n, b]
+                    else:
+                        c[0] += n
+                        c[1] += b
+
+    def _fold(self, shard):
+        """Move a shard's counts into the rings; caller holds shard.lock."""
+        if not shard.frames and not shard.apps: return
+        sec = shard.sec
+        with self.stats_lock:
+            nbytes = 0
+            for app_name, (n, b, funcs) in shard.apps.items():
+                nbytes += b
+                ring = self.app_traffic.get(app_name)
+                if ring is None:
+                    if len(self.app_traffic) - (OTHER in self.app_traffic) >= self.max_apps: app_name = OTHER
+                    ring = self.app_traffic.get(app_name)
+                    if ring is None:
+                        ring = self.app_traffic[app_name] = TrafficRing()
+                        self.func_traffic[app_name] = {}
+                ring.add(sec, n, b)
+                rings = self.func_traffic[app_name]
+                idle = None
+                for fid, (fn, fb) in funcs.items():
+                    if fid is None: continue
+                    fring = rings.get(fid)
+                    if fring is None:
+                        if len(rings) - (OTHER in rings) >= self.top_functions:
+                            # Take over the slot of a function idle for the whole window
+                            if idle is None: idle = [f for f, r in rings.items() if f != OTHER and r.last <= sec - r.size]
+                            if idle: del rings[idle.pop()]
+                            else: fid = OTHER
+                        fring = rings.get(fid)
+                        if fring is None: fring = rings[fid] = TrafficRing()
+                    fring.add(sec, fn, fb)
+            self.traffic.add(sec, shard.count, nbytes)
+            self.frames.add(sec, shard.frames, 0)
+        if shard.apps: get_metrics().observe_traffic(sec, shard.apps)
+        shard.count = shard.frames = 0
+        shard.apps = {}
+
+    def fold_shards(self):
+        """Bring the counters up to date with every connection thread's shard."""
+        with self.stats_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            with shard.lock:
+                self._fold(shard)
+        # Connection threads come and go; drop the shards of finished ones
+        with self.stats_lock:
+            self._shards = [sh for sh in self._shards if sh.thread.is_alive() or sh.frames or sh.apps]
+
+    def get_traffic_snapshot(self, app_name=None, top=10):
+        """
+        Per-app rates and totals; for app_name (or every app) also its `top`
+        busiest functions and its records/s series of the last minute.
+        """
+        self.fold_shards()
+        now = int(time.time())
+        out = {}
+        with self.stats_lock:
+            for name, ring in self.app_traffic.items():
+                if app_name is not None and name != app_name: continue
+                qps, bps = ring.rate(now)
+                funcs = []
+                for fid, fring in self.func_traffic[name].items():
+                    fqps, fbps = fring.rate(now)
+                    funcs.append((fqps, fid, fbps, fring))
+                funcs.sort(key=lambda f: (-f[0], -f[3].total_records))
+                out[name] = {
+                    "qps": round(qps, 2),
+                    "bytes_per_sec": round(bps, 1),
+                    "total": ring.total_records,
+                    "bytes": ring.total_bytes,
+                    "series": ring.series(now),
+                    "functions": {fid: {"qps": round(fqps, 2), "bytes_per_sec": round(fbps, 1), "total": fring.total_records, "bytes": fring.total_bytes} for fqps, fid, fbps, fring in funcs[:top]},
+                }
+        return out
+
+    def observe_stages(self, records, timings):
+        """
+        Record per-frame stage timings, e.g. {"parse": 0.0002, "enqueue": 0.00001};
+        writers report their flushes as the "flush" stage.
+        Called once per frame so the lock is not taken per record.
+        """
+        with self.stats_lock:
+            for stage, seconds in timings.items():
+                st = self.stages.get(stage)
+                if st is None:
+                    st = self.stages[stage] = [0, 0.0, 0.0]
+                st[0] += records
+                st[1] += seconds
+                if seconds > st[2]: st[2] = seconds
+                hist = self.stage_hist.get(stage)
+                if hist is None: hist = self.stage_hist[stage] = LatencyHistogram(STAGE_BUCKETS)
+                hist.observe(seconds)
+
+    def observe_write(self, seconds, nbytes):
+        """One storage flush (AppLogWriter) of nbytes."""
+        with self.stats_lock:
+            self.write_hist.observe(seconds)
+            self.write_bytes += nbytes
+
+    def observe_write_lost(self, app_name, records):
+        """Records dropped from an app's write buffer while storage writes failed."""
+        with self.stats_lock:
+            self.write_lost[app_name] = self.write_lost.get(app_name, 0) + records
+
+    def observe_analysis(self, app_name, seconds, mutes):
+        """One balancer analysis cycle and the number of functions it muted."""
+        with self.stats_lock:
+            self.analysis_hist.observe(seconds)
+            if mutes: self.mutes[app_name] = self.mutes.get(app_name, 0) + mutes
+
+    def observe_shed(self, app_name, records):
+        """Records of a frame dropped at ingest for exceeding the app's budget."""
+        with self.stats_lock:
+            self.shed[app_name] = self.shed.get(app_name, 0) + records
+
+    def observe_search(self, search_type, seconds):
+        with self.stats_lock:
+            hist = self.search_hist.get(search_type)
+            if hist is None: hist = self.search_hist[search_type] = LatencyHistogram()
+            hist.observe(seconds)
+
+    def observe_latency(self, app_name, samples, weight=1):
         """
-        Increment log counter safely.
+        Record one frame's delivery latencies, weighted by its record count.
         """
         with self.stats_lock:
-            self.total_logs += count
-            self.interval_logs += count
+            app_hist = self.latency.get(app_name)
+            if app_hist is None:
+                app_hist = self.latency[app_name] = {}
+            for name, seconds in samples.items():
+                hist = app_hist.get(name)
+                if hist is None:
+                    hist = app_hist[name] = LatencyHistogram()
+                hist.observe(seconds, weight)
 
-            now = time.time()
-            if now - self.last_check >= 1.0:
-                self.qps = self.interval_logs / (now - self.last_check)
-                self.interval_logs = 0
-                self.last_check = now
+    def get_latency_snapshot(self):
+        with self.stats_lock:
+            return {app: {name: h.to_dict() for name, h in hists.items()} for app, hists in self.latency.items()}
+
+    def connection_opened(self):
+        with self.stats_lock:
+            self.open_connections += 1
+            self.total_connections += 1
+
+    def connection_closed(self, error=False):
+        with self.stats_lock:
+            self.open_connections -= 1
+            if error: self.handler_errors += 1
+
+    def get_stage_snapshot(self):
+        """Average latency per record and worst frame, in microseconds."""
+        with self.stats_lock:
+            return {
+                stage: {"records": n, "avg_us": round(total / n * 1e6, 3) if n else 0, "max_frame_us": round(mx * 1e6, 1)}
+                for stage, (n, total, mx) in self.stages.items()
+            }
 
     def get_snapshot(self):
-        return {"uptime": time.time() - self.start_time, "total_logs": self.total_logs, "qps": int(self.qps)}
+        traffic = self.get_traffic_snapshot(top=0)
+        for app in traffic.values():
+            del app["series"], app["functions"]
+        qps, _ = self.traffic.rate(int(time.time()), 1)
+        return {
+            "uptime": time.time() - self.start_time,
+            "total_logs": self.traffic.total_records,
+            "qps": int(qps),
+            "apps": traffic,
+            "connections": {"open": self.open_connections, "total": self.total_connections, "errors": self.handler_errors},
+            "stages": self.get_stage_snapshot(),
+            "latency": self.get_latency_snapshot(),
+        }
+
+    def prometheus_text(self):
+        """
+        Text exposition (Prometheus 0.0.4) of the ingest, storage, balancer
+        and search counters. Pending shards are folded in first; everything
+        else is read as is, without taking stats_lock.
+        """
+        self.fold_shards()
+        out = []
+
+        def metric(name, kind, help_text, samples):
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                out.append(f"{name}{_labels(labels)} {_number(value)}")
+
+        def histogram(name, help_text, hists):
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} histogram")
+            for labels, h in hists:
+                counts, seen = list(h.counts), 0
+                for bound, c in zip(h.bounds, counts):
+                    seen += c
+                    out.append(f"{name}_bucket{_labels(labels + (('le', _number(bound)), ))} {seen}")
+                out.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'), ))} {seen + counts[-1]}")
+                out.append(f"{name}_sum{_labels(labels)} {_number(h.sum)}")
+                out.append(f"{name}_count{_labels(labels)} {seen + counts[-1]}")
+
+        apps = list(self.app_traffic.items())
+        now = int(time.time())
+        metric("logfun_uptime_seconds", "gauge", "Seconds since the manager started.", [((), time.time() - self.start_time)])
+        metric("logfun_ingest_records_total", "counter", "Records ingested per app.", [((("app", a), ), r.total_records) for a, r in apps])
+        metric("logfun_ingest_bytes_total", "counter", "Bytes (characters) of records ingested per app.", [((("app", a), ), r.total_bytes) for a, r in apps])
+        metric("logfun_ingest_frames_total", "counter", "LOG_DATA frames received.", [((), self.frames.total_records)])
+        metric("logfun_ingest_frames_per_second", "gauge", "LOG_DATA frames per second over the last 5 s.", [((), self.frames.rate(now)[0])])
+        metric("logfun_connections_open", "gauge", "Open agent connections.", [((), self.open_connections)])
+        metric("logfun_connections_total", "counter", "Agent connections accepted.", [((), self.total_connections)])
+        metric("logfun_handler_errors_total", "counter", "Agent connections closed by a handler error.", [((), self.handler_errors)])
+        histogram("logfun_stage_seconds", "Time spent in each ingest stage, per frame (per flush for the flush stage).", [((("stage", st), ), h) for st, h in list(self.stage_hist.items())])
+        histogram("logfun_storage_write_seconds", "Duration of storage flushes to the active segment.", [((), self.write_hist)])
+        metric("logfun_storage_write_bytes_total", "counter", "Bytes written by storage flushes.", [((), self.write_bytes)])
+        metric("logfun_storage_lost_records_total", "counter", "Records dropped per app because storage writes kept failing.", [((("app", a), ), n) for a, n in list(self.write_lost.items())])
+        histogram("logfun_balancer_analysis_seconds", "Duration of balancer analysis cycles.", [((), self.analysis_hist)])
+        metric("logfun_balancer_mutes_total", "counter", "Functions and templates muted by the balancer per app.", [((("app", a), ), n) for a, n in list(self.mutes.items())])
+        metric("logfun_balancer_shed_records_total", "counter", "Records dropped at ingest over the app's budget.", [((("app", a), ), n) for a, n in list(self.shed.items())])
+        histogram("logfun_search_seconds", "Duration of log searches by type.", [((("type", t), ), h) for t, h in list(self.search_hist.items())])
+        histogram("logfun_delivery_latency_seconds", "Delivery latency from agent enqueue to storage write, weighted by records.",
+                  [((("app", a), ("kind", k)), h) for a, hists in list(self.latency.items()) for k, h in list(hists.items())])
+        return "\n".join(out) + "\n"
+
+
+def _labels(pairs):
+    if not pairs: return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if isinstance(value, int): return str(value)
+    return repr(float(value))
 
 
 _monitor = LogMonitor()
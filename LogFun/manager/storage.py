@@ -1,7 +1,17 @@
 import os
+import copy
 import json
 import threading
+import time
 from .config import get_config
+from .writer import LogWriterPool
+from .segments import AppSegments, SegmentOptions, open_reader
+from .indexer import VAR_INDEX_MODES
+from .parser import parse_record, parse_frame
+from .metrics import get_metrics
+
+# Agents report every 5 s; a connection silent for this long is gone
+AGENT_STATS_TTL = 60.0
 
 
 class StorageManager:
@@ -10,11 +20,41 @@ class StorageManager:
         self.root_dir = self.config.get("storage", "root_dir")
         self.apps_data = {}
         self.app_stats = {}
+        self.agent_stats = {}
+        # Bumped on every config change; keys the decoders' template cache
+        self.revisions = {}
         self.lock = threading.RLock()
+        # App directories already created; avoids a makedirs per record
+        self._known_dirs = set()
+
+        cfg = self.config.get("storage")
+        self.segment_opts = SegmentOptions(
+            segment_seconds=int(cfg.get("segment_seconds", 3600)),
+            segment_bytes=int(cfg.get("segment_bytes", 268435456)),
+            block_bytes=int(cfg.get("block_bytes", 65536)),
+            compress=bool(cfg.get("compress", False)),
+            retention_days=float(cfg.get("retention_days", 0)),
+            retention_bytes=int(cfg.get("retention_bytes", 0)),
+            var_index=cfg.get("var_index") if cfg.get("var_index") in VAR_INDEX_MODES else "off",
+        )
+        # Per-app variable index modes, e.g. {"shop": "full"}
+        self.var_index_apps = cfg.get("var_index_apps") or {}
+        self.writers = LogWriterPool(
+            self._open_segments,
+            flush_bytes=int(cfg.get("flush_bytes", 65536)),
+            flush_interval=float(cfg.get("flush_interval", 0.2)),
+            fsync=cfg.get("fsync", "never"),
+            fsync_interval=float(cfg.get("fsync_interval", 1.0)),
+            idle_close=float(cfg.get("idle_close", 60.0)),
+            max_buffer=int(cfg.get("max_buffer_bytes", 16777216)),
+            list_apps=self.get_all_apps,
+        )
 
     def _get_app_dir(self, app_name):
         d = os.path.join(self.root_dir, app_name)
-        os.makedirs(d, exist_ok=True)
+        if d not in self._known_dirs:
+            os.makedirs(d, exist_ok=True)
+            self._known_dirs.add(d)
         return d
 
     def _get_config_path(self, app_name):
@@ -23,6 +63,30 @@ class StorageManager:
     def _get_log_path(self, app_name):
         return os.path.join(self._get_app_dir(app_name), f"{app_name}.log")
 
+    def segment_opts_for(self, app_name):
+        mode = self.var_index_apps.get(app_name, self.segment_opts.var_index)
+        if mode not in VAR_INDEX_MODES: mode = "off"
+        if mode == self.segment_opts.var_index: return self.segment_opts
+        opts = copy.copy(self.segment_opts)
+        opts.var_index = mode
+        return opts
+
+    def _open_segments(self, app_name):
+        return AppSegments(self._get_app_dir(app_name), app_name, self.segment_opts_for(app_name))
+
+    def start_maintenance(self):
+        """Compress, index and expire sealed segments in the background, in the process that writes them."""
+        self.writers.start_maintenance()
+
+    def get_segments(self, app_name):
+        """
+        Segment view for readers: the live one if this process writes the app,
+        otherwise loaded from the manifest on disk.
+        """
+        w = self.writers.writers.get(app_name)
+        if w is not None: return w.segments
+        return open_reader(os.path.join(self.root_dir, app_name), app_name, self.segment_opts_for(app_name))
+
     def get_all_apps(self):
         """[FIX] List all available apps from storage directory."""
         if not os.path.exists(self.root_dir):
@@ -37,11 +101,32 @@ class StorageManager:
             for k, v in stats_dict.items():
                 # [FIX] Accumulate stats (Agent sends delta, Server accumulates)
                 curr[k] = curr.get(k, 0) + v
+        get_metrics().observe_blocked(app_name, stats_dict)
 
     def get_app_stats(self, app_name):
         with self.lock:
             return self.app_stats.get(app_name, {})
 
+    def update_agent_stats(self, app_name, agent_key, stats):
+        """Keep the latest self-telemetry snapshot reported by each agent connection."""
+        now = time.time()
+        with self.lock:
+            self.agent_stats.setdefault(app_name, {})[agent_key] = dict(stats, received_at=now)
+            self._expire_agent_stats(now)
+
+    def _expire_agent_stats(self, now):
+        # Keys are per connection (ip:port): drop the ones that stopped reporting
+        cutoff = now - AGENT_STATS_TTL
+        for app_name, agents in list(self.agent_stats.items()):
+            for key in [k for k, v in agents.items() if v["received_at"] < cutoff]:
+                del agents[key]
+            if not agents: del self.agent_stats[app_name]
+
+    def get_agent_stats(self, app_name):
+        with self.lock:
+            self._expire_agent_stats(time.time())
+            return dict(self.agent_stats.get(app_name, {}))
+
     def sync_config(self, app_name, client_config):
         path = self._get_config_path(app_name)
         with self.lock:
@@ -51,6 +136,7 @@ class StorageManager:
                     try:
                         with open(path, 'r', encoding='utf-8') as f:
                             self.apps_data[app_name] = json.load(f)
+                        self._bump_revision(app_name)
                     except:
                         self.apps_data[app_name] = {}
 
@@ -85,22 +171,26 @@ class StorageManager:
             self.apps_data[app_name] = server_data
             if changed: self._save_to_disk(app_name)
 
+    def _loaded_app(self, app_name):
+        """App config, loaded from disk if needed; None if there is none. Call with the lock held."""
+        if app_name not in self.apps_data:
+            path = self._get_config_path(app_name)
+            if not os.path.exists(path): return None
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.apps_data[app_name] = json.load(f)
+                self._bump_revision(app_name)
+            except:
+                return None
+        return self.apps_data[app_name]
+
     def update_control(self, app_name, target_id, sub_id, enable, source="manual"):
         with self.lock:
-            if app_name not in self.apps_data:
-                path = self._get_config_path(app_name)
-                if os.path.exists(path):
-                    try:
-                        with open(path, 'r', encoding='utf-8') as f:
-                            self.apps_data[app_name] = json.load(f)
-                    except:
-                        return
-                else:
-                    return
-
-            data = self.apps_data[app_name]
+            data = self._loaded_app(app_name)
+            if data is None: return
             funcs = data.get("functions", {})
             fid = str(target_id)
+            changed = False
 
             if fid in funcs:
                 target_node = None
@@ -118,15 +208,119 @@ class StorageManager:
                         else: t_node.pop("muted_by", None)
 
                 if target_node:
+                    changed = target_node.get("enabled", True) != enable
                     target_node["enabled"] = enable
+                    # Only balancer mutes carry these (apply_mutes)
+                    target_node.pop("muted_at", None)
+                    target_node.pop("mute_rate", None)
                     if not enable:
                         target_node["muted_by"] = source
                     else:
                         target_node.pop("muted_by", None)
 
             self._save_to_disk(app_name)
+        if changed: get_metrics().observe_control(app_name, target_id, sub_id, enable, source)
+
+    def apply_mutes(self, app_name, mutes, unmutes=(), source="balancer"):
+        """
+        Mute and unmute several (fid, tid) keys in one go (tid None for the
+        whole function), saving the config once. `mutes` maps each key to the
+        rate that triggered it, kept with the mute. Keys that are already off,
+        or whose function is, are not muted; only mutes made by `source` are
+        lifted. Returns (muted keys, unmuted keys).
+        """
+        muted, unmuted = [], []
+        now = time.time()
+        with self.lock:
+            data = self._loaded_app(app_name)
+            if data is None: return muted, unmuted
+            funcs = data.get("functions", {})
+            for key, rate in mutes.items():
+                fid, tid = key
+                func = funcs.get(str(fid))
+                if func is None or not func.get("enabled", True): continue
+                node = func if tid is None else func.get("templates", {}).get(str(tid))
+                if node is None or not node.get("enabled", True): continue
+                for t_node in (func.get("templates", {}).values() if tid is None else ()):
+                    t_node["enabled"] = False
+                    t_node["muted_by"] = source
+                node["enabled"] = False
+                node["muted_by"] = source
+                node["muted_at"] = now
+                node["mute_rate"] = rate
+                muted.append(key)
+            for key in unmutes:
+                fid, tid = key
+                func = funcs.get(str(fid))
+                if func is None: continue
+                node = func if tid is None else func.get("templates", {}).get(str(tid))
+                if node is None or node.get("enabled", True) or node.get("muted_by") != source: continue
+                for t_node in (func.get("templates", {}).values() if tid is None else ()):
+                    if t_node.get("muted_by") == source:
+                        t_node["enabled"] = True
+                        t_node.pop("muted_by", None)
+                node["enabled"] = True
+                for k in ("muted_by", "muted_at", "mute_rate"):
+                    node.pop(k, None)
+                unmuted.append(key)
+            if muted or unmuted: self._save_to_disk(app_name)
+        metrics = get_metrics()
+        for fid, tid in muted:
+            metrics.observe_control(app_name, fid, tid, False, source)
+        for fid, tid in unmuted:
+            metrics.observe_control(app_name, fid, tid, True, source)
+        return muted, unmuted
+
+    def apply_sampling(self, app_name, rates, tolerance=0.02):
+        """
+        Set agent sampling rates {(fid, tid): rate} (tid None for the whole
+        function); every other node loses its rate. A rate within `tolerance`
+        of the stored one is left alone, so the config is only saved when a
+        rate really moves. Returns True if it was saved.
+        """
+        changed = False
+        with self.lock:
+            data = self._loaded_app(app_name)
+            if data is None: return False
+            for fid, func in data.get("functions", {}).items():
+                nodes = [(None, func)] + list(func.get("templates", {}).items())
+                for tid, node in nodes:
+                    if not fid.isdigit() or not (tid is None or tid.isdigit()): continue
+                    rate = rates.get((int(fid), None if tid is None else int(tid)))
+                    old = node.get("sample")
+                    if rate is None or rate >= 1.0:
+                        if old is not None:
+                            node.pop("sample")
+                            changed = True
+                    elif old is None or abs(old - rate) > tolerance:
+                        node["sample"] = round(rate, 3)
+                        changed = True
+            if changed: self._save_to_disk(app_name)
+        return changed
+
+    def set_watch(self, app_name, target_id, watch):
+        """
+        Mark a function as wanted by the manager. Agents running with adaptive
+        tracing keep (or bring back) full tracing for watched functions.
+        """
+        with self.lock:
+            funcs = self.get_app_config(app_name).get("functions", {})
+            func = funcs.get(str(target_id))
+            if func is None: return
+            if watch: func["watch"] = True
+            else: func.pop("watch", None)
+            self._save_to_disk(app_name)
+
+    def get_config_revision(self, app_name):
+        with self.lock:
+            return self.revisions.get(app_name, 0)
+
+    def _bump_revision(self, app_name):
+        """Call with the lock held whenever the app's config (and so its templates) changes."""
+        self.revisions[app_name] = self.revisions.get(app_name, 0) + 1
 
     def _save_to_disk(self, app_name):
+        self._bump_revision(app_name)
         with open(self._get_config_path(app_name), 'w', encoding='utf-8') as f:
             json.dump(self.apps_data[app_name], f, ensure_ascii=False, indent=2)
 
@@ -138,13 +332,28 @@ class StorageManager:
                     try:
                         with open(path, 'r', encoding='utf-8') as f:
                             self.apps_data[app_name] = json.load(f)
+                        self._bump_revision(app_name)
                     except:
                         pass
             return self.apps_data.get(app_name, {})
 
     def write_log(self, app_name, msg, log_type):
-        with open(self._get_log_path(app_name), 'a', encoding='utf-8') as f:
-            f.write(str(msg).strip() + "\n")
+        self.write_records(app_name, [parse_record(msg, log_type)])
+
+    def write_batch(self, app_name, msgs, log_type):
+        """
+        Append a whole frame of raw records. The app's writer buffers them and
+        flushes on size or age (storage.flush_bytes / flush_interval).
+        """
+        self.write_records(app_name, parse_frame(msgs, log_type))
+
+    def write_records(self, app_name, records):
+        """Like write_batch, for a frame already parsed by parser.parse_frame."""
+        if records: self.writers.write(app_name, records)
+
+    def flush_logs(self, app_name=None):
+        """Make buffered records visible to readers (search, download)."""
+        self.writers.flush(app_name)
 
 
 _storage = StorageManager()
@@ -0,0 +1,86 @@
+"""
+Compiled templates per app, shared by every LogDecoder.
+
+A template "took %s ms" becomes the format string "took {} ms" plus its
+argument count, so rendering a record is one str.format call. Templates
+with other %-directives ("%d", "%%") keep the %-operator, as do calls with
+the wrong number of variables, so the output is the same as
+`content % tuple(args)` with its error fallback.
+
+Entries are keyed by app and rebuilt when the app's config revision
+(StorageManager.get_config_revision) changes: on every load or save of the
+app's config.
+"""
+import threading
+
+
+class CompiledTemplate:
+    __slots__ = ("content", "nargs", "fmt")
+
+    def __init__(self, content):
+        self.content = content
+        self.nargs = content.count("%s")
+        # Fast path only when "%s" is the sole %-directive
+        self.fmt = content.replace("{", "{{").replace("}", "}}").replace("%s", "{}") if "%" not in content.replace("%s", "") else None
+
+    def render(self, args):
+        if not args: return self.content
+        if self.fmt is not None and len(args) == self.nargs: return self.fmt.format(*args)
+        try:
+            return self.content % tuple(args)
+        except:
+            return f"{self.content} [Vars Error: {list(args)}]"
+
+
+class CompiledApp:
+    """Function names and compiled templates of one config revision."""
+
+    def __init__(self, config, revision=None):
+        self.revision = revision
+        self.func_names = {}
+        self.contents = {}
+        self.templates = {}
+        for fid, func in (config or {}).get("functions", {}).items():
+            self.func_names[str(fid)] = func.get("name", f"Func<{fid}>")
+            for tid, tpl in func.get("templates", {}).items():
+                content = self.contents[str(tid)] = tpl.get("content", f"Tpl<{tid}>")
+                self.templates[str(tid)] = CompiledTemplate(content)
+        # Records carry template ids as JSON ints
+        for tid in list(self.templates):
+            if tid.isdigit(): self.templates[int(tid)] = self.templates[tid]
+
+    def template(self, tid):
+        # Malformed records can carry any JSON value (even unhashable) as the id
+        if tid.__class__ not in (int, str): tid = str(tid)
+        tpl = self.templates.get(tid)
+        if tpl is None:
+            tid = str(tid)
+            tpl = self.templates.get(tid) or CompiledTemplate(f"Unresolved<{tid}>")
+        return tpl
+
+
+class TemplateCache:
+    def __init__(self):
+        self.apps = {}
+        self.lock = threading.Lock()
+
+    def get(self, app_name, config, revision):
+        """CompiledApp for app_name, compiling `config` if the cached one is older than `revision`."""
+        entry = self.apps.get(app_name)
+        if entry is not None and entry.revision == revision: return entry
+        entry = CompiledApp(config, revision)
+        with self.lock:
+            self.apps[app_name] = entry
+        return entry
+
+    def invalidate(self, app_name=None):
+        with self.lock:
+            if app_name is None: self.apps.clear()
+            else: self.apps.pop(app_name, None)
+
+
+_template_cache = TemplateCache()
+
+
+def get_template_cache():
+    return _template_cache
@@ -1,11 +1,13 @@
 import logging
 import json
+import itertools
 from flask import Flask, jsonify, request, render_template, Response, stream_with_context
 from .stats import get_monitor
-from .balancer import get_balancer
+from .balancer import get_balancer, STRATEGIES
 from .config import get_config
 from .storage import get_storage
 from .decoder import LogDecoder
+from .metrics import get_metrics
 
 log = logging.getLogger('werkzeug')
 log.setLevel(logging.ERROR)
@@ -23,6 +25,19 @@ def api_status():
     return jsonify(get_monitor().get_snapshot())
 
 
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(get_monitor().prometheus_text(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.route('/api/traffic')
+def api_traffic():
+    """Ingest rates of one app (or all) and its busiest functions."""
+    app_name = request.args.get('app')
+    top = request.args.get('top', 10, type=int)
+    return jsonify(get_monitor().get_traffic_snapshot(app_name, max(0, top)))
+
+
 @app.route('/api/balancer')
 def api_balancer():
     cfg = get_config().algo_config
@@ -37,7 +52,7 @@ def api_balancer_switch():
     d = request.json
     strategy = d.get('strategy')
     params = d.get('params', {})
-    if strategy not in ['zscore', 'weighted_entropy']:
+    if strategy not in STRATEGIES:
         return jsonify({"error": "Invalid strategy"}), 400
 
     get_balancer().update_strategy(strategy, params)
@@ -68,14 +83,41 @@ def api_registry():
     return jsonify(config)
 
 
+@app.route('/api/agents')
+def api_agents():
+    app_name = request.args.get('app', 'root')
+    return jsonify(get_storage().get_agent_stats(app_name))
+
+
 @app.route('/api/control', methods=['POST'])
 def api_control():
     d = request.json
-    enable = (d.get('action') == 'unmute')
+    action = d.get('action')
+    if action in ('watch', 'unwatch'):
+        get_storage().set_watch(d.get('app', 'root'), d.get('id'), action == 'watch')
+        return jsonify({"status": "ok"})
+    enable = (action == 'unmute')
     get_storage().update_control(d.get('app', 'root'), d.get('id'), d.get('sub_id'), enable, source="manual")
     return jsonify({"status": "ok"})
 
 
+def _time_arg(name):
+    """Optional epoch-seconds query parameter."""
+    try:
+        return float(request.args[name])
+    except (KeyError, ValueError):
+        return None
+
+
+@app.route('/api/metrics')
+def api_metrics():
+    """History of an app (or one of its functions): records, bytes, blocked, mutes per step."""
+    app_name = request.args.get('app', '')
+    if not app_name: return jsonify({"error": "app is required"}), 400
+    step = _time_arg('step')
+    return jsonify(get_metrics().query(app_name, request.args.get('fid') or None, _time_arg('from'), _time_arg('to'), step if step and step > 0 else None))
+
+
 @app.route('/api/search')
 def api_search():
     app_name = request.args.get('app', '')
@@ -83,7 +125,47 @@ def api_search():
     keyword = request.args.get('kw', '')
     if not app_name or not keyword: return jsonify([])
     decoder = LogDecoder(app_name)
-    return jsonify(decoder.search_logs(s_type, keyword, limit=500))
+    return jsonify(decoder.search_logs(s_type, keyword, limit=500, start=_time_arg('from'), end=_time_arg('to')))
+
+
+@app.route('/api/search/stream')
+def api_search_stream():
+    """
+    NDJSON: one {"line": ...} per decoded log line as it is found, then
+    {"cursor": ..., "count": n}. Pass the cursor back to get the next page;
+    it is null when there is nothing more. A scan failing midway ends the
+    stream with {"error": ...} instead.
+    """
+    app_name = request.args.get('app', '')
+    s_type = request.args.get('type', 'function')
+    keyword = request.args.get('kw', '')
+    if not app_name or not keyword: return jsonify({"error": "app and kw are required"}), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', 500)), 10000))
+    except ValueError:
+        limit = 500
+    decoder = LogDecoder(app_name)
+    pages = decoder.search_page(s_type, keyword, limit=limit, start=_time_arg('from'), end=_time_arg('to'), cursor=request.args.get('cursor'))
+    try:
+        first = next(pages)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def generate():
+        count = 0
+        try:
+            for texts, cursor in itertools.chain([first], pages):
+                if texts is None:
+                    yield json.dumps({"cursor": cursor, "count": count}) + "\n"
+                    break
+                count += len(texts)
+                yield "".join(json.dumps({"line": t}) + "\n" for t in texts)
+        except Exception as e:
+            # The 200 header is already sent, so report it in-band
+            print(f"[LogFun-Manager] Search stream failed for {app_name}: {e}")
+            yield json.dumps({"error": str(e), "count": count}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
 
 
 @app.route('/api/download')
@@ -91,7 +173,7 @@ def api_download():
     app_name = request.args.get('app', '')
     if not app_name: return "App Name Missing", 400
     decoder = LogDecoder(app_name)
-    return Response(stream_with_context(decoder.decode_all_generator()), mimetype="text/plain", headers={"Content-Disposition": f"attachment;filename={app_name}_decoded.txt"})
+    return Response(stream_with_context(decoder.decode_all_generator(_time_arg('from'), _time_arg('to'))), mimetype="text/plain", headers={"Content-Disposition": f"attachment;filename={app_name}_decoded.txt"})
 
 
 @app.route('/api/upload', methods=['POST'])
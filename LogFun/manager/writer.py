@@ -0,0 +1,220 @@
+import os
+import time
+import atexit
+import threading
+from .segments import frame_bounds
+from .indexer import frame_keys
+from .stats import get_monitor
+
+FSYNC_POLICIES = ("never", "interval", "always")
+
+
+class AppLogWriter:
+    """
+    Single writer for one app's segments. Buffers whole records; a flush
+    appends them in one call under the app's lock, so concurrent connections
+    never interleave partial lines. While writes fail the buffer is kept for
+    the flush thread to retry, up to max_buffer bytes; older frames beyond
+    that are dropped and counted (observe_write_lost).
+    """
+
+    def __init__(self, segments, flush_bytes, fsync, fsync_interval, monitor=None, max_buffer=16777216):
+        self.segments = segments
+        self.monitor = monitor
+        self.flush_bytes = flush_bytes
+        self.max_buffer = max(flush_bytes, max_buffer)
+        self.failing = False
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.pending = 0
+        self.first_pending = 0.0
+        self.last_write = time.time()
+        self.last_fsync = time.time()
+
+    def write(self, records):
+        """Buffer one frame of ParsedRecords."""
+        data = "".join([r.line for r in records])
+        lo, hi = frame_bounds(records)
+        fids, tids = frame_keys(records)
+        with self.lock:
+            if not self.buffer: self.first_pending = time.time()
+            self.buffer.append((data, len(records), lo, hi, fids, tids))
+            self.pending += len(data)
+            if self.failing:
+                # Leave retries to the flush thread; the ingest path only bounds the buffer
+                if self.pending > self.max_buffer: self._drop_oldest()
+            elif self.pending >= self.flush_bytes:
+                try:
+                    self._flush()
+                except OSError as e:
+                    print(f"[LogFun-Manager] Log write error for {self.segments.app_name}: {e}")
+
+    def flush(self, older_than=None):
+        with self.lock:
+            if not self.buffer: return
+            if older_than is not None and self.first_pending > older_than: return
+            self._flush()
+
+    def _flush(self):
+        t_write = time.perf_counter()
+        try:
+            self.segments.write(self.buffer)
+        except OSError:
+            self.failing = True
+            if self.pending > self.max_buffer: self._drop_oldest()
+            raise
+        self.failing = False
+        records = sum(c[1] for c in self.buffer)
+        nbytes = self.pending
+        self.buffer = []
+        self.pending = 0
+        now = time.time()
+        self.last_write = now
+        if self.fsync == "always" or (self.fsync == "interval" and now - self.last_fsync >= self.fsync_interval):
+            os.fsync(self.segments.f.fileno())
+            self.last_fsync = now
+        if self.monitor is not None:
+            # The disk side of ingest, write plus fsync, as its own stage
+            seconds = time.perf_counter() - t_write
+            self.monitor.observe_write(seconds, nbytes)
+            self.monitor.observe_stages(records, {"flush": seconds})
+
+    def _drop_oldest(self):
+        lost = 0
+        while self.buffer and self.pending > self.max_buffer:
+            data, records = self.buffer.pop(0)[:2]
+            self.pending -= len(data)
+            lost += records
+        if self.buffer: self.first_pending = time.time()
+        if lost and self.monitor is not None: self.monitor.observe_write_lost(self.segments.app_name, lost)
+
+    def release(self, idle_for):
+        """Close the handle if nothing was written for idle_for seconds; it reopens on demand."""
+        with self.lock:
+            if not self.buffer and time.time() - self.last_write > idle_for:
+                self.segments.release()
+
+    def close(self):
+        with self.lock:
+            if self.buffer: self._flush()
+            if self.fsync != "never" and self.segments.f is not None: os.fsync(self.segments.f.fileno())
+            self.segments.close()
+
+
+class LogWriterPool:
+    """
+    Per-app writers plus two background threads: one flushes buffers older
+    than flush_interval, saves manifests and releases idle handles; the other
+    (start_maintenance) compresses sealed segments and applies retention
+    every maintain_interval.
+
+    segments_for: callable(app_name) -> writable AppSegments. Flush timings
+    go to `monitor` (observe_write), the process-wide LogMonitor by default.
+    max_buffer caps the bytes an app's writer keeps while writes fail.
+    list_apps: callable() -> app names on disk; the compactor maintains those
+    too (the ones `owns` accepts, all by default), not just apps written
+    since start. Apps without a writer are maintained through their segments
+    alone, which a writer created later takes over.
+    """
+
+    def __init__(self, segments_for, flush_bytes=65536, flush_interval=0.2, fsync="never", fsync_interval=1.0, idle_close=60.0, maintain_interval=10.0, max_buffer=16777216, list_apps=None):
+        if fsync not in FSYNC_POLICIES: fsync = "never"
+        self.segments_for = segments_for
+        self.list_apps = list_apps
+        self.owns = None
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.idle_close = idle_close
+        self.maintain_interval = maintain_interval
+        self.max_buffer = max_buffer
+        self.writers = {}
+        # Segments of apps maintained but not written since start
+        self.idle = {}
+        self.monitor = get_monitor()
+        self.lock = threading.Lock()
+        self._thread = None
+        self._compactor = None
+        atexit.register(self.close_all)
+
+    def get(self, app_name):
+        w = self.writers.get(app_name)
+        if w is None:
+            with self.lock:
+                w = self.writers.get(app_name)
+                if w is None:
+                    segments = self.idle.pop(app_name, None) or self.segments_for(app_name)
+                    w = self.writers[app_name] = AppLogWriter(segments, self.flush_bytes, self.fsync, self.fsync_interval, self.monitor, self.max_buffer)
+                    if self._thread is None:
+                        self._thread = threading.Thread(target=self._flush_loop, daemon=True, name="LogFun-Writer")
+                        self._thread.start()
+        return w
+
+    def start_maintenance(self):
+        """Start the compactor, once. Only the process that writes the apps should."""
+        with self.lock:
+            if self._compactor is None:
+                self._compactor = threading.Thread(target=self._maintain_loop, daemon=True, name="LogFun-Compactor")
+                self._compactor.start()
+
+    def _segments(self, app_name):
+        """The app's writable segments: its writer's, else an idle instance."""
+        with self.lock:
+            w = self.writers.get(app_name)
+            if w is not None: return w.segments
+            segments = self.idle.get(app_name)
+            if segments is None: segments = self.idle[app_name] = self.segments_for(app_name)
+            return segments
+
+    def write(self, app_name, records):
+        self.get(app_name).write(records)
+
+    def flush(self, app_name=None):
+        with self.lock:
+            writers = [self.writers[app_name]] if app_name in self.writers else ([] if app_name else list(self.writers.values()))
+        for w in writers:
+            w.flush()
+            w.segments.save()
+
+    def close_all(self):
+        with self.lock:
+            writers = list(self.writers.values())
+            self.writers = {}
+        for w in writers:
+            try:
+                w.close()
+            except OSError:
+                pass
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval / 2)
+            now = time.time()
+            with self.lock:
+                items = list(self.writers.items())
+            for app_name, w in items:
+                try:
+                    w.flush(older_than=now - self.flush_interval)
+                    w.segments.save(min_interval=2.0)
+                    w.release(self.idle_close)
+                except OSError as e:
+                    print(f"[LogFun-Manager] Log flush error for {app_name}: {e}")
+
+    def _maintain_loop(self):
+        while True:
+            time.sleep(self.maintain_interval)
+            with self.lock:
+                apps = set(self.writers)
+            if self.list_apps is not None:
+                try:
+                    apps.update(a for a in self.list_apps() if self.owns is None or self.owns(a))
+                except OSError as e:
+                    print(f"[LogFun-Manager] App listing error: {e}")
+            for app_name in sorted(apps):
+                try:
+                    self._segments(app_name).maintain()
+                except OSError as e:
+                    print(f"[LogFun-Manager] Segment maintenance error for {app_name}: {e}")
@@ -0,0 +1,105 @@
+"""
+Adaptive tracing check for class-wide tracing, where every method shares the
+class logger.
+
+Svc.outer logs on every call and calls Svc.inner, which stays silent until it
+has gone dormant and then starts logging. The inner log has to register as a
+template of inner (not of outer), land in a record of its own function id,
+and re-arm inner. A generator method never goes dormant. Exits non-zero on
+any failure. Needs no running Manager.
+
+Usage:
+    python test_adaptive_tracing.py
+"""
+import sys
+import tempfile
+from LogFun import traced, basicConfig
+from LogFun.core.agent import get_agent
+from LogFun.core.coreFunction import FunctionTracingGhost
+from LogFun.core.registry import get_registry
+
+ADAPTIVE_AFTER = 3
+
+basicConfig(mode='dev', logtype='compress', output=tempfile.mkdtemp(prefix="logfun_adaptive_"), app_name='adaptive_test_app', adaptive_after=ADAPTIVE_AFTER)
+
+# Keep what the agent is handed instead of printing it (dev mode)
+payloads = []
+# Compressed records as (fid, payload)
+records = lambda: [(p.split(" ")[2], p) for p, t in payloads if t == "compress"]
+get_agent().log = lambda payload, log_type="compress": payloads.append((payload, log_type))
+
+
+@traced
+class Svc:
+
+    def __init__(self):
+        self.talk = False
+
+    def outer(self, n):
+        self.__log("outer %s", n)
+        self.inner(n)
+
+    def inner(self, n):
+        if self.talk: self.__log("inner logged %s", n)
+
+    def numbers(self, n):
+        for i in range(n):
+            yield i
+
+
+@traced
+def standalone(talk):
+    if talk: standalone._log.info("standalone logged")
+
+
+def ghost_of(method):
+    return next(c.cell_contents for c in method.__closure__ if isinstance(c.cell_contents, FunctionTracingGhost))
+
+
+def templates(fid):
+    func = get_registry().data["functions"][str(fid)]
+    return {t["content"] for t in func["templates"].values()}
+
+
+def check(name, ok):
+    print(f"  {'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+if __name__ == "__main__":
+    print(f"=== Adaptive tracing, class-wide (adaptive_after={ADAPTIVE_AFTER}) ===")
+    svc = Svc()
+    inner = ghost_of(Svc.inner)
+    outer = ghost_of(Svc.outer)
+    gen = ghost_of(Svc.numbers)
+    ok = True
+
+    for n in range(ADAPTIVE_AFTER + 2):
+        svc.outer(n)
+        list(svc.numbers(2))
+    ok &= check("silent inner goes dormant", inner.dormant)
+    ok &= check("logging outer stays armed", not outer.dormant)
+    ok &= check("generator method stays armed", not gen.dormant)
+
+    svc.talk = True
+    del payloads[:]
+    svc.outer("wake")
+    ok &= check("inner re-armed by its own log", not inner.dormant)
+    # The waking call itself is untraced: its log goes out as an outside-trace record of inner
+    ok &= check("inner log is a template of inner", any(t.startswith("inner logged %s") for t in templates(inner.cached_func_id)))
+    ok &= check("outer templates untouched", templates(outer.cached_func_id) == {"outer %s"})
+    ok &= check("outer record holds outer's log only", [(fid, p.endswith('["wake"]')) for fid, p in records()] == [(str(outer.cached_func_id), True)])
+
+    del payloads[:]
+    svc.outer("traced")
+    tpl = [tid for tid, t in get_registry().data["functions"][str(inner.cached_func_id)]["templates"].items() if t["content"] == "inner logged %s"]
+    ok &= check("re-armed inner is traced again", [fid for fid, _ in records()] == [str(inner.cached_func_id), str(outer.cached_func_id)])
+    ok &= check("its log is in its own record", bool(tpl) and any(fid == str(inner.cached_func_id) and f'["INFO", {tpl[0]}]' in p for fid, p in records()))
+
+    fn = ghost_of(standalone)
+    for _ in range(ADAPTIVE_AFTER):
+        standalone(False)
+    ok &= check("silent function goes dormant", fn.dormant)
+    standalone(True)
+    ok &= check("function re-armed by its own log", not fn.dormant and any(t.startswith("standalone logged") for t in templates(fn.cached_func_id)))
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,366 @@
+"""
+Repeatable benchmark harness for LogFun's own agent paths.
+
+Covers unmuted / function-muted / template-muted calls, NORMAL vs COMPRESS,
+FILE vs REMOTE (against an in-process stand-in manager), 1-64 threads, large
+variable payloads and generator/async functions. Results are machine-readable
+and can be compared against a stored baseline so regressions fail fast.
+
+Usage:
+    python test_agent_benchmark.py --save-baseline bench_baseline.json
+    python test_agent_benchmark.py --baseline bench_baseline.json --tolerance 0.25
+    python test_agent_benchmark.py --only remote --json bench_results.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import platform
+import tempfile
+import threading
+import tracemalloc
+import socketserver
+from LogFun import traced, basicConfig
+from LogFun.core.agent import get_agent
+from LogFun.core.net import get_network_client
+from LogFun.core.registry import get_registry
+from LogFun.manager.protocol import unpack_packet, pack_packet, TYPE_HANDSHAKE, TYPE_LOG_DATA, TYPE_HEARTBEAT
+
+LARGE_TEXT = "x" * 2048
+LARGE_LIST = list(range(100))
+
+# --- 1. Traced workloads (two log statements per call) ---
+
+
+@traced
+def bench_small(i):
+    bench_small._log("Processing item %s with status %s", (i, "OK"))
+    bench_small._log("Item %s done", i)
+    return i
+
+
+@traced
+def bench_large(i):
+    bench_large._log("Payload %s for item %s", (LARGE_TEXT, i))
+    bench_large._log("Vector %s", (LARGE_LIST, ))
+    return i
+
+
+@traced
+def bench_generator(i):
+    bench_generator._log("Generating from %s", i)
+    bench_generator._log("Generator %s primed", i)
+    yield i
+    yield i + 1
+
+
+@traced
+async def bench_async(i):
+    bench_async._log("Awaiting item %s", i)
+    bench_async._log("Awaited item %s", i)
+    return i
+
+
+WORKLOADS = {"small": bench_small, "large": bench_large, "generator": bench_generator, "async": bench_async}
+
+# --- 2. In-process stand-in manager ---
+
+
+class StandInHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        while True:
+            p_type, body = unpack_packet(self.request)
+            if p_type is None: break
+            with server.counter_lock:
+                server.bytes_received += len(body) + 6
+            if p_type == TYPE_LOG_DATA:
+                data = json.loads(body.decode('utf-8'))
+                logs = data.get("log", [])
+                with server.counter_lock:
+                    server.records_received += len(logs) if isinstance(logs, list) else 1
+            elif p_type in (TYPE_HANDSHAKE, TYPE_HEARTBEAT):
+                resp = {"timestamp": time.time()}
+                self.request.sendall(pack_packet(TYPE_HEARTBEAT, json.dumps(resp).encode('utf-8')))
+
+
+class StandInManager(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.counter_lock = threading.Lock()
+        self.bytes_received = 0
+        self.records_received = 0
+
+    def counters(self):
+        with self.counter_lock:
+            return self.bytes_received, self.records_received
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.server_address[1]
+
+
+# --- 3. Scenario matrix ---
+
+
+def build_scenarios(thread_counts):
+    base = {"mode": "file", "logtype": "compress", "mute": "none", "workload": "small", "threads": 1}
+    variants = [
+        {},
+        {"mute": "function"},
+        {"mute": "template"},
+        {"logtype": "normal"},
+        {"workload": "large"},
+        {"workload": "large", "logtype": "normal"},
+        {"workload": "generator"},
+        {"workload": "async"},
+        {"mode": "remote"},
+        {"mode": "remote", "logtype": "normal"},
+        {"mode": "remote", "workload": "large"},
+        {"mode": "remote", "mute": "function"},
+    ]
+    for n in thread_counts:
+        if n == 1: continue
+        variants.append({"threads": n})
+        variants.append({"mode": "remote", "threads": n})
+
+    scenarios = []
+    for v in variants:
+        s = dict(base, **v)
+        s["name"] = "{mode}-{logtype}-{mute}-{workload}-t{threads}".format(**s)
+        scenarios.append(s)
+    return scenarios
+
+
+# --- 4. Runner ---
+
+
+def func_id_of(fn):
+    raw = fn.__wrapped__
+    key = f"{os.path.abspath(raw.__code__.co_filename)}:{raw.__qualname__}"
+    return str(get_registry().get_func_id(key))
+
+
+def set_mute(fn, mute):
+    func = get_registry().data["functions"].get(func_id_of(fn))
+    if not func: return
+    func["enabled"] = (mute != "function")
+    for tpl in func.get("templates", {}).values():
+        tpl["enabled"] = (mute != "template")
+
+
+def call_range(fn, workload, start, count):
+    if workload == "generator":
+        for i in range(start, start + count):
+            for _ in fn(i):
+                pass
+    elif workload == "async":
+
+        async def driver():
+            for i in range(start, start + count):
+                await fn(i)
+
+        asyncio.run(driver())
+    else:
+        for i in range(start, start + count):
+            fn(i)
+
+
+def run_calls(fn, workload, iterations, threads):
+    """Returns wall-clock nanoseconds to issue `iterations` calls across `threads` threads."""
+    if threads == 1:
+        t0 = time.perf_counter_ns()
+        call_range(fn, workload, 0, iterations)
+        return time.perf_counter_ns() - t0
+
+    per_thread = iterations // threads
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(idx):
+        barrier.wait()
+        call_range(fn, workload, idx * per_thread, per_thread)
+
+    pool = [threading.Thread(target=worker, args=(i, )) for i in range(threads)]
+    for t in pool:
+        t.start()
+    barrier.wait()
+    t0 = time.perf_counter_ns()
+    for t in pool:
+        t.join()
+    return time.perf_counter_ns() - t0
+
+
+def drain(timeout=30.0):
+    """Wait until the agent worker and network sender have nothing left in flight."""
+    agent = get_agent()
+    client = get_network_client()
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if agent._queue.unfinished_tasks == 0 and client.log_queue.unfinished_tasks == 0:
+            break
+        time.sleep(0.05)
+    # The worker flushes partial batches after FLUSH_INTERVAL (0.5s)
+    time.sleep(0.7)
+
+
+def run_scenario(sc, iterations, out_dir, manager_port, manager, repeats=5):
+    app_name = "bench_" + sc["name"].replace("-", "_")
+    basicConfig(mode=sc["mode"], logtype=sc["logtype"], output=out_dir, app_name=app_name, manager_ip="127.0.0.1", manager_port=manager_port)
+    fn = WORKLOADS[sc["workload"]]
+    log_path = os.path.join(out_dir, f"{app_name}.log")
+
+    # Warm-up registers the function and its templates before muting
+    set_mute(fn, "none")
+    call_range(fn, sc["workload"], 0, 50)
+    set_mute(fn, sc["mute"])
+    drain()
+
+    size_before = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+    wire_before, rec_before = manager.counters()
+
+    # One run is at the mercy of the scheduler; timing is gated on the best of
+    # N, each starting with the agent idle
+    runs_ns = []
+    for _ in range(max(1, repeats)):
+        runs_ns.append(run_calls(fn, sc["workload"], iterations, sc["threads"]))
+        drain()
+    runs_ns.sort()
+    calls = (iterations // sc["threads"]) * sc["threads"]
+
+    if sc["mode"] == "remote":
+        wire_after, rec_after = manager.counters()
+        out_bytes, records = wire_after - wire_before, rec_after - rec_before
+    else:
+        # Count the lines written: NORMAL mode writes several per call
+        out_bytes, records = 0, 0
+        if os.path.exists(log_path):
+            with open(log_path, 'rb') as f:
+                f.seek(size_before)
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    out_bytes += len(chunk)
+                    records += chunk.count(b"\n")
+
+    # Allocation passes on a smaller sample; tracemalloc distorts timing. The
+    # agent's threads would allocate concurrently, so hold the GIL through each
+    # pass (the calls only enqueue) and keep the smallest of a few.
+    alloc_calls = max(1, min(2000, iterations // 10))
+    alloc_bytes, blocks = None, None
+    switch = sys.getswitchinterval()
+    for _ in range(3):
+        sys.setswitchinterval(60.0)
+        tracemalloc.start()
+        snap_before = tracemalloc.take_snapshot()
+        base_mem, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        call_range(fn, sc["workload"], 0, alloc_calls)
+        _, peak_mem = tracemalloc.get_traced_memory()
+        snap_after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        sys.setswitchinterval(switch)
+        n_blocks = sum(d.count_diff for d in snap_after.compare_to(snap_before, 'filename'))
+        if alloc_bytes is None or peak_mem - base_mem < alloc_bytes: alloc_bytes = peak_mem - base_mem
+        if blocks is None or n_blocks < blocks: blocks = n_blocks
+        drain()
+    set_mute(fn, "none")
+
+    return {
+        "name": sc["name"],
+        "scenario": {k: v for k, v in sc.items() if k != "name"},
+        "calls": calls,
+        "repeats": len(runs_ns),
+        "ns_per_call": round(runs_ns[0] / calls, 1),
+        "ns_per_call_median": round(runs_ns[len(runs_ns) // 2] / calls, 1),
+        "alloc_bytes_per_call": round(alloc_bytes / alloc_calls, 1),
+        "alloc_blocks_per_call": round(blocks / alloc_calls, 2),
+        "bytes_out": out_bytes,
+        "bytes_per_record": round(out_bytes / records, 1) if records else None,
+    }
+
+
+# --- 5. Baseline comparison ---
+
+
+# Per-call changes too small to count as a regression (background threads show up in tracemalloc)
+NOISE_FLOOR = {"alloc_bytes_per_call": 32.0, "alloc_blocks_per_call": 0.5}
+
+
+def compare(results, baseline, tolerance):
+    base_map = {r["name"]: r for r in baseline.get("results", [])}
+    regressions = []
+    for r in results:
+        b = base_map.get(r["name"])
+        if not b: continue
+        for metric in ("ns_per_call", "alloc_bytes_per_call", "alloc_blocks_per_call", "bytes_per_record"):
+            new, old = r.get(metric), b.get(metric)
+            # Allocation deltas can be zero or negative (freed caches); no ratio then
+            if new is None or old is None or old <= 0: continue
+            ratio = new / old
+            r.setdefault("vs_baseline", {})[metric] = round(ratio, 3)
+            if ratio > 1 + tolerance and new - old > NOISE_FLOOR.get(metric, 0):
+                regressions.append(f"{r['name']}: {metric} {old} -> {new} (x{ratio:.2f})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LogFun agent benchmark suite")
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--threads", default="1,4,16,64", help="comma-separated thread counts")
+    parser.add_argument("--only", default="", help="run scenarios whose name contains this substring")
+    parser.add_argument("--json", default="", help="write results to this file")
+    parser.add_argument("--baseline", default="", help="compare against this stored result file")
+    parser.add_argument("--save-baseline", default="", help="store these results as the new baseline")
+    parser.add_argument("--repeats", type=int, default=5, help="timed runs per scenario; ns/call is the fastest")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown ratio before failing")
+    opts = parser.parse_args()
+
+    manager = StandInManager()
+    port = manager.start()
+    out_dir = tempfile.mkdtemp(prefix="logfun_bench_")
+
+    scenarios = [s for s in build_scenarios([int(x) for x in opts.threads.split(",") if x]) if opts.only in s["name"]]
+    print(f"=== LogFun Agent Benchmark ({opts.iterations} calls x {opts.repeats} runs/scenario, {len(scenarios)} scenarios) ===")
+    print(f"{'scenario':<44}{'ns/call':>12}{'alloc B/call':>14}{'bytes/rec':>12}")
+
+    results = []
+    for sc in scenarios:
+        r = run_scenario(sc, opts.iterations, out_dir, port, manager, opts.repeats)
+        results.append(r)
+        print(f"{r['name']:<44}{r['ns_per_call']:>12.1f}{r['alloc_bytes_per_call']:>14.1f}{str(r['bytes_per_record']):>12}")
+
+    report = {
+        "meta": {"python": sys.version.split()[0], "platform": platform.platform(), "cpus": os.cpu_count(), "iterations": opts.iterations, "repeats": opts.repeats, "timestamp": time.time(), "host": socket.gethostname()},
+        "results": results,
+    }
+
+    exit_code = 0
+    if opts.baseline:
+        with open(opts.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), opts.tolerance)
+        if regressions:
+            print("\n[FAIL] Regressions beyond tolerance:")
+            for line in regressions:
+                print("  " + line)
+            exit_code = 1
+        else:
+            print("\n[OK] No regressions against baseline.")
+
+    if opts.json:
+        with open(opts.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if opts.save_baseline:
+        with open(opts.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {opts.save_baseline}")
+
+    manager.shutdown()
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
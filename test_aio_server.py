@@ -0,0 +1,70 @@
+"""
+Checks for the asyncio ingest engine (LogFun/manager/aio_server.py).
+
+Simulated agents (LogFun.manager.loadgen) send compressed batches to an
+in-process AsyncIngestServer, which is then closed while they are still
+connected and sending: once after shutdown() and once with the loop still
+running. Records must reach storage, every connection must be closed, and
+closing must not produce handler errors (e.g. work sent to an executor that
+is already shut down). Exits non-zero on any failure. Needs no running
+Manager.
+
+Usage:
+    python test_aio_server.py
+"""
+import io
+import sys
+import time
+import tempfile
+import threading
+import contextlib
+from LogFun.manager.storage import get_storage
+from LogFun.manager.stats import get_monitor
+from LogFun.manager.aio_server import AsyncIngestServer
+from LogFun.manager.loadgen import SimulatedAgent, TrafficProfile
+
+get_storage().root_dir = tempfile.mkdtemp(prefix="logfun_aio_")
+
+
+def check(name, ok):
+    print(f"  {'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+def run_case(name, stop_loop_first, agents=8, seconds=1.5):
+    monitor = get_monitor()
+    records_before = monitor.traffic.total_records
+    closed_before = monitor.total_connections - monitor.open_connections
+
+    server = AsyncIngestServer("127.0.0.1", 0, workers=2, max_pending=4)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stop_event = threading.Event()
+    sims = [SimulatedAgent(i, server.server_address, f"aio_test_{name}", TrafficProfile(functions=5), 2000, 50, 1.0, stop_event) for i in range(agents)]
+
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+        for a in sims:
+            a.start()
+        time.sleep(seconds)
+        # Close under load: the agents are still connected and sending
+        if stop_loop_first: server.shutdown()
+        server.server_close()
+        stop_event.set()
+        for a in sims:
+            a.stop()
+        for a in sims:
+            a.join(timeout=2.0)
+        if not stop_loop_first: server.shutdown()
+
+    ok = check(f"{name}: records ingested", monitor.traffic.total_records > records_before)
+    ok &= check(f"{name}: every connection closed", monitor.open_connections == 0 and monitor.total_connections - monitor.open_connections > closed_before)
+    ok &= check(f"{name}: no handler errors on close", "Handler error" not in out.getvalue() and "Traceback" not in out.getvalue() and monitor.handler_errors == 0)
+    if out.getvalue(): print("       " + out.getvalue().strip().replace("\n", "\n       ")[-1500:])
+    return ok
+
+
+if __name__ == "__main__":
+    print("=== asyncio ingest engine ===")
+    ok = run_case("stopped loop", True)
+    ok &= run_case("running loop", False)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,120 @@
+"""
+Checks for the balancer's analysis scheduler (LogFun/manager/balancer.py).
+
+Heartbeats must no longer run an analysis. One scheduler thread, started
+once with the first frame, must analyze every app with traffic on its own
+cadence; a pass must mute each app's outliers in a single storage call.
+Z-scores must be the same with and without NumPy. Exits non-zero on any
+failure. Needs no running Manager.
+
+Usage:
+    python test_balancer_scheduler.py
+"""
+import sys
+import json
+import time
+import tempfile
+import threading
+import statistics
+from LogFun.manager import balancer as balancer_mod
+from LogFun.manager.balancer import LogBalancer, zscores
+from LogFun.manager.parser import parse_frame
+from LogFun.manager.protocol import TYPE_HANDSHAKE, TYPE_HEARTBEAT
+from LogFun.manager.session import IngestSession
+from LogFun.manager.storage import get_storage
+
+APPS = ("scheduler_app_a", "scheduler_app_b")
+# Two spammy templates per app among twenty quiet ones
+SPAM = ((1, 1), (2, 1))
+
+storage = get_storage()
+storage.root_dir = tempfile.mkdtemp(prefix="logfun_scheduler_")
+
+
+def check(name, ok):
+    print(f"  {'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+class CountingStorage:
+    """The process storage, counting apply_mutes calls per app."""
+
+    def __init__(self):
+        self.calls = {}
+
+    def __getattr__(self, name):
+        return getattr(storage, name)
+
+    def apply_mutes(self, app_name, mutes, unmutes=(), source="balancer"):
+        self.calls.setdefault(app_name, []).append(sorted(mutes))
+        return storage.apply_mutes(app_name, mutes, unmutes, source)
+
+
+def config(app_name):
+    return {"app_name": app_name, "functions": {str(f): {"name": f"f{f}", "enabled": True, "templates": {"1": {"content": "x %s", "enabled": True}}} for f in range(1, 23)}}
+
+
+def check_heartbeats():
+    balancer = LogBalancer(storage=CountingStorage())
+    balancer.start = lambda: None
+    calls = []
+    balancer.run_analysis_cycle = lambda app: calls.append(app) or []
+    session = IngestSession(("127.0.0.1", 0), balancer=balancer)
+    session.handle_packet(TYPE_HANDSHAKE, json.dumps({"timestamp": time.time(), "app_name": APPS[0], "config": {}}).encode('utf-8'))
+    for _ in range(20):
+        session.handle_packet(TYPE_HEARTBEAT, json.dumps({"timestamp": time.time(), "blocked_stats": {}}).encode('utf-8'))
+    return check("heartbeats run no analysis", calls == [])
+
+
+def check_pass():
+    balancer = LogBalancer(storage=CountingStorage())
+    balancer.update_strategy("zscore", {"window_size": 60, "threshold": 2.0})
+    now = time.time()
+    for app_name in APPS:
+        storage.sync_config(app_name, config(app_name))
+        items = [((f, 1), None, 0) for f in range(1, 23) for _ in range(1000 if (f, 1) in SPAM else 10)]
+        balancer.strategy.record_many(app_name, now, items)
+    results = balancer.run_all()
+    ok = check("every app analyzed without heartbeats", all(sorted(results.get(a, [])) == list(SPAM) for a in APPS))
+    ok &= check("one storage call per app and pass", all(balancer.storage.calls[a] == [list(SPAM)] for a in APPS))
+    funcs = storage.get_app_config(APPS[0])["functions"]
+    ok &= check("mutes saved", all(funcs[str(f)]["templates"]["1"]["enabled"] is ((f, 1) not in SPAM) for f in range(1, 23)))
+    return ok
+
+
+def check_thread():
+    balancer = LogBalancer(storage=CountingStorage())
+    balancer.config.algo_config["interval"] = 0.1
+    passes = []
+    balancer.run_all = lambda: passes.append(time.time()) or {}
+    records = parse_frame([f'{time.time():.4f} 00000000 1 0.0 [["INFO", 1]] []'])
+    for app_name in APPS * 10:
+        balancer.record_batch(app_name, records)
+    balancer.start()
+    time.sleep(0.55)
+    threads = [t for t in threading.enumerate() if t.name == "LogFun-Balancer" and t is balancer._thread]
+    return check(f"one scheduler thread on its own cadence ({len(passes)} passes)", len(threads) == 1 and 3 <= len(passes) <= 6)
+
+
+def check_zscores():
+    counts = [10, 12, 9, 400, 11, 10]
+    mean, stdev = statistics.mean(counts), statistics.stdev(counts)
+    expected = [(c - mean) / stdev for c in counts]
+    vectorized = [float(z) for z in zscores(counts)]
+    real_np, balancer_mod.np = balancer_mod.np, None
+    try:
+        plain = zscores(counts)
+        flat = zscores([5, 5, 5])
+    finally:
+        balancer_mod.np = real_np
+    close = lambda a, b: all(abs(x - y) < 1e-9 for x, y in zip(a, b))
+    return check(f"z-scores with and without NumPy ({'NumPy' if real_np is not None else 'no NumPy installed'})", close(vectorized, expected) and close(plain, expected) and list(flat) == [0.0] * 3)
+
+
+if __name__ == "__main__":
+    print("=== Balancer scheduler ===")
+    ok = check_heartbeats()
+    ok &= check_pass()
+    ok &= check_thread()
+    ok &= check_zscores()
+    sys.exit(0 if ok else 1)
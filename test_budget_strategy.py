@@ -0,0 +1,144 @@
+"""
+Checks for the budget strategy (LogFun/manager/balancer.py) and the agent
+side of its sampling rates (LogFun/core/registry.py).
+
+fair_shares must fill demands smallest-first and split the rest by weight.
+On a simulated clock, an app over its records/s budget must get a sampling
+rate only for the template above its share; with entropy weighting a
+template of varied values must keep more than one that repeats itself.
+The rates must reach an agent through its config sync and drop about the
+right fraction, reported as blocked; counting those blocks as demand must
+keep the rate steady. Records above the slack are shed at ingest, and
+switching strategy clears the rates. Exits non-zero on any failure. Needs
+no running Manager.
+
+Usage:
+    python test_budget_strategy.py
+"""
+import sys
+import copy
+import random
+import tempfile
+from LogFun.core.registry import get_registry
+from LogFun.manager.balancer import LogBalancer, fair_shares
+from LogFun.manager.parser import parse_frame
+from LogFun.manager.stats import get_monitor
+from LogFun.manager.storage import get_storage
+
+APP = "budget_test_app"
+BUDGET = 400
+WINDOW = 10
+
+storage = get_storage()
+storage.root_dir = tempfile.mkdtemp(prefix="logfun_budget_")
+now = [1_700_000_000.0]
+
+
+def check(name, ok):
+    print(f"  {'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+def close(a, b, slack=1e-9):
+    return abs(a - b) <= slack
+
+
+def check_shares():
+    shares = fair_shares([50, 900, 50, 200], [1, 1, 1, 1], 400)
+    ok = check("small demands kept, rest split evenly", shares == [50, 150, 50, 150])
+    shares = fair_shares([900, 900], [1, 3], 400)
+    ok &= check("split by weight", close(shares[0], 100) and close(shares[1], 300))
+    ok &= check("under budget: everything kept", fair_shares([10, 20], [1, 1], 400) == [10, 20])
+    return ok
+
+
+def feed(balancer, per_sec, seconds=WINDOW):
+    """`per_sec` is {key: (records per second, values of record i)}."""
+    for _ in range(seconds):
+        now[0] += 1
+        items = [(key, values(i), 40) for key, (n, values) in per_sec.items() for i in range(n)]
+        balancer.strategy.record_many(APP, now[0], items)
+
+
+def strategy(weighting="equal"):
+    balancer = LogBalancer(clock=lambda: now[0])
+    balancer.update_strategy("budget", {"records_per_sec": BUDGET, "window_size": WINDOW, "weighting": weighting, "min_rate": 0.01, "enforce_slack": 1.5})
+    balancer.config.algo_config["burst_seconds"] = 5.0
+    return balancer
+
+
+def agent_config():
+    """Three functions of an agent, one template each; their keys and the config the Manager stores."""
+    registry = get_registry()
+    keys = []
+    for name in ("budget.py:spam", "budget.py:quiet_a", "budget.py:quiet_b"):
+        fid = registry.get_func_id(name)
+        keys.append((fid, registry.get_tpl_id(fid, f"{name} %s")))
+    data = copy.deepcopy(registry.data)
+    data["app_name"] = APP
+    return registry, keys, data
+
+
+def check_rates():
+    registry, (spam, a, b), data = agent_config()
+    storage.sync_config(APP, data)
+    balancer = strategy()
+    feed(balancer, {spam: (900, lambda i: [1]), a: (50, lambda i: [i]), b: (50, lambda i: [i])})
+    balancer.run_analysis_cycle(APP)
+    rates = balancer.strategy.sample_rates(APP)
+    ok = check(f"only the template over its share sampled ({rates})", list(rates) == [spam] and close(rates[spam], 300 / 900))
+
+    registry.sync_from_server(storage.get_app_config(APP))
+    registry.get_and_clear_stats()
+    rng_state = random.getstate()
+    random.seed(5)
+    kept = sum(registry.is_enabled(*spam) for _ in range(9000))
+    random.setstate(rng_state)
+    blocked = registry.get_and_clear_stats().get(f"{spam[0]}:{spam[1]}", 0)
+    ok &= check(f"agent keeps its share ({kept} of 9000)", abs(kept - 3000) < 200 and kept + blocked == 9000 and registry.is_enabled(*a))
+
+    # The agent now samples: a third arrives, the rest is reported blocked
+    for _ in range(WINDOW):
+        now[0] += 1
+        balancer.strategy.record_many(APP, now[0], [(spam, [1], 40)] * 300 + [(a, [1], 40)] * 50 + [(b, [1], 40)] * 50)
+        balancer.observe_blocked(APP, {f"{spam[0]}:{spam[1]}": 600})
+    balancer.run_analysis_cycle(APP)
+    ok &= check("blocked volume counted as demand: rate steady", close(balancer.strategy.sample_rates(APP)[spam], 300 / 900, 0.02))
+
+    balancer.update_strategy("zscore", {"window_size": 60, "threshold": 3.0})
+    balancer.run_analysis_cycle(APP)
+    funcs = storage.get_app_config(APP)["functions"]
+    ok &= check("rates cleared after a strategy switch", not any("sample" in t for f in funcs.values() for t in [f] + list(f["templates"].values())))
+    return ok
+
+
+def check_entropy():
+    _, (spam, a, _), data = agent_config()
+    storage.sync_config(APP, data)
+    balancer = strategy("entropy")
+    feed(balancer, {spam: (500, lambda i: ["same"]), a: (500, lambda i: [f"order-{i}"])})
+    balancer.run_analysis_cycle(APP)
+    rates = balancer.strategy.sample_rates(APP)
+    return check(f"varied values keep more ({rates.get(a, 1):.2f} vs {rates.get(spam, 1):.2f})", rates.get(a, 1) > rates.get(spam, 1) and close(rates[a] * 500 + rates[spam] * 500, BUDGET, 1))
+
+
+def check_backstop():
+    balancer = strategy()
+    monitor = get_monitor()
+    shed = monitor.shed.get(APP, 0)
+    records = parse_frame(['1.0 00000000 1 0.0 [["INFO", 1]] []'] * 5000)
+    kept = balancer.admit(APP, records)
+    # Burst of 5 s at 1.5 x the budget
+    ok = check("records past the burst shed at ingest", len(kept) == 3000 and monitor.shed[APP] - shed == 2000)
+    now[0] += 1
+    ok &= check("budget refilled each second", len(balancer.admit(APP, records)) == BUDGET * 1.5)
+    return ok
+
+
+if __name__ == "__main__":
+    print("=== Budget strategy ===")
+    ok = check_shares()
+    ok &= check_rates()
+    ok &= check_entropy()
+    ok &= check_backstop()
+    sys.exit(0 if ok else 1)
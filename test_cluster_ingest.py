@@ -0,0 +1,120 @@
+"""
+Checks for the multi-process ingest engine (LogFun/manager/cluster.py).
+
+Reads app names off unconsumed first packets, then runs a two-worker
+cluster on a temporary store: two apps with two connections each send
+numbered records. Every record must be stored once, each connection's
+records in the order sent, the handshake configs must reach the
+coordinator's config tree and the workers' traffic its monitor. Exits
+non-zero on any failure. Needs no running Manager.
+
+Usage:
+    python test_cluster_ingest.py
+"""
+import sys
+import json
+import time
+import random
+import socket
+import tempfile
+import threading
+from LogFun.manager.cluster import ClusterServer, peek_app_name
+from LogFun.manager.protocol import PACKET_HEAD, PROTO_VERSION, TYPE_HANDSHAKE, TYPE_LOG_DATA
+from LogFun.manager.storage import get_storage
+from LogFun.manager.stats import get_monitor
+from LogFun.manager.decoder import LogDecoder
+from LogFun.manager.loadgen import TrafficProfile
+
+APPS = ("cluster_test_a", "cluster_test_b")
+CONNS_PER_APP = 2
+FRAMES = 5
+FRAME_RECORDS = 100
+
+
+def check(name, ok):
+    print(f"  {'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+def packet(p_type, body):
+    data = json.dumps(body).encode('utf-8')
+    return PACKET_HEAD.pack(PROTO_VERSION, p_type, len(data)) + data
+
+
+def wait_for(cond, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline and not cond():
+        time.sleep(0.05)
+    return cond()
+
+
+def check_peek():
+    ok = True
+    for name in ("plain", 'with "quotes" é'):
+        a, b = socket.socketpair()
+        pkt = packet(TYPE_HANDSHAKE, {"timestamp": 0, "app_name": name})
+        a.sendall(pkt)
+        ok &= check(f"app name read: {name!r}", peek_app_name(b) == name)
+        ok &= check(f"first packet left unread: {name!r}", b.recv(len(pkt)) == pkt)
+        a.close()
+        b.close()
+    a, b = socket.socketpair()
+    a.sendall(packet(TYPE_LOG_DATA, {"log": []}))
+    ok &= check("no app name in a log frame", peek_app_name(b) is None)
+    a.close()
+    b.close()
+    return ok
+
+
+def send_app(port, app_name, conn_index, config, pool, t0):
+    """One agent connection; record i is stamped t0 + i ms."""
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.sendall(packet(TYPE_HANDSHAKE, {"timestamp": time.time(), "app_name": app_name, "config": config}))
+    for f in range(FRAMES):
+        logs = [f"{t0 + i / 1000:.4f} 00000000 {pool[i % len(pool)]}" for i in range(f * FRAME_RECORDS, (f + 1) * FRAME_RECORDS)]
+        sock.sendall(packet(TYPE_LOG_DATA, {"log": logs, "type": "compress"}))
+    time.sleep(0.5)
+    sock.close()
+
+
+if __name__ == "__main__":
+    print("=== Cluster ingest ===")
+    ok = check_peek()
+
+    storage = get_storage()
+    storage.root_dir = tempfile.mkdtemp(prefix="logfun_cluster_")
+    server = ClusterServer("127.0.0.1", 0, workers=2)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    ok &= check("app pinned to one worker", all(server.worker_for(a, ("10.0.0.1", 1)) == server.worker_for(a, ("10.0.0.2", 2)) for a in APPS))
+
+    profile = TrafficProfile(functions=4)
+    configs = {a: profile.build_config(a) for a in APPS}
+    pool = profile.build_pool(configs[APPS[0]], 50, random.Random(1))
+    # Each connection gets its own second of timestamps
+    t0 = int(time.time()) - 60
+    starts = {(a, c): t0 + 2 * (i * CONNS_PER_APP + c) for i, a in enumerate(APPS) for c in range(CONNS_PER_APP)}
+    senders = [threading.Thread(target=send_app, args=(port, a, c, configs[a], pool, t)) for (a, c), t in starts.items()]
+    for t in senders:
+        t.start()
+    for t in senders:
+        t.join()
+
+    total = len(starts) * FRAMES * FRAME_RECORDS
+    ok &= check("worker traffic reaches the coordinator's monitor", wait_for(lambda: get_monitor().get_snapshot()["total_logs"] >= total))
+    apps = get_monitor().get_traffic_snapshot(top=0)
+    ok &= check("traffic counted per app", all(apps.get(a, {}).get("total") == total // len(APPS) for a in APPS))
+    ok &= check("handshake configs in the coordinator", all(storage.get_app_config(a).get("functions", {}).keys() == configs[a]["functions"].keys() for a in APPS))
+    server.shutdown()
+    server.server_close()
+
+    # Workers flush on stop; read back what they wrote
+    for a in APPS:
+        stamps = [float(line.split(' ', 1)[0]) for line in LogDecoder(a).decode_all_generator()]
+        for c in range(CONNS_PER_APP):
+            start = starts[(a, c)]
+            mine = [s for s in stamps if start <= s < start + 1.5]
+            # A record may decode to several lines; keep the first of each
+            firsts = [s for i, s in enumerate(mine) if i == 0 or s != mine[i - 1]]
+            ok &= check(f"{a} connection {c}: every record stored, in order", firsts == [round(start + i / 1000, 4) for i in range(FRAMES * FRAME_RECORDS)])
+    sys.exit(0 if ok else 1)
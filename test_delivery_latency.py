@@ -0,0 +1,86 @@
+"""
+Checks for end-to-end delivery latency tracking (LogFun/core/net.py,
+LogFun/manager/session.py, LogFun/manager/stats.py).
+
+Feeds heartbeat round trips to an agent network client and checks that its
+clock offset comes from the lowest-RTT sample, then plays an agent whose
+clock runs behind the Manager's through an ingest session: the e2e,
+agent_queue and transit histograms must correct for the reported offset and
+be weighted by the frame's record count. Exits non-zero on any failure.
+Needs no running Manager.
+
+Usage:
+    python test_delivery_latency.py
+"""
+import sys
+import json
+import time
+import tempfile
+from LogFun.core.net import LogNetworkClient
+from LogFun.manager.protocol import PACKET_HEAD, TYPE_HANDSHAKE, TYPE_LOG_DATA, TYPE_HEARTBEAT
+from LogFun.manager.session import IngestSession
+from LogFun.manager.storage import get_storage
+from LogFun.manager.stats import get_monitor
+
+APP = "latency_test_app"
+# Manager clock minus agent clock
+OFFSET = 5.0
+
+get_storage().root_dir = tempfile.mkdtemp(prefix="logfun_latency_")
+
+
+def check(name, ok):
+    print(f"  {'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+def send(session, p_type, body):
+    return session.handle_packet(p_type, json.dumps(body).encode('utf-8'))
+
+
+def near(value, expected, slack):
+    return abs(value - expected) <= slack
+
+
+if __name__ == "__main__":
+    print("=== Delivery latency ===")
+
+    # Agent side: (sent, manager timestamp, received) of three heartbeats
+    client = LogNetworkClient()
+    client._update_clock(100.0, 105.6, 101.0)
+    client._update_clock(200.0, 205.1, 200.2)
+    client._update_clock(300.0, 305.9, 301.6)
+    ok = check("offset from the lowest-RTT sample", near(client.clock_offset, 5.0, 1e-9) and near(client.clock_rtt, 0.2, 1e-9))
+    client._update_clock(400.0, 395.0, 399.0)
+    ok &= check("negative RTT ignored", len(client.clock_samples) == 3)
+
+    # Manager side: the handshake reply echoes the agent timestamp
+    session = IngestSession(("127.0.0.1", 0))
+    agent_now = time.time() - OFFSET
+    reply = send(session, TYPE_HANDSHAKE, {"timestamp": agent_now, "app_name": APP, "config": {}})
+    _, p_type, _ = PACKET_HEAD.unpack_from(reply)
+    data = json.loads(reply[PACKET_HEAD.size:])
+    ok &= check("handshake reply echoes the agent timestamp", p_type == TYPE_HEARTBEAT and data["echo"] == agent_now)
+    client._handle_packet(TYPE_HEARTBEAT, json.dumps({"echo": time.time() - 0.01, "timestamp": data["timestamp"]}).encode('utf-8'))
+    ok &= check("client takes the offset from a heartbeat reply", len(client.clock_samples) == 4)
+
+    send(session, TYPE_HEARTBEAT, {"timestamp": agent_now, "app_name": APP, "clock": {"offset": OFFSET, "rtt": 0.001}})
+    ok &= check("session keeps the reported offset", session.clock_offset == OFFSET)
+
+    # A frame queued 300 ms and sent 100 ms ago, by the agent's clock
+    agent_now = time.time() - OFFSET
+    logs = [f'{agent_now:.4f} 00000000 0 0.0 [["INFO", 0]] [{i}]' for i in range(4)]
+    send(session, TYPE_LOG_DATA, {"log": logs, "type": "compress", "enq": agent_now - 0.3, "sent": agent_now - 0.1})
+    hists = get_monitor().get_latency_snapshot().get(APP, {})
+    ok &= check("e2e, agent_queue and transit recorded", sorted(hists) == ["agent_queue", "e2e", "transit"])
+    if hists:
+        ok &= check("weighted by records", all(h["count"] == len(logs) for h in hists.values()))
+        ok &= check("e2e corrected for the clock offset", near(hists["e2e"]["avg_ms"], 300, 50))
+        ok &= check("agent_queue is send - enqueue", near(hists["agent_queue"]["avg_ms"], 200, 1))
+        ok &= check("transit corrected for the clock offset", near(hists["transit"]["avg_ms"], 100, 50))
+
+    # Agents that do not stamp frames leave the histograms alone
+    send(session, TYPE_LOG_DATA, {"log": logs, "type": "compress"})
+    ok &= check("unstamped frames not counted", get_monitor().get_latency_snapshot()[APP]["e2e"]["count"] == len(logs))
+    get_storage().flush_logs()
+    sys.exit(0 if ok else 1)
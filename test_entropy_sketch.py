@@ -0,0 +1,120 @@
+"""
+Accuracy check for the streaming entropy sketch used by the Weighted Entropy
+strategy (LogFun/manager/sketch.py) against the exact entropy of the window.
+
+Each scenario streams frames of values into a WindowEntropy and, every few
+seconds of simulated time, compares its estimate with an exact Counter over
+the same window. Exits non-zero if any scenario is off by more than its
+tolerance. Needs no running Manager.
+
+Usage:
+    python test_entropy_sketch.py
+"""
+import sys
+import time
+import random
+from collections import Counter, deque
+from LogFun.manager.sketch import WindowEntropy, exact_entropy
+
+WINDOW = 60
+FRAMES_PER_SEC = 4
+FRAME = 50
+
+
+def stream(make_value, seconds, seed=1):
+    """Yields (ts, [values]) frames over `seconds` of simulated time."""
+    rnd = random.Random(seed)
+    for sec in range(seconds):
+        for _ in range(FRAMES_PER_SEC):
+            yield sec + 0.5, [make_value(rnd, sec) for _ in range(FRAME)]
+
+
+def run_scenario(name, make_value, seconds=180, tolerance=0.25, **opts):
+    sketch = WindowEntropy(WINDOW, **opts)
+    kept = deque()
+    worst = 0.0
+    checks, checked = 0, None
+    for ts, values in stream(make_value, seconds):
+        sketch.add_counts(ts, Counter(values))
+        kept.append((ts, values))
+        if int(ts) % 10 or checked == ts: continue
+        checked = ts
+        # Compare with the exact entropy of the slices the sketch still covers
+        now = ts
+        first = sketch.slices[0].start if sketch.total(now) else now
+        while kept and kept[0][0] < first:
+            kept.popleft()
+        exact = exact_entropy(v for _, vals in kept for v in vals)
+        est = sketch.entropy(now)
+        worst = max(worst, abs(est - exact))
+        checks += 1
+    ok = worst <= tolerance
+    print(f"{'OK  ' if ok else 'FAIL'} {name:<28} checks={checks:<3} max |err|={worst:.3f} bits (tolerance {tolerance})")
+    return ok
+
+
+def check_distinct(trials=8):
+    ok = True
+    for n in (10, 1000, 100000):
+        errors = []
+        for seed in range(trials):
+            # Random ints hash the same in every process, so the check is repeatable
+            rnd = random.Random(seed)
+            values = [rnd.getrandbits(64) for _ in range(n)]
+            sketch = WindowEntropy(WINDOW)
+            for i in range(0, n, FRAME):
+                sketch.add_counts(0, Counter(values[i:i + FRAME]))
+            errors.append(abs(sketch.distinct(0) - n) / n)
+        mean = sum(errors) / trials
+        # Exact while the sample holds every value; otherwise the standard error
+        # of a 64-value KMV sample is about 1/sqrt(64) = 12.5%
+        good = max(errors) == 0 if n <= 64 else mean <= 0.125
+        ok &= good
+        print(f"{'OK  ' if good else 'FAIL'} distinct n={n:<7}           mean rel err={mean:.3f} max={max(errors):.3f} ({trials} trials)")
+    return ok
+
+
+def check_memory():
+    """Slices and summaries stay bounded under all-distinct traffic."""
+    sketch = WindowEntropy(WINDOW)
+    for ts, values in stream(lambda r, s: r.getrandbits(64), 600):
+        sketch.add_counts(ts, Counter(values))
+    size = max(len(s.counts) for s in sketch.slices)
+    sample = max(len(s.sample) for s in sketch.slices)
+    good = len(sketch.slices) <= WINDOW // sketch.slice_seconds + 1 and size <= sketch.capacity and sample <= sketch.sample_size * 3 // 2
+    print(f"{'OK  ' if good else 'FAIL'} bounded memory               slices={len(sketch.slices)} max summary={size} max sample={sample}")
+    return good
+
+
+def check_speed():
+    sketch = WindowEntropy(WINDOW)
+    frames = list(stream(lambda r, s: str([r.getrandbits(32)]), 60))
+    t0 = time.perf_counter()
+    for ts, values in frames:
+        sketch.add_counts(ts, Counter(values))
+    per_rec = (time.perf_counter() - t0) / (len(frames) * FRAME) * 1e6
+    t0 = time.perf_counter()
+    sketch.entropy(59.5)
+    print(f"     speed (all distinct)         add={per_rec:.2f} us/value entropy={(time.perf_counter() - t0) * 1e3:.2f} ms")
+
+
+# Exact while the window has no more distinct values than the summary holds;
+# the zipf bound is the worst seen over ten seeds (0.21) plus a margin
+SCENARIOS = [
+    ("constant", lambda r, s: "['OK']", 0.001),
+    ("5 values (modulo)", lambda r, s: str([r.randrange(5), "OK"]), 0.001),
+    ("50 values", lambda r, s: r.randrange(50), 0.001),
+    ("zipf-like 10k", lambda r, s: int(10000**r.random()), 0.25),
+    ("all distinct", lambda r, s: r.getrandbits(64), 0.05),
+    ("90% one value + noise", lambda r, s: "hot" if r.random() < 0.9 else r.getrandbits(64), 0.05),
+    ("shift: spam -> distinct", lambda r, s: "spam" if s < 90 else r.getrandbits(64), 0.05),
+    ("shift: distinct -> spam", lambda r, s: r.getrandbits(64) if s < 90 else "spam", 0.05),
+]
+
+if __name__ == "__main__":
+    print(f"=== Entropy sketch accuracy (window {WINDOW}s, {FRAMES_PER_SEC * FRAME} values/s) ===")
+    ok = all([run_scenario(name, fn, tolerance=tol) for name, fn, tol in SCENARIOS])
+    ok &= check_distinct()
+    ok &= check_memory()
+    check_speed()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,97 @@
+"""
+Checks for single-pass ingest parsing (LogFun/manager/parser.py).
+
+Compressed records (including metas with spaces), normal-mode JSON records
+and malformed input must parse into the right fields without raising, with
+variable values only decoded on demand; the balancer's items must split a
+record over its templates. Then a frame goes through an ingest session with
+the weighted-entropy balancer: each record must be parsed exactly once and
+reach the strategy with its variables. Exits non-zero on any failure. Needs
+no running Manager.
+
+Usage:
+    python test_ingest_parser.py
+"""
+import sys
+import json
+import tempfile
+from LogFun.manager import parser
+from LogFun.manager.parser import parse_record, parse_frame
+from LogFun.manager.balancer import LogBalancer, WeightedEntropyStrategy, frame_items
+from LogFun.manager.protocol import TYPE_HANDSHAKE, TYPE_LOG_DATA
+from LogFun.manager.session import IngestSession
+from LogFun.manager.storage import get_storage
+
+APP = "parser_test_app"
+
+get_storage().root_dir = tempfile.mkdtemp(prefix="logfun_parser_")
+
+
+def check(name, ok):
+    print(f"  {'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+def check_records():
+    rec = parse_record('1700000000.1234 00000000 3 0.0015 [["INFO", 12], ["WARN", 7]] ["a b", 5]')
+    ok = check("compressed record fields", (rec.ts, rec.fid, rec.tids) == (1700000000.1234, "3", ("12", "7")))
+    ok &= check("values decoded on demand", rec._values is None and rec.values() == ["a b", 5] and rec.vars_text() == '["a b", 5]')
+    ok &= check("stored line newline-terminated", rec.line.endswith('["a b", 5]\n'))
+
+    rec = parse_record(json.dumps({"ts": "2024-01-01 00:00:00,000", "lvl": "INFO", "msg": "hi", "fid": 3, "tid": 5}), "normal")
+    ok &= check("normal record fid and tid", (rec.fid, rec.tids, rec.ts) == ("3", ("5", ), None))
+
+    bad = ["", "garbage", "x 00000000 3 0.0 [[", "1.0 00000000 3 0.0 [[\"INFO\", 1]] [not json", "{not json"]
+    try:
+        recs = [parse_record(b) for b in bad] + [parse_record(b, "normal") for b in bad]
+        ok &= check("malformed records parse without raising", recs[1].fid is None and recs[2].ts is None and recs[3].values() == [])
+    except Exception as e:
+        ok &= check(f"malformed records parse without raising ({e!r})", False)
+    return ok
+
+
+def check_items():
+    records = parse_frame(['1.0 00000000 3 0.0 [["INFO", 1], ["INFO", 2]] [1, 2]', 'garbage', '1.0 00000000 x 0.0 [["INFO", 1]] []'])
+    items = frame_items(records, uses_vars=False)
+    size = len(records[0].line) // 2
+    ok = check("one item per template, size split", items[:2] == [((3, 1), None, size), ((3, 2), None, size)])
+    ok &= check("unparsed records and bad fids skipped", len(items) == 2)
+    ok &= check("values only for strategies that use them", frame_items(records, uses_vars=True)[0][1] == [1, 2])
+    return ok
+
+
+def check_session():
+    balancer = LogBalancer()
+    balancer.update_strategy("weighted_entropy", balancer.config.algo_config.get("weighted_entropy", {}))
+    seen = []
+    strategy = balancer.strategy
+    strategy.record_many = lambda app, ts, items: seen.extend(items)
+    balancer.start = lambda: None
+
+    calls = [0]
+    real = parser.parse_record
+
+    def counting(text, log_type="compress"):
+        calls[0] += 1
+        return real(text, log_type)
+
+    session = IngestSession(("127.0.0.1", 0), balancer=balancer)
+    session.handle_packet(TYPE_HANDSHAKE, json.dumps({"timestamp": 0, "app_name": APP, "config": {}}).encode('utf-8'))
+    logs = [f'1.{i:04d} 00000000 {i % 3} 0.0 [["INFO", {i % 5}]] ["v{i % 4}"]' for i in range(50)]
+    parser.parse_record = counting
+    try:
+        session.handle_packet(TYPE_LOG_DATA, json.dumps({"log": logs, "type": "compress"}).encode('utf-8'))
+    finally:
+        parser.parse_record = real
+    ok = check("each record parsed once", calls[0] == len(logs))
+    ok &= check("entropy strategy gets every record with its variables", isinstance(strategy, WeightedEntropyStrategy) and len(seen) == len(logs) and all(v == [f"v{i % 4}"] for i, (_, v, _) in enumerate(seen)))
+    get_storage().flush_logs()
+    return ok
+
+
+if __name__ == "__main__":
+    print("=== Ingest parser ===")
+    ok = check_records()
+    ok &= check_items()
+    ok &= check_session()
+    sys.exit(0 if ok else 1)
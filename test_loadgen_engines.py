@@ -0,0 +1,58 @@
+"""
+Smoke run of the ingest load generator against every server engine.
+
+Each engine gets a short in-process load (LogFun.manager.loadgen) in its own
+Python process. A run fails if the generator exits non-zero, ingests
+nothing, drops connections, or prints a handler error or traceback (e.g. on
+shutdown). Exits non-zero on any failure. Needs no running Manager.
+
+Usage:
+    python test_loadgen_engines.py
+    python test_loadgen_engines.py --engines asyncio,cluster --duration 5
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+ENGINES = ("threaded", "asyncio", "cluster")
+BAD_OUTPUT = ("Traceback", "Handler error", "cannot schedule")
+
+
+def run_engine(engine, duration, root):
+    work = tempfile.mkdtemp(prefix=f"logfun_loadgen_{engine}_")
+    report_path = os.path.join(work, "report.json")
+    env = dict(os.environ, PYTHONPATH=root + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    cmd = [sys.executable, "-m", "LogFun.manager.loadgen", "--engine", engine, "--agents", "4", "--apps", "2", "--rate", "500", "--duration", str(duration), "--json", report_path]
+    proc = subprocess.run(cmd, cwd=work, env=env, capture_output=True, text=True, timeout=duration * 10 + 60)
+    output = proc.stdout + proc.stderr
+
+    problems = []
+    if proc.returncode != 0: problems.append(f"exit code {proc.returncode}")
+    problems += [f"output contains {s!r}" for s in BAD_OUTPUT if s in output]
+    report = {}
+    if os.path.exists(report_path):
+        with open(report_path, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+    if not report.get("ingest_rps"): problems.append("nothing ingested")
+    if report.get("dropped_connections"): problems.append(f"{report['dropped_connections']} dropped connections")
+
+    print(f"  {'OK  ' if not problems else 'FAIL'} {engine:<10} ingest {report.get('ingest_rps', 0):>10} rec/s  cpu {report.get('cpu_percent', '-')}%")
+    for p in problems:
+        print(f"       {p}")
+    if problems and output: print("       " + output.strip().replace("\n", "\n       ")[-2000:])
+    return not problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load generator smoke run per ingest engine")
+    parser.add_argument("--engines", default=",".join(ENGINES))
+    parser.add_argument("--duration", type=float, default=2.0)
+    opts = parser.parse_args()
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    print(f"=== Load generator smoke run ({opts.duration}s per engine) ===")
+    ok = all([run_engine(e, opts.duration, root) for e in opts.engines.split(",") if e])
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,159 @@
+"""
+Checks for the buffered per-app log writers (LogFun/manager/writer.py).
+
+Frames stay buffered until flush_bytes or a flush, many connection threads
+writing one app must produce whole records in per-connection order with far
+fewer appends than frames, failing writes must keep a bounded buffer, count
+what was dropped and write the rest once the disk recovers, and the fsync
+policy must be applied. Exits non-zero on any failure. Needs no running
+Manager.
+
+Usage:
+    python test_log_writers.py
+"""
+import os
+import re
+import sys
+import time
+import tempfile
+import threading
+from LogFun.manager.writer import AppLogWriter, LogWriterPool
+from LogFun.manager.segments import AppSegments
+from LogFun.manager.parser import parse_frame
+
+ROOT = tempfile.mkdtemp(prefix="logfun_writers_")
+THREADS = 8
+FRAMES = 300
+FRAME_RECORDS = 10
+RECORD_RE = re.compile(r'^\d+\.\d{4} 00000000 1 0\.0 \[\["INFO", 1\]\] \["t(\d+)-(\d+)"\]$')
+
+
+class CountingSegments(AppSegments):
+    """Counts appends; raises OSError while `fail` is set."""
+
+    def __init__(self, app_name):
+        super().__init__(os.path.join(ROOT, app_name), app_name)
+        self.writes = 0
+        self.fail = False
+
+    def write(self, chunks):
+        self.writes += 1
+        if self.fail: raise OSError("disk full")
+        super().write(chunks)
+
+
+class Monitor:
+    def __init__(self):
+        self.lost = 0
+        self.flushes = 0
+
+    def observe_write(self, seconds, nbytes):
+        self.flushes += 1
+
+    def observe_stages(self, records, timings):
+        pass
+
+    def observe_write_lost(self, app_name, records):
+        self.lost += records
+
+
+def check(name, ok):
+    print(f"  {'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+def frame(thread, start, count=FRAME_RECORDS):
+    ts = time.time()
+    return parse_frame([f'{ts:.4f} 00000000 1 0.0 [["INFO", 1]] ["t{thread}-{i}"]' for i in range(start, start + count)])
+
+
+def stored(app_name):
+    return list(AppSegments(os.path.join(ROOT, app_name), app_name, writable=False).iter_lines())
+
+
+def check_buffering():
+    segments = CountingSegments("writers_buffered")
+    writer = AppLogWriter(segments, 1 << 20, "never", 1.0, Monitor())
+    writer.write(frame(0, 0))
+    ok = check("frame buffered below flush_bytes", segments.writes == 0)
+    writer.flush()
+    ok &= check("flush appends the buffer once", segments.writes == 1)
+    writer = AppLogWriter(segments, 100, "never", 1.0, Monitor())
+    writer.write(frame(0, 0))
+    ok &= check("frame past flush_bytes written at once", segments.writes == 2)
+    writer.close()
+    return ok
+
+
+def check_concurrent():
+    app_name = "writers_concurrent"
+    pool = LogWriterPool(CountingSegments, flush_interval=0.2)
+
+    def connection(t):
+        for f in range(FRAMES):
+            pool.write(app_name, frame(t, f * FRAME_RECORDS))
+
+    threads = [threading.Thread(target=connection, args=(t, )) for t in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    writes = pool.writers[app_name].segments.writes
+    pool.close_all()
+
+    lines = stored(app_name)
+    matches = [RECORD_RE.match(line) for line in lines]
+    ok = check("every record stored", len(lines) == THREADS * FRAMES * FRAME_RECORDS)
+    ok &= check("no torn records", all(matches))
+    seqs = {}
+    for m in filter(None, matches):
+        seqs.setdefault(m.group(1), []).append(int(m.group(2)))
+    ok &= check("each connection's records in order", all(s == list(range(FRAMES * FRAME_RECORDS)) for s in seqs.values()))
+    ok &= check(f"appends grouped ({writes} for {THREADS * FRAMES} frames)", writes * 10 <= THREADS * FRAMES)
+    return ok
+
+
+def check_failures():
+    app_name = "writers_failing"
+    segments = CountingSegments(app_name)
+    monitor = Monitor()
+    one = len("".join(r.line for r in frame(0, 0)))
+    writer = AppLogWriter(segments, one, "never", 1.0, monitor, max_buffer=one * 5)
+    segments.fail = True
+    for f in range(20):
+        try:
+            writer.write(frame(0, f * FRAME_RECORDS))
+        except OSError:
+            pass
+    ok = check("buffer bounded while writes fail", writer.pending <= one * 5)
+    ok &= check("dropped records counted", monitor.lost > 0 and monitor.lost + sum(c[1] for c in writer.buffer) == 20 * FRAME_RECORDS)
+    segments.fail = False
+    writer.flush()
+    writer.close()
+    ok &= check("kept records written once the disk recovers", len(stored(app_name)) + monitor.lost == 20 * FRAME_RECORDS)
+    return ok
+
+
+def check_fsync():
+    calls = []
+    real_fsync = os.fsync
+    os.fsync = lambda fd: calls.append(fd)
+    try:
+        writer = AppLogWriter(CountingSegments("writers_fsync"), 1 << 20, "always", 1.0, Monitor())
+        writer.write(frame(0, 0))
+        writer.flush()
+        ok = check("fsync=always syncs each flush", len(calls) == 1)
+        writer.close()
+    finally:
+        os.fsync = real_fsync
+    ok &= check("unknown fsync policy falls back to never", LogWriterPool(CountingSegments, fsync="sometimes").fsync == "never")
+    return ok
+
+
+if __name__ == "__main__":
+    print("=== Log writers ===")
+    ok = check_buffering()
+    ok &= check_concurrent()
+    ok &= check_failures()
+    ok &= check_fsync()
+    sys.exit(0 if ok else 1)
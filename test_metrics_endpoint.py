@@ -0,0 +1,121 @@
+"""
+Checks for the text-exposition endpoint /metrics (LogFun/manager/web.py,
+LogFun/manager/stats.py).
+
+Ingests a frame through an ingest session, flushes it to storage, runs a
+search and a balancer analysis, opens and fails a connection, then scrapes
+/metrics: it must be well-formed text exposition (every sample under a
+TYPE line, cumulative buckets ending in +Inf == _count, escaped labels) and
+its counters must move by exactly what was done. Exits non-zero on any
+failure. Needs no running Manager.
+
+Usage:
+    python test_metrics_endpoint.py
+"""
+import re
+import sys
+import json
+import time
+import tempfile
+from LogFun.manager.web import app
+from LogFun.manager.stats import get_monitor
+from LogFun.manager.storage import get_storage
+from LogFun.manager.session import IngestSession
+from LogFun.manager.protocol import TYPE_HANDSHAKE, TYPE_LOG_DATA
+
+APP = 'metrics_"endpoint"\\app'
+RECORDS = 30
+
+get_storage().root_dir = tempfile.mkdtemp(prefix="logfun_prom_")
+
+SAMPLE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*\})? (\S+)$')
+FAMILIES = ("logfun_ingest_records_total", "logfun_ingest_bytes_total", "logfun_ingest_frames_per_second", "logfun_handler_errors_total", "logfun_stage_seconds",
+            "logfun_connections_open", "logfun_storage_write_seconds", "logfun_balancer_analysis_seconds", "logfun_balancer_mutes_total", "logfun_search_seconds")
+
+
+def check(name, ok):
+    print(f"  {'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+def scrape(client):
+    """{name: {labels_text: value}} plus the declared types, or None if a line is malformed."""
+    resp = client.get('/metrics')
+    samples, types = {}, {}
+    for line in resp.get_data(as_text=True).splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            types[name] = kind
+            continue
+        if line.startswith("#"): continue
+        m = SAMPLE_RE.match(line)
+        if m is None: return resp, None, types
+        samples.setdefault(m.group(1), {})[m.group(2) or ""] = float(m.group(3))
+    return resp, samples, types
+
+
+def family(name, types):
+    """The declared family of a sample name (histograms add _bucket/_sum/_count)."""
+    if name in types: return name
+    for suffix in ("_bucket", "_sum", "_count"):
+        if name.endswith(suffix) and types.get(name[:-len(suffix)]) == "histogram": return name[:-len(suffix)]
+    return None
+
+
+def value(samples, name, labels=""):
+    return samples.get(name, {}).get(labels, 0)
+
+
+def check_histograms(samples, types):
+    ok = True
+    for name, kind in types.items():
+        if kind != "histogram": continue
+        buckets = {}
+        for labels, v in samples.get(name + "_bucket", {}).items():
+            series = re.sub(r',?le="[^"]*"', "", labels).replace("{,", "{").replace("{}", "")
+            le = re.search(r'le="([^"]*)"', labels).group(1)
+            buckets.setdefault(series, []).append((float(le), v))
+        for series, points in buckets.items():
+            points.sort()
+            counts = [v for _, v in points]
+            ok &= counts == sorted(counts) and points[-1][0] == float("inf") and counts[-1] == value(samples, name + "_count", series)
+    return ok
+
+
+if __name__ == "__main__":
+    print("=== /metrics endpoint ===")
+    client = app.test_client()
+    monitor = get_monitor()
+    _, before, _ = scrape(client)
+
+    session = IngestSession(("127.0.0.1", 0))
+    session.handle_packet(TYPE_HANDSHAKE, json.dumps({"timestamp": time.time(), "app_name": APP, "config": {}}).encode('utf-8'))
+    logs = [f'{time.time():.4f} 00000000 1 0.0 [["INFO", 1]] [{i}]' for i in range(RECORDS)]
+    session.handle_packet(TYPE_LOG_DATA, json.dumps({"log": logs, "type": "compress"}).encode('utf-8'))
+    get_storage().flush_logs()
+    client.get('/api/search', query_string={"app": APP, "type": "function", "kw": "1"})
+    monitor.observe_analysis(APP, 0.003, 2)
+    monitor.connection_opened()
+    monitor.connection_opened()
+    monitor.connection_closed(error=True)
+
+    resp, after, types = scrape(client)
+    ok = check("text exposition content type", resp.status_code == 200 and resp.content_type.startswith("text/plain; version=0.0.4"))
+    ok &= check("every line well-formed", after is not None)
+    if after is None: sys.exit(1)
+    ok &= check("every sample under a TYPE line", all(family(name, types) for name in after))
+    ok &= check("required families present", all(f in types for f in FAMILIES))
+    ok &= check("histogram buckets cumulative, +Inf == _count", check_histograms(after, types))
+
+    app_label = '{app="metrics_\\"endpoint\\"\\\\app"}'
+    ok &= check("app label escaped", app_label in after["logfun_ingest_records_total"])
+    ok &= check("records and bytes of the app", value(after, "logfun_ingest_records_total", app_label) == RECORDS and value(after, "logfun_ingest_bytes_total", app_label) == sum(len(l) + 1 for l in logs))
+    ok &= check("one more frame", value(after, "logfun_ingest_frames_total") - value(before, "logfun_ingest_frames_total") == 1)
+    for stage in ("parse", "balancer", "flush"):
+        labels = f'{{stage="{stage}"}}'
+        ok &= check(f"{stage} stage observed", value(after, "logfun_stage_seconds_count", labels) - value(before, "logfun_stage_seconds_count", labels) >= 1)
+    ok &= check("storage flush observed", value(after, "logfun_storage_write_seconds_count") > value(before, "logfun_storage_write_seconds_count"))
+    ok &= check("search observed", value(after, "logfun_search_seconds_count", '{type="function"}') - value(before, "logfun_search_seconds_count", '{type="function"}') == 1)
+    ok &= check("analysis and mutes", value(after, "logfun_balancer_analysis_seconds_count") - value(before, "logfun_balancer_analysis_seconds_count") == 1 and value(after, "logfun_balancer_mutes_total", app_label) == 2)
+    ok &= check("open connections and handler errors", value(after, "logfun_connections_open") == 1 and value(after, "logfun_handler_errors_total") - value(before, "logfun_handler_errors_total") == 1)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,103 @@
+"""
+Checks for the downsampled metrics store (LogFun/manager/metrics.py).
+
+A rollup must start empty, grow only as its points need, never past its
+window, and answer like a plain {slot: counts} map of the window. The
+store must keep at most top_functions series per app and max_apps apps,
+promote a function that outgrows the weakest tracked one, keep
+total = functions + "_other", record blocked counts and mutes, and come
+back the same after a save and load. Exits non-zero on any failure. Needs
+no running Manager.
+
+Usage:
+    python test_metrics_store.py
+"""
+import sys
+import time
+import random
+import tempfile
+from LogFun.manager.metrics import MetricsStore, Rollup, OTHER, FIELDS
+
+APP = "metrics_test_app"
+
+
+def check(name, ok):
+    print(f"  {'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+def check_rollup():
+    r = Rollup(1, 600)
+    ok = check("rollup starts empty", len(r.slots) == 0 and r.get(5) == (0, ) * len(FIELDS))
+    for s in (1000, 1001, 1003):
+        r.add(s, (1, 10, 0, 0))
+    ok &= check(f"a few points take a small ring ({len(r.slots)})", len(r.slots) == 8)
+    for s in range(1000, 3000):
+        r.add(s, (1, 10, 0, 0))
+    ok &= check("ring never exceeds the window", len(r.slots) == 600)
+
+    # Random traffic against a plain map of the window
+    rng = random.Random(7)
+    r, model, newest = Rollup(1, 50), {}, 0
+    same = True
+    for _ in range(3000):
+        s = newest + rng.choice((-3, -1, 0, 0, 1, 1, 2, 40, 120)) if model else 100
+        if s <= newest - 50: continue
+        newest = max(newest, s)
+        counts = (rng.randint(1, 9), rng.randint(1, 99), 0, 0)
+        r.add(s, counts)
+        old = model.get(s, (0, 0, 0, 0))
+        model[s] = tuple(a + b for a, b in zip(old, counts))
+        window = {k: v for k, v in model.items() if newest - 50 < k <= newest}
+        got = {int(t): tuple(c) for t, c in r.points(newest)}
+        same &= got == window
+    ok &= check("matches a plain map of the window", same)
+    return ok
+
+
+def series_records(store, fid, start, end):
+    return sum(p[1] for p in store.query(APP, fid, start, end)["points"])
+
+
+def check_store():
+    store = MetricsStore(top_functions=2, max_apps=2, persist_interval=3600)
+    store.root_dir = tempfile.mkdtemp(prefix="logfun_metrics_")
+    now = time.time()
+    m0 = (int(now) // 60 - 3) * 60
+
+    # Minute 0: a and b take the two slots, c is the busiest but untracked
+    for i in range(10):
+        store.observe_traffic(m0 + i, {APP: [1 + 1 + 10, 30, {"a": [1, 10], "b": [1, 10], "c": [10, 10]}]})
+    app = store.apps[APP]
+    ok = check("functions past top_functions go to _other", sorted(app.funcs) == ["a", "b"])
+    # Minute 1: c outgrew the weakest, so it is promoted
+    store.observe_traffic(m0 + 61, {APP: [5, 5, {"c": [5, 5]}]})
+    ok &= check("busiest untracked function promoted", "c" in app.funcs and len(app.funcs) == 2)
+    ok &= check("promoted function counted from then on", series_records(store, "c", m0 + 60, m0 + 70) == 5)
+    start, end = m0, m0 + 120
+    parts = sum(series_records(store, f, start, end) for f in app.funcs) + series_records(store, OTHER, start, end)
+    ok &= check("total = functions + _other", series_records(store, None, start, end) == parts == 125)
+
+    store.observe_traffic(m0 + 62, {"metrics_app_2": [1, 1, {}], "metrics_app_3": [4, 4, {}]})
+    ok &= check("apps past max_apps share _other", sorted(store.apps) == sorted([APP, "metrics_app_2", OTHER]))
+
+    store.observe_blocked(APP, {"c": 7, "c:3": 2}, ts=m0 + 63)
+    store.observe_control(APP, "c", None, False, "balancer", ts=m0 + 63)
+    q = store.query(APP, "c", m0 + 60, m0 + 70)
+    ok &= check("blocked counts and mutes recorded", sum(p[3] for p in q["points"]) == 9 and sum(p[4] for p in q["points"]) == 1 and q["events"][0][3] == "mute")
+    q = store.query(APP, None, m0, m0 + 120, step=60)
+    ok &= check("query steps sum the points", q["step"] == 60 and [p[1] for p in q["points"][:2]] == [120, 5])
+
+    store.save()
+    loaded = MetricsStore(top_functions=2, max_apps=2, persist_interval=3600)
+    loaded.root_dir = store.root_dir
+    loaded._ensure_started()
+    ok &= check("same after save and load", all(loaded.query(APP, f, start, end)["points"] == store.query(APP, f, start, end)["points"] for f in (None, "a", "c", OTHER)))
+    return ok
+
+
+if __name__ == "__main__":
+    print("=== Metrics store ===")
+    ok = check_rollup()
+    ok &= check_store()
+    sys.exit(0 if ok else 1)
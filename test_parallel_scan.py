@@ -0,0 +1,93 @@
+"""
+Checks for the segment scans behind search and download
+(LogFun/manager/scan.py).
+
+Writes a few thousand compressed records to a temporary store, then compares
+the default in-process scan with a two-process pool cut into small units:
+both must return the same lines for function, template and variable
+searches, paging with cursors must add up to the full result, and the pool
+processes must not load the dashboard's plotting libraries. Exits non-zero
+on any failure. Needs no running Manager.
+
+Usage:
+    python test_parallel_scan.py
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+from LogFun.manager import scan
+from LogFun.manager.storage import get_storage
+from LogFun.manager.decoder import LogDecoder
+from LogFun.manager.loadgen import TrafficProfile
+
+APP = "scan_test_app"
+# Records but no stored config (an empty one)
+BARE = "scan_test_bare"
+RECORDS = 6000
+
+
+def check(name, ok):
+    print(f"  {'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+def heavy_modules():
+    """Runs in a pool process."""
+    return [m for m in ("matplotlib", "networkx", "LogFun.manager.core") if m in sys.modules]
+
+
+def fill_store():
+    storage = get_storage()
+    storage.root_dir = tempfile.mkdtemp(prefix="logfun_scan_")
+    profile = TrafficProfile(functions=8)
+    config = profile.build_config(APP)
+    storage.sync_config(APP, config)
+    pool = profile.build_pool(config, 500, random.Random(1))
+    t0 = time.time() - RECORDS
+    for i in range(0, RECORDS, 100):
+        batch = [f"{t0 + j:.4f} 00000000 {pool[j % len(pool)]}" for j in range(i, i + 100)]
+        storage.write_batch(APP, batch, "compress")
+        storage.write_batch(BARE, batch, "compress")
+    storage.flush_logs()
+
+
+def search_all(search_type, keyword):
+    return LogDecoder(APP).search_logs(search_type, keyword, limit=10**9)
+
+
+def search_paged(search_type, keyword, page):
+    lines, cursor = [], None
+    while True:
+        for texts, nxt in LogDecoder(APP).search_page(search_type, keyword, limit=page, cursor=cursor):
+            if texts is not None: lines.extend(texts)
+        cursor = nxt
+        if cursor is None: return lines
+
+
+if __name__ == "__main__":
+    print("=== Segment scans ===")
+    fill_store()
+    queries = [("function", "func_3"), ("template", "step 7 "), ("variable", "a")]
+    ok = check("in-process scan by default", scan.get_scanner().workers == 1)
+    local = {q: search_all(*q) for q in queries}
+    local_all = list(LogDecoder(APP).decode_all_generator())
+    bare_all = list(LogDecoder(BARE).decode_all_generator())
+    ok &= check("records found", all(local.values()) and len(local_all) >= RECORDS)
+    ok &= check("no pool without scan_workers", scan.get_scanner().pool is None)
+
+    scan._scanner = scan.ParallelScanner(workers=2, unit_bytes=16384, parallel_bytes=0)
+    try:
+        for q in queries:
+            ok &= check(f"pool matches in-process: {q[0]} search", search_all(*q) == local[q])
+        ok &= check("pool matches in-process: download", list(LogDecoder(APP).decode_all_generator()) == local_all)
+        ok &= check("pool matches in-process: app without config", len(bare_all) >= RECORDS and list(LogDecoder(BARE).decode_all_generator()) == bare_all)
+        # A worker handed the empty config must not open the app in its own (default) store
+        ok &= check("pool leaves the default store alone", not os.path.exists(os.path.join("logfun_data", BARE)))
+        ok &= check("pool was used", scan.get_scanner().pool is not None)
+        ok &= check("pool processes skip the plotting libraries", scan.get_scanner().pool.submit(heavy_modules).result() == [])
+        ok &= check("pages add up to the full result", search_paged("function", "func_3", 97) == local[("function", "func_3")])
+    finally:
+        scan.get_scanner().shutdown()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,82 @@
+"""
+Checks for the cursor-paginated search stream (/api/search/stream in
+LogFun/manager/web.py).
+
+Stores a few thousand records, then pages through a function search with
+the Flask test client: every page must be NDJSON lines followed by a cursor
+object, the pages must add up to the unpaged search, the last cursor must
+be null, bad requests must get a 400, and a scan failing after the first
+lines must end the stream with an error object. Exits non-zero on any
+failure. Needs no running Manager.
+
+Usage:
+    python test_search_stream.py
+"""
+import sys
+import json
+import time
+import random
+import tempfile
+from LogFun.manager import web
+from LogFun.manager.storage import get_storage
+from LogFun.manager.decoder import LogDecoder
+from LogFun.manager.loadgen import TrafficProfile
+
+APP = "stream_test_app"
+RECORDS = 3000
+PAGE = 97
+
+
+def check(name, ok):
+    print(f"  {'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+def fill_store():
+    storage = get_storage()
+    storage.root_dir = tempfile.mkdtemp(prefix="logfun_stream_")
+    profile = TrafficProfile(functions=4)
+    config = profile.build_config(APP)
+    storage.sync_config(APP, config)
+    pool = profile.build_pool(config, 300, random.Random(1))
+    t0 = time.time() - RECORDS
+    storage.write_batch(APP, [f"{t0 + i:.4f} 00000000 {pool[i % len(pool)]}" for i in range(RECORDS)], "compress")
+    storage.flush_logs()
+
+
+def fetch(client, cursor=None, **args):
+    query = {"app": APP, "type": "function", "kw": "func_2", "limit": PAGE, **args}
+    if cursor: query["cursor"] = cursor
+    resp = client.get("/api/search/stream", query_string=query)
+    return resp.status_code, [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+
+
+if __name__ == "__main__":
+    print("=== Search stream ===")
+    fill_store()
+    client = web.app.test_client()
+    expected = LogDecoder(APP).search_logs("function", "func_2", limit=10**9)
+
+    lines, cursor, pages, well_formed = [], None, 0, True
+    while True:
+        status, msgs = fetch(client, cursor)
+        pages += 1
+        rows = [m["line"] for m in msgs[:-1] if "line" in m]
+        well_formed &= status == 200 and len(rows) == len(msgs) - 1 and msgs[-1].get("count") == len(rows)
+        lines.extend(rows)
+        cursor = msgs[-1].get("cursor")
+        if cursor is None or pages > RECORDS: break
+    ok = check("pages are lines then a cursor object", well_formed)
+    ok &= check(f"{pages} pages add up to the unpaged search", len(expected) > PAGE and lines == expected)
+    ok &= check("missing keyword rejected", fetch(client, kw="")[0] == 400)
+    status, msgs = fetch(client, cursor="not-a-cursor")
+    ok &= check("invalid cursor rejected", status == 400 and "error" in msgs[0])
+
+    def failing_scan(self, *args, **kwargs):
+        yield ["first line"], None
+        raise OSError("segment vanished")
+
+    web.LogDecoder.search_page = failing_scan
+    status, msgs = fetch(client)
+    ok &= check("scan failure ends the stream with an error", status == 200 and msgs[0] == {"line": "first line"} and msgs[-1].get("error") == "segment vanished")
+    sys.exit(0 if ok else 1)
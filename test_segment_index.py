@@ -0,0 +1,97 @@
+"""
+Checks for the sparse per-segment index (LogFun/manager/indexer.py,
+LogFun/manager/segments.py).
+
+Writes a segment of small blocks where one function is rare, then checks
+that function, template and time lookups only select the blocks holding
+matches, while the segment is written and after it is sealed, and return
+the same records as a full scan. The offline rebuild must restore a deleted
+index and index a pre-segment <app>.log. Exits non-zero on any failure.
+Needs no running Manager.
+
+Usage:
+    python test_segment_index.py
+"""
+import os
+import sys
+import time
+import tempfile
+from LogFun.manager.writer import AppLogWriter
+from LogFun.manager.segments import AppSegments, SegmentOptions
+from LogFun.manager.indexer import rebuild_app
+from LogFun.manager.parser import parse_frame
+
+ROOT = tempfile.mkdtemp(prefix="logfun_index_")
+APP = "index_test_app"
+LEGACY = "index_test_legacy"
+OPTS = SegmentOptions(block_bytes=2048)
+FRAMES = 400
+RARE_FRAMES = (57, 311)
+T0 = int(time.time()) - FRAMES
+
+
+def check(name, ok):
+    print(f"  {'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+def frame_lines(i):
+    """Five records of one function; function 9 (template 90) only in RARE_FRAMES."""
+    fid = 9 if i in RARE_FRAMES else 1 + i % 4
+    return [f'{T0 + i}.{j:04d} 00000000 {fid} 0.0 [["INFO", {fid}0]] [{i}, {j}]' for j in range(5)]
+
+
+def fid_of(line):
+    return line.split(' ', 3)[2]
+
+
+def reader(app_name):
+    return AppSegments(os.path.join(ROOT, app_name), app_name, OPTS, writable=False)
+
+
+def check_lookups(segments, seg, label):
+    blocks = len(seg["blocks"])
+    rare = segments.candidate_blocks(seg, fids={"9"})
+    ok = check(f"{label}: rare function in {len(rare or ())} of {blocks} blocks", rare is not None and 0 < len(rare) <= 2 * len(RARE_FRAMES))
+    ok &= check(f"{label}: template lookup agrees", segments.candidate_blocks(seg, tids={"90"}) == rare)
+    full = [l for l in segments.iter_lines() if fid_of(l) == "9"]
+    ok &= check(f"{label}: indexed search finds every match", len(full) == 5 * len(RARE_FRAMES) and [l for l in segments.iter_lines(fids={"9"}) if fid_of(l) == "9"] == full)
+    return ok
+
+
+if __name__ == "__main__":
+    print("=== Segment index ===")
+    segments = AppSegments(os.path.join(ROOT, APP), APP, OPTS)
+    # One append per frame, as with a busy writer
+    writer = AppLogWriter(segments, 1, "never", 1.0)
+    for i in range(FRAMES):
+        writer.write(parse_frame(frame_lines(i)))
+    ok = check("active segment has many blocks", len(segments.active["blocks"]) >= 50)
+    ok &= check_lookups(segments, segments.active, "active")
+    writer.close()
+
+    segments = reader(APP)
+    seg = segments.segments[0]
+    ok &= check("sealed segment has an index", seg["state"] == "sealed" and os.path.exists(segments.index_path(seg)))
+    ok &= check_lookups(segments, seg, "sealed")
+    window = list(segments.iter_lines(start=T0 + 100, end=T0 + 109.9))
+    in_window = [l for l in window if T0 + 100 <= float(l.split(' ', 1)[0]) < T0 + 110]
+    ok &= check(f"time range reads few blocks ({len(window)} lines)", len(in_window) == 50 and len(window) < FRAMES * 5 / 10)
+
+    # Offline rebuild of a lost index
+    expected = segments.candidate_blocks(seg, fids={"9"})
+    os.remove(segments.index_path(seg))
+    ok &= check("without an index every block is read", segments.candidate_blocks(seg, fids={"9"}) is None)
+    rebuild_app(os.path.join(ROOT, APP), APP, OPTS, verbose=False)
+    ok &= check("rebuild restores the index", segments.candidate_blocks(seg, fids={"9"}) == expected)
+
+    # A pre-segment <app>.log
+    os.makedirs(os.path.join(ROOT, LEGACY))
+    with open(os.path.join(ROOT, LEGACY, f"{LEGACY}.log"), 'w', encoding='utf-8') as f:
+        f.write("".join(l + "\n" for i in range(FRAMES) for l in frame_lines(i)))
+    rebuild_app(os.path.join(ROOT, LEGACY), LEGACY, OPTS, verbose=False)
+    segments = reader(LEGACY)
+    seg = segments.segments[0]
+    ok &= check("legacy log keeps its block table", seg.get("legacy") and len(seg["blocks"]) >= 50)
+    ok &= check_lookups(segments, seg, "legacy")
+    sys.exit(0 if ok else 1)
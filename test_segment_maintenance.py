@@ -0,0 +1,93 @@
+"""
+Checks for background segment maintenance (LogFun/manager/writer.py,
+LogFun/manager/segments.py).
+
+Writes an app's records, seals its segment, then starts a fresh writer pool
+as after a restart: the compactor must compress the sealed segment without
+creating a writer for the idle app, leave apps another process owns alone,
+and hand the maintained segments to a writer created later. Also checks
+that compression is off unless storage.compress is set. Exits non-zero on
+any failure. Needs no running Manager.
+
+Usage:
+    python test_segment_maintenance.py
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+import threading
+from LogFun.manager.config import get_config
+from LogFun.manager.storage import get_storage
+from LogFun.manager.writer import LogWriterPool
+from LogFun.manager.segments import AppSegments, SegmentOptions
+from LogFun.manager.parser import parse_frame
+from LogFun.manager.loadgen import TrafficProfile
+
+APP = "maintain_test_app"
+OTHER = "maintain_test_other"
+OPTS = SegmentOptions(compress=True)
+
+storage = get_storage()
+storage.root_dir = tempfile.mkdtemp(prefix="logfun_maintain_")
+
+
+def check(name, ok):
+    print(f"  {'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+def states(app_name):
+    return [s["state"] for s in AppSegments(os.path.join(storage.root_dir, app_name), app_name, OPTS, writable=False).segments]
+
+
+def new_pool(owns=None):
+    pool = LogWriterPool(lambda a: AppSegments(storage._get_app_dir(a), a, OPTS), maintain_interval=0.1, list_apps=storage.get_all_apps)
+    pool.owns = owns
+    return pool
+
+
+def wait_for(cond, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline and not cond():
+        time.sleep(0.05)
+    return cond()
+
+
+def compactors():
+    return sum(t.name == "LogFun-Compactor" for t in threading.enumerate())
+
+
+if __name__ == "__main__":
+    print("=== Segment maintenance ===")
+    ok = check("compression is opt-in", get_config().get("storage", "compress") is False and storage.segment_opts.compress is False)
+
+    # Write, then seal on close, as a stopping Manager does
+    profile = TrafficProfile(functions=4)
+    body = profile.build_pool(profile.build_config(APP), 200, random.Random(1))
+    frame = parse_frame([f"{time.time():.4f} 00000000 {b}" for b in body], "compress")
+    before = compactors()
+    pool = new_pool()
+    for app_name in (APP, OTHER):
+        pool.write(app_name, frame)
+    ok &= check("writing does not start the compactor", compactors() == before)
+    pool.close_all()
+    ok &= check("segments sealed on close", states(APP) == ["sealed"] and states(OTHER) == ["sealed"])
+
+    # Restart: maintain idle apps without writers, except those owned elsewhere
+    pool = new_pool(owns=lambda app_name: app_name == APP)
+    pool.start_maintenance()
+    pool.start_maintenance()
+    ok &= check("one compactor per pool", compactors() == before + 1)
+    ok &= check("idle app compressed", wait_for(lambda: states(APP) == ["compressed"]))
+    ok &= check("no writer for the idle app", not pool.writers)
+    ok &= check("app owned elsewhere left alone", states(OTHER) == ["sealed"])
+
+    # A writer created later takes over the maintained segments
+    idle = pool.idle.get(APP)
+    pool.write(APP, frame)
+    ok &= check("writer reuses the maintained segments", idle is not None and pool.writers[APP].segments is idle and APP not in pool.idle)
+    pool.close_all()
+    ok &= check("old and new segments", states(APP) == ["compressed", "sealed"])
+    sys.exit(0 if ok else 1)
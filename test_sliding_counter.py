@@ -0,0 +1,68 @@
+"""
+Checks for the per-second ring counters of the Z-Score strategy
+(LogFun/manager/balancer.py).
+
+A SlidingCounter fed random, partly late timestamps must give the same
+window totals and rates as a plain list of every timestamp, and keep the
+same ring however many records it counts. ZScoreStrategy, on a replaceable
+clock, must mute the key that stands out with its recent rate, keep one
+ring per key at 50k records/s, and drop keys once their window is empty.
+Exits non-zero on any failure. Needs no running Manager.
+
+Usage:
+    python test_sliding_counter.py
+"""
+import sys
+import random
+from LogFun.manager.balancer import SlidingCounter, ZScoreStrategy, RATE_SECONDS
+
+WINDOW = 30
+APP = "zscore_test_app"
+
+
+def check(name, ok):
+    print(f"  {'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+def check_counter():
+    rng = random.Random(3)
+    counter, seen, head = SlidingCounter(WINDOW), [], 1000
+    totals = rates = True
+    for _ in range(5000):
+        head += rng.choice((0, 0, 0, 1, 1, 2, 5, 45))
+        sec = head - rng.choice((0, 0, 0, 1, 3, 29, 30, 60))
+        n = rng.randint(1, 4)
+        counter.add(sec, n)
+        if sec > counter.head - WINDOW: seen.extend([sec] * n)
+        totals &= counter.total(head) == sum(1 for s in seen if head - WINDOW < s <= head)
+        if head - counter.start >= RATE_SECONDS:
+            rates &= abs(counter.rate(head, RATE_SECONDS) - sum(1 for s in seen if head - RATE_SECONDS <= s < head) / RATE_SECONDS) < 1e-9
+    ok = check("window totals match a list of timestamps", totals)
+    ok &= check("rates over complete seconds match", rates)
+    ok &= check("ring size fixed by the window", len(counter.counts) == WINDOW)
+    return ok
+
+
+def check_strategy():
+    now = [10_000.0]
+    strategy = ZScoreStrategy({"window_size": WINDOW, "threshold": 2.0}, clock=lambda: now[0])
+    # Ten quiet keys at 5 records/s, one at 50k records/s
+    for s in range(WINDOW):
+        ts = now[0] - WINDOW + 1 + s
+        strategy.record_many(APP, ts, [((k, 1), None, 0) for k in range(10) for _ in range(5)])
+        strategy.record_many(APP, ts, [((99, 1), None, 0)] * 50_000)
+    ok = check("one ring per key at any rate", all(len(c.counts) == WINDOW for c in strategy.data[APP].values()) and len(strategy.data[APP]) == 11)
+    muted = strategy.analyze(APP)
+    ok &= check("key that stands out muted with its rate", list(muted) == [(99, 1)] and abs(muted[(99, 1)] - 50_000) < 1e-6)
+
+    now[0] += WINDOW
+    ok &= check("keys dropped once their window is empty", strategy.analyze(APP) == {} and APP not in strategy.data)
+    return ok
+
+
+if __name__ == "__main__":
+    print("=== Z-Score ring counters ===")
+    ok = check_counter()
+    ok &= check_strategy()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,106 @@
+"""
+Checks for the EWMA and CUSUM strategies (LogFun/manager/balancer.py).
+
+On a simulated clock with noisy per-second counts, both detectors must stay
+quiet on steady traffic, even when every key of the app is busy. They must
+catch a tenfold spike within about a second and a doubling within two,
+ignore keys below `min_rate` or still warming up, and keep a muted key's
+baseline until it is unmuted. Both must be accepted by
+/api/balancer/switch. Exits non-zero on any failure. Needs no running
+Manager.
+
+Usage:
+    python test_streaming_detectors.py
+"""
+import sys
+import random
+from LogFun.manager.balancer import EwmaStrategy, CusumStrategy, RateState
+from LogFun.manager.web import app
+
+APP = "streaming_test_app"
+BUSY = 1000
+KEYS = [(f, 1) for f in range(1, 9)]
+T0 = 1_700_000_000
+
+
+class Run:
+    """A strategy on a simulated clock, fed one second at a time and analyzed after each."""
+
+    def __init__(self, cls, seed=1, **cfg):
+        self.now = T0
+        self.rng = random.Random(seed)
+        self.strategy = cls(cfg, clock=lambda: self.now)
+
+    def second(self, rates):
+        items = []
+        for key, rate in rates.items():
+            n = max(0, round(self.rng.gauss(rate, rate**0.5)))
+            items.extend([(key, None, 0)] * n)
+        self.strategy.record_many(APP, self.now + 0.5, items)
+        self.now += 1
+        return self.strategy.analyze(APP)
+
+    def steady(self, seconds, rates):
+        """Keys flagged over `seconds` of steady traffic."""
+        flagged = set()
+        for _ in range(seconds):
+            flagged |= set(self.second(rates))
+        return flagged
+
+    def delay(self, rates, limit=10):
+        """Seconds until a key is flagged (None if not within `limit`)."""
+        for s in range(1, limit + 1):
+            if self.second(rates): return s
+        return None
+
+
+def check(name, ok):
+    print(f"  {'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+def check_detector(cls):
+    name = cls.__name__
+    busy = {key: BUSY for key in KEYS}
+    run = Run(cls)
+    ok = check(f"{name}: every key busy, none flagged", not run.steady(600, busy))
+    ok &= check(f"{name}: one state per key", len(run.strategy.data[APP]) == len(KEYS) and all(type(st) is RateState for st in run.strategy.data[APP].values()))
+
+    tenfold = run.delay({**busy, KEYS[0]: 10 * BUSY})
+    ok &= check(f"{name}: tenfold spike caught in {tenfold} s", tenfold is not None and tenfold <= 1)
+    run = Run(cls, seed=2)
+    run.steady(300, busy)
+    doubled = run.delay({**busy, KEYS[0]: 2 * BUSY})
+    ok &= check(f"{name}: doubling caught in {doubled} s", doubled is not None and doubled <= 2)
+
+    run = Run(cls, seed=3, min_rate=10.0)
+    run.steady(300, {KEYS[0]: 1})
+    ok &= check(f"{name}: below min_rate ignored", not run.steady(5, {KEYS[0]: 8}))
+    run = Run(cls, seed=4, warmup=10)
+    run.steady(2, {KEYS[0]: BUSY})
+    ok &= check(f"{name}: no flags while warming up", not run.steady(5, {KEYS[0]: 10 * BUSY}))
+
+    run = Run(cls, seed=5)
+    run.steady(300, busy)
+    baseline = run.strategy.data[APP][KEYS[0]].mean
+    run.strategy.forget(APP, [KEYS[0]])
+    run.steady(600, {key: BUSY for key in KEYS[1:]})
+    run.strategy.resume(APP, [KEYS[0]])
+    ok &= check(f"{name}: baseline kept through a mute", run.strategy.data[APP][KEYS[0]].mean == baseline and not run.steady(30, busy))
+    return ok
+
+
+def check_switch():
+    client = app.test_client()
+    ok = all(client.post('/api/balancer/switch', json={"strategy": s, "params": {}}).status_code == 200 for s in ("ewma", "cusum"))
+    ok &= client.post('/api/balancer/switch', json={"strategy": "bogus", "params": {}}).status_code == 400
+    client.post('/api/balancer/switch', json={"strategy": "zscore", "params": {}})
+    return check("switchable through /api/balancer/switch", ok)
+
+
+if __name__ == "__main__":
+    print("=== Streaming detectors ===")
+    ok = check_detector(EwmaStrategy)
+    ok &= check_detector(CusumStrategy)
+    ok &= check_switch()
+    sys.exit(0 if ok else 1)
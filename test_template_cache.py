@@ -0,0 +1,73 @@
+"""
+Checks for the compiled template cache (LogFun/manager/template_cache.py).
+
+Compiled templates must render exactly like `content % tuple(args)` with
+its error fallback, decoders of one app must share one compiled config
+until its revision changes, the revision must change when the config is
+saved or first loaded from disk, and records with odd template ids
+(floats, lists, null) must decode as unresolved instead of failing.
+Exits non-zero on any failure. Needs no running Manager.
+
+Usage:
+    python test_template_cache.py
+"""
+import sys
+import json
+import tempfile
+from LogFun.manager.storage import get_storage
+from LogFun.manager.decoder import LogDecoder
+from LogFun.manager.template_cache import CompiledTemplate
+
+APP = "template_cache_app"
+CONFIG = {"app_name": APP, "functions": {"1": {"name": "shop.py:checkout", "enabled": True, "templates": {"1": {"content": "took %s ms for {order} %s", "enabled": True}}}}}
+
+storage = get_storage()
+storage.root_dir = tempfile.mkdtemp(prefix="logfun_templates_")
+
+
+def check(name, ok):
+    print(f"  {'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+def reference(content, args):
+    """Rendering before compiled templates."""
+    if not args: return content
+    try:
+        return content % tuple(args)
+    except:
+        return f"{content} [Vars Error: {list(args)}]"
+
+
+def check_rendering():
+    cases = [("took %s ms", [5]), ("{x} %s {}", ["a"]), ("100%% of %s", [3]), ("%d items", [4]), ("%s and %s", [1]), ("%s", [1, 2]), ("plain", []), ("%s", [None]), ("%(a)s", [1])]
+    return check("renders like the %-operator", all(CompiledTemplate(c).render(a) == reference(c, a) for c, a in cases))
+
+
+def decode(decoder, tids):
+    data = [["INFO", t] for t in tids]
+    return decoder.decode_line_to_text({"ts": "1.0", "fid": "1", "dur": "0", "data": data, "vars": [7, "x"] * len(tids)})
+
+
+if __name__ == "__main__":
+    print("=== Template cache ===")
+    ok = check_rendering()
+
+    # Config written by another process after the app was first read
+    first = decode(LogDecoder(APP), [1])
+    path = storage._get_config_path(APP)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(CONFIG, f)
+    a, b = LogDecoder(APP), LogDecoder(APP)
+    ok &= check("config loaded from disk replaces the cached one", first == ["1.0 [INFO] [Func<1>] Unresolved<1>"] and decode(a, [1]) == ["1.0 [INFO] [shop.py:checkout] took 7 ms for {order} x"])
+    ok &= check("decoders share the compiled config", a.compiled is b.compiled)
+
+    revision = storage.get_config_revision(APP)
+    storage.update_control(APP, "1", "1", False)
+    c = LogDecoder(APP)
+    ok &= check("config save bumps the revision", storage.get_config_revision(APP) > revision and c.compiled is not a.compiled)
+
+    lines = decode(c, [1, "1", 1.0, [1], None, {"a": 1}])
+    ok &= check("odd template ids decode as unresolved", len(lines) == 6 and lines[0] == lines[1] and all("Unresolved<" in l for l in lines[2:]))
+    ok &= check("offline decode without a revision", decode(LogDecoder(APP, custom_config=CONFIG), [1]) == decode(a, [1]))
+    sys.exit(0 if ok else 1)
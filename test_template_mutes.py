@@ -0,0 +1,97 @@
+"""
+Checks for template-level balancer mutes (LogFun/manager/balancer.py,
+LogFun/manager/storage.py).
+
+On a simulated clock, one spammy template of a six-template function is
+muted while the function and its other templates stay on. The mute must
+hold while the agents keep reporting blocked volume near its rate, be
+lifted once that volume decays (not before `mute_hold`), and come back
+with a doubled hold if the template spams again right away. Manual mutes
+must never be lifted, and a restarted balancer must adopt the stored
+mute. Exits non-zero on any failure. Needs no running Manager.
+
+Usage:
+    python test_template_mutes.py
+"""
+import sys
+import tempfile
+from LogFun.manager.balancer import LogBalancer
+from LogFun.manager.storage import get_storage
+
+APP = "template_mutes_app"
+SPAM = (1, 1)
+HOLD = 60.0
+
+storage = get_storage()
+storage.root_dir = tempfile.mkdtemp(prefix="logfun_template_mutes_")
+now = [1_700_000_000.0]
+
+
+def check(name, ok):
+    print(f"  {'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+def config():
+    funcs = {"1": {"name": "shop.py:checkout", "enabled": True, "templates": {str(t): {"content": f"step {t} %s", "enabled": True} for t in range(1, 7)}}}
+    for f in range(2, 22):
+        funcs[str(f)] = {"name": f"f{f}", "enabled": True, "templates": {"1": {"content": "x %s", "enabled": True}}}
+    return {"app_name": APP, "functions": funcs}
+
+
+def spam(balancer, spam_records):
+    items = [((f, 1), None, 0) for f in range(2, 22) for _ in range(10)] + [((1, t), None, 0) for t in range(2, 7) for _ in range(10)]
+    balancer.strategy.record_many(APP, now[0], items + [(SPAM, None, 0)] * spam_records)
+
+
+def templates():
+    return storage.get_app_config(APP)["functions"]["1"]
+
+
+def advance(balancer, seconds, blocked_per_sec):
+    """Let `seconds` pass with the agents reporting the spam template's blocked records every second."""
+    for _ in range(int(seconds)):
+        now[0] += 1
+        if blocked_per_sec: balancer.observe_blocked(APP, {"1:1": blocked_per_sec})
+
+
+if __name__ == "__main__":
+    print("=== Template mutes ===")
+    storage.sync_config(APP, config())
+    balancer = LogBalancer(clock=lambda: now[0])
+    balancer.config.algo_config.update({"mute_hold": HOLD, "mute_hold_max": 3600.0, "unmute_ratio": 0.5})
+    balancer.update_strategy("zscore", {"window_size": 60, "threshold": 2.0})
+
+    spam(balancer, 1000)
+    ok = check("spam template muted", balancer.run_analysis_cycle(APP) == [SPAM])
+    func = templates()
+    ok &= check("function and its other templates stay on", func["enabled"] and not func["templates"]["1"]["enabled"] and func["templates"]["1"]["muted_by"] == "balancer" and all(func["templates"][str(t)]["enabled"] for t in range(2, 7)))
+
+    advance(balancer, HOLD / 2, 0)
+    balancer.run_analysis_cycle(APP)
+    ok &= check("not lifted within the hold", not templates()["templates"]["1"]["enabled"])
+    advance(balancer, HOLD, 900)
+    balancer.run_analysis_cycle(APP)
+    ok &= check("held while blocked volume stays near its rate", not templates()["templates"]["1"]["enabled"])
+    advance(balancer, HOLD + 10, 0)
+    balancer.run_analysis_cycle(APP)
+    ok &= check("lifted once blocked volume decays", templates()["templates"]["1"]["enabled"] and "muted_by" not in templates()["templates"]["1"])
+
+    now[0] += 1
+    spam(balancer, 1000)
+    balancer.run_analysis_cycle(APP)
+    mute = balancer.mutes[APP].get(SPAM)
+    ok &= check("muted again right away: hold doubled", mute is not None and mute.hold == 2 * HOLD)
+
+    storage.update_control(APP, "1", "3", False)
+    advance(balancer, 10 * HOLD, 0)
+    balancer.run_analysis_cycle(APP)
+    ok &= check("manual mute never lifted", not templates()["templates"]["3"]["enabled"] and templates()["templates"]["3"]["muted_by"] == "manual")
+
+    now[0] += 1
+    spam(balancer, 1000)
+    balancer.run_analysis_cycle(APP)
+    restarted = LogBalancer(clock=lambda: now[0])
+    restarted._adopt(APP)
+    ok &= check("restarted balancer adopts the stored mute", list(restarted.mutes[APP]) == [SPAM] and restarted.mutes[APP][SPAM].rate == 1000)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,102 @@
+"""
+Checks for the sharded ingest counters (LogFun/manager/stats.py).
+
+Several connection threads tick frames for a few apps; once their shards
+are folded, the global, per-app and per-function totals and bytes must add
+up, and rates must cover the last complete seconds. Past max_apps and
+top_functions, new apps and functions must be counted under "_other",
+except that a function idle for the whole window gives its ring to a new
+one. Exits non-zero on any failure. Needs no running Manager.
+
+Usage:
+    python test_traffic_counters.py
+"""
+import sys
+import time
+import threading
+from LogFun.manager.stats import get_monitor, _TrafficShard, RATE_WINDOW, TRAFFIC_SECONDS
+from LogFun.manager.metrics import OTHER
+from LogFun.manager.parser import parse_frame
+
+THREADS = 4
+FRAMES = 200
+
+
+def check(name, ok):
+    print(f"  {'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+def frame(fids):
+    return parse_frame([f'{time.time():.4f} 00000000 {fid} 0.0 [["INFO", 1]] [{i}]' for i, fid in enumerate(fids)])
+
+
+def fold_at(monitor, sec, apps):
+    """Fold counts for {app: {fid: records}} as of second `sec`, as a connection thread would."""
+    shard = _TrafficShard()
+    shard.sec = sec
+    shard.frames = 1
+    for app_name, funcs in apps.items():
+        shard.count += sum(funcs.values())
+        shard.apps[app_name] = [sum(funcs.values()), 0, {fid: [n, 0] for fid, n in funcs.items()}]
+    with shard.lock:
+        monitor._fold(shard)
+
+
+def check_totals(monitor):
+    before = monitor.traffic.total_records
+    frames_before = monitor.frames.total_records
+    records = frame(["1", "1", "2"])
+    size = sum(len(r.line) for r in records)
+
+    def connection(t):
+        for _ in range(FRAMES):
+            monitor.tick(len(records), f"counter_app_{t % 2}", records)
+
+    threads = [threading.Thread(target=connection, args=(t, )) for t in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    traffic = monitor.get_traffic_snapshot()
+    per_app = THREADS // 2 * FRAMES
+    ok = check("global total", monitor.traffic.total_records - before == THREADS * FRAMES * len(records))
+    ok &= check("one frame per tick", monitor.frames.total_records - frames_before == THREADS * FRAMES)
+    ok &= check("per-app records and bytes", all(traffic[f"counter_app_{a}"]["total"] == per_app * 3 and traffic[f"counter_app_{a}"]["bytes"] == per_app * size for a in range(2)))
+    funcs = traffic["counter_app_0"]["functions"]
+    ok &= check("per-function totals", funcs["1"]["total"] == per_app * 2 and funcs["2"]["total"] == per_app)
+
+    now = int(time.time())
+    fold_at(monitor, now - 2, {"counter_rate": {"1": 50}})
+    fold_at(monitor, now - RATE_WINDOW - 5, {"counter_rate": {"1": 1000}})
+    ok &= check("rate over the last complete seconds", monitor.get_traffic_snapshot("counter_rate")["counter_rate"]["qps"] == 50 / RATE_WINDOW)
+    return ok
+
+
+def check_caps(monitor):
+    monitor.top_functions = 3
+    now = int(time.time())
+    fold_at(monitor, now, {"capped_app": {"1": 1, "2": 1, "3": 1}})
+    fold_at(monitor, now, {"capped_app": {"4": 5}})
+    rings = monitor.func_traffic["capped_app"]
+    ok = check("functions past top_functions counted as _other", sorted(rings) == ["1", "2", "3", OTHER] and rings[OTHER].total_records == 5)
+
+    # Function 1 goes quiet for a whole window; a new function takes its ring
+    fold_at(monitor, now - TRAFFIC_SECONDS - 1, {"idle_app": {"1": 1, "2": 1, "3": 1}})
+    fold_at(monitor, now, {"idle_app": {"2": 1, "3": 1}})
+    fold_at(monitor, now, {"idle_app": {"5": 4}})
+    rings = monitor.func_traffic["idle_app"]
+    ok &= check("idle function's ring reused", sorted(rings) == ["2", "3", "5"] and rings["5"].total_records == 4)
+
+    monitor.max_apps = len(monitor.app_traffic)
+    fold_at(monitor, now, {"late_app": {"1": 7}})
+    ok &= check("apps past max_apps counted as _other", "late_app" not in monitor.app_traffic and monitor.app_traffic[OTHER].total_records == 7)
+    return ok
+
+
+if __name__ == "__main__":
+    print("=== Traffic counters ===")
+    monitor = get_monitor()
+    ok = check_totals(monitor)
+    ok &= check_caps(monitor)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,88 @@
+"""
+Checks for variable-value search and its indexes (LogFun/manager/indexer.py).
+
+Tokenizer rules first (whole IDs, their words, numbers by value). Then the
+same two segments of records are stored for three apps, with
+storage.var_index_apps set to off, bloom and full: after the compactor has
+indexed the sealed segments, a Bloom filter must rule out the segment
+without an order id, the full index must narrow it down to its block, and
+variable searches must return the same records in every mode. Exits
+non-zero on any failure. Needs no running Manager.
+
+Usage:
+    python test_var_index.py
+"""
+import sys
+import time
+import tempfile
+from LogFun.manager.storage import get_storage
+from LogFun.manager.segments import AppSegments
+from LogFun.manager.decoder import LogDecoder
+from LogFun.manager.indexer import tokenize, query_tokens
+
+MODES = ("off", "bloom", "full")
+APPS = {m: f"var_index_{m}" for m in MODES}
+SEGMENTS = 2
+RECORDS = 800
+
+storage = get_storage()
+storage.root_dir = tempfile.mkdtemp(prefix="logfun_var_index_")
+storage.segment_opts.block_bytes = 4096
+storage.var_index_apps = {app_name: mode for mode, app_name in APPS.items()}
+
+
+def check(name, ok):
+    print(f"  {'OK  ' if ok else 'FAIL'} {name}")
+    return ok
+
+
+def batch(part):
+    t0 = time.time() - 3600 + part * 60
+    return [f'{t0 + i / 100:.4f} 00000000 1 0.0 [["INFO", 1]] ["ord-{n:05d}", {n}, "user {n % 7}"]' for i, n in enumerate(range(part * RECORDS, (part + 1) * RECORDS))]
+
+
+def segments_of(app_name):
+    return AppSegments(storage._get_app_dir(app_name), app_name, storage.segment_opts_for(app_name))
+
+
+def check_tokens():
+    ok = check("IDs kept whole and split into words", {"ord-00042", "ord", "00042", "42"} <= tokenize("shipped ord-00042"))
+    ok &= check("numbers matched by value", query_tokens("42.0") == {"42"} and "42" in tokenize("42"))
+    ok &= check("keyword tokens", query_tokens("User 3") == {"user", "3"})
+    return ok
+
+
+def store():
+    """Two sealed segments per app, indexed by the compactor's pass."""
+    for app_name in APPS.values():
+        storage.sync_config(app_name, {"app_name": app_name, "functions": {"1": {"name": "shop.py:order", "enabled": True, "templates": {"1": {"content": "order %s amount %s by %s", "enabled": True}}}}})
+    for part in range(SEGMENTS):
+        lines = batch(part)
+        for app_name in APPS.values():
+            for i in range(0, RECORDS, 40):
+                storage.write_batch(app_name, lines[i:i + 40], "compress")
+        storage.writers.close_all()
+    for app_name in APPS.values():
+        segments_of(app_name).maintain()
+
+
+if __name__ == "__main__":
+    print("=== Variable index ===")
+    ok = check_tokens()
+    store()
+
+    segs = {m: segments_of(APPS[m]).segments for m in MODES}
+    ok &= check("sealed segments indexed per app mode", all(s["var_index"] == m for m in ("bloom", "full") for s in segs[m]) and not any(s.get("var_index") for s in segs["off"]))
+    # ord-00123 is in the first segment only
+    tokens = query_tokens("ord-00123")
+    bloom, full = segments_of(APPS["bloom"]), segments_of(APPS["full"])
+    ok &= check("bloom: segment without the id skipped", bloom.candidate_blocks(segs["bloom"][1], tokens=tokens) == set())
+    ok &= check("bloom: segment with the id read", bloom.candidate_blocks(segs["bloom"][0], tokens=tokens) is None)
+    hit = full.candidate_blocks(segs["full"][0], tokens=tokens)
+    ok &= check(f"full: one of {len(segs['full'][0]['blocks'])} blocks", hit is not None and len(hit) == 1 and len(segs["full"][0]["blocks"]) > 1)
+    ok &= check("full: segment without the id skipped", full.candidate_blocks(segs["full"][1], tokens=tokens) == set())
+
+    for keyword, expected in (("ord-00123", 1), ("ord-01499", 1), ("user 3", SEGMENTS * RECORDS // 7)):
+        found = {m: LogDecoder(APPS[m]).search_logs("variable", keyword, limit=10**6) for m in MODES}
+        ok &= check(f"'{keyword}': {len(found['off'])} records, same in every mode", abs(len(found["off"]) - expected) <= 1 and found["off"] == found["bloom"] == found["full"])
+    sys.exit(0 if ok else 1)